@@ -0,0 +1,89 @@
+// Host build of the firmware motion engine (servo_actions.cpp) against the
+// stub headers in stubs/. Runs a list of steps on a virtual clock and prints
+// every servo write as "time_ms,angle" on stdout; firmware serial output,
+// including DONE replies, goes to stderr.
+//
+// Usage: ./motion_sim [-a START_ANGLE] [-s SEED] STEP...
+//   STEP is an opcode plus optional value, as in a sequence frame:
+//   G45 (goto), P3 (spin), W2 (sweep), N2 (nod), K1 (shake)
+// Example: ./motion_sim -a 45 N2 W1 G120
+
+#include "servo_actions.h"
+#include "serial_protocol.h"
+
+// --- Globals normally defined in servo_lcd_display.ino ---
+Servo myservo;
+LiquidCrystal lcd(rs, en, d4, d5, d6, d7);
+MFRC522 mfrc522(rfidSdaPin, rfidRstPin);
+DisplayState currentDisplayState = IDLE;
+int currentAngle = INITIAL_ANGLE;
+unsigned long actionDisplayStartTime = 0;
+
+SimSerial Serial;
+unsigned long simMillis = 0;
+
+// --- Stub implementations of the Arduino core pieces the engine uses ---
+static unsigned long randomState = 1;
+
+void randomSeed(unsigned long seed) { randomState = seed ? seed : 1; }
+
+long random(long low, long high) {
+  // Small LCG so shakes are reproducible for a given seed
+  randomState = randomState * 1103515245UL + 12345UL;
+  return low + (long)((randomState >> 16) % (unsigned long)(high - low));
+}
+
+String::String(int v, int base) {
+  char buffer[12];
+  snprintf(buffer, sizeof(buffer), base == HEX ? "%x" : "%d", v);
+  value = buffer;
+}
+
+String String::substring(unsigned int from, unsigned int to) const {
+  return String(value.substr(from, to - from));
+}
+
+void String::toUpperCase() {
+  for (char& c : value) c = toupper(c);
+}
+
+void String::trim() {}
+
+void displayActionStatus(String line1, String line2) {
+  fprintf(stderr, "[LCD] %s | %s\n", line1.c_str(), line2.c_str());
+  currentDisplayState = EXECUTING_ACTION;
+}
+
+int main(int argc, char** argv) {
+  int startAngle = INITIAL_ANGLE;
+  unsigned long seed = 1;
+  int first = 1;
+  while (first + 1 < argc && argv[first][0] == '-') {
+    if (strcmp(argv[first], "-a") == 0) startAngle = atoi(argv[first + 1]);
+    else if (strcmp(argv[first], "-s") == 0) seed = strtoul(argv[first + 1], NULL, 10);
+    first += 2;
+  }
+
+  currentAngle = startAngle;
+  myservo.write(startAngle);
+  randomSeed(seed);
+
+  byte seq = 1;
+  for (int i = first; i < argc; i++) {
+    int value = argv[i][1] ? atoi(argv[i] + 1) : -1;
+    if (!enqueueStep(argv[i][0], value, seq++, true)) {
+      fprintf(stderr, "Too many steps (max %d)\n", MAX_QUEUED_STEPS);
+      return 1;
+    }
+  }
+
+  // One loop() pass per virtual millisecond
+  const unsigned long limit = 10UL * 60UL * 1000UL;
+  while (motionBusy() && simMillis < limit) {
+    motionTick(simMillis);
+    simMillis++;
+  }
+  // The last tick ran at simMillis - 1; with no steps there was none
+  fprintf(stderr, "Finished at %lu ms, angle %d\n", simMillis ? simMillis - 1 : 0, currentAngle);
+  return 0;
+}
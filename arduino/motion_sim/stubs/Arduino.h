@@ -0,0 +1,69 @@
+// Minimal host stand-in for the Arduino core, used by motion_sim only.
+// millis() and delay() run on a virtual clock so motions simulate instantly.
+#ifndef SIM_ARDUINO_H
+#define SIM_ARDUINO_H
+
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <strings.h>
+#include <string>
+
+typedef uint8_t byte;
+
+#define F(x) (x)
+#define HIGH 1
+#define LOW 0
+#define OUTPUT 1
+#define HEX 16
+const int A0 = 14;
+
+class String {
+ public:
+  String() {}
+  String(const char* s) : value(s) {}
+  String(const std::string& s) : value(s) {}
+  String(int v) : value(std::to_string(v)) {}
+  String(int v, int base);
+  const char* c_str() const { return value.c_str(); }
+  unsigned int length() const { return value.size(); }
+  String substring(unsigned int from, unsigned int to) const;
+  void toUpperCase();
+  void trim();
+  String& operator+=(const String& other) { value += other.value; return *this; }
+  friend String operator+(const String& a, const String& b) { return String(a.value + b.value); }
+  friend String operator+(const char* a, const String& b) { return String(a + b.value); }
+  friend String operator+(const String& a, const char* b) { return String(a.value + b); }
+
+ private:
+  std::string value;
+};
+
+// Serial output goes to stderr so stdout stays a clean trajectory
+class SimSerial {
+ public:
+  void begin(long) {}
+  int available() { return 0; }
+  int read() { return -1; }
+  void print(const char* s) { fputs(s, stderr); }
+  void print(const String& s) { fputs(s.c_str(), stderr); }
+  void print(int v) { fprintf(stderr, "%d", v); }
+  void println() { fputc('\n', stderr); }
+  template <typename T> void println(T v) { print(v); println(); }
+};
+extern SimSerial Serial;
+
+extern unsigned long simMillis;
+inline unsigned long millis() { return simMillis; }
+inline void delay(unsigned long ms) { simMillis += ms; }
+
+void randomSeed(unsigned long seed);
+long random(long low, long high);
+inline int analogRead(int) { return 0; }
+inline void pinMode(int, int) {}
+inline void digitalWrite(int, int) {}
+
+template <typename T> T constrain(T v, T low, T high) { return v < low ? low : (v > high ? high : v); }
+
+#endif
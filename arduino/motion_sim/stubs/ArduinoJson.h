@@ -0,0 +1,4 @@
+#ifndef SIM_ARDUINOJSON_H
+#define SIM_ARDUINOJSON_H
+// The motion engine does not use ArduinoJson; config.h only includes it.
+#endif
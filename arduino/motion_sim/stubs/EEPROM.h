@@ -0,0 +1,16 @@
+#ifndef SIM_EEPROM_H
+#define SIM_EEPROM_H
+
+#include "Arduino.h"
+
+class EEPROMClass {
+ public:
+  uint8_t read(int address) { return cells[address]; }
+  void update(int address, uint8_t value) { cells[address] = value; }
+ private:
+  uint8_t cells[1024] = {};
+};
+
+static EEPROMClass EEPROM;
+
+#endif
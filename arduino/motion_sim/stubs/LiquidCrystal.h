@@ -0,0 +1,15 @@
+#ifndef SIM_LIQUIDCRYSTAL_H
+#define SIM_LIQUIDCRYSTAL_H
+
+#include "Arduino.h"
+
+class LiquidCrystal {
+ public:
+  LiquidCrystal(int, int, int, int, int, int) {}
+  void begin(int, int) {}
+  void clear() {}
+  void setCursor(int, int) {}
+  template <typename T> void print(T) {}
+};
+
+#endif
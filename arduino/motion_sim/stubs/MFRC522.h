@@ -0,0 +1,17 @@
+#ifndef SIM_MFRC522_H
+#define SIM_MFRC522_H
+
+#include "Arduino.h"
+
+class MFRC522 {
+ public:
+  struct Uid { byte size; byte uidByte[10]; } uid;
+  MFRC522(int, int) {}
+  void PCD_Init() {}
+  bool PICC_IsNewCardPresent() { return false; }
+  bool PICC_ReadCardSerial() { return false; }
+  void PICC_HaltA() {}
+  void PCD_StopCrypto1() {}
+};
+
+#endif
@@ -0,0 +1,3 @@
+#ifndef SIM_SPI_H
+#define SIM_SPI_H
+#endif
@@ -0,0 +1,20 @@
+// Host stand-in for Servo: records every write with the virtual time.
+#ifndef SIM_SERVO_H
+#define SIM_SERVO_H
+
+#include "Arduino.h"
+
+class Servo {
+ public:
+  void attach(int) {}
+  void write(int angle) {
+    position = angle;
+    printf("%lu,%d\n", millis(), angle);
+  }
+  int read() { return position; }
+
+ private:
+  int position = 90;
+};
+
+#endif
@@ -0,0 +1,37 @@
+// command_table.h
+// Generated by `python -m src.commands` from the registry in src/commands.py.
+// Do not edit by hand; change the registry and regenerate.
+#ifndef COMMAND_TABLE_H
+#define COMMAND_TABLE_H
+
+// Motion opcodes
+const char OP_GOTO = 'G';
+const char OP_SPIN = 'P';
+const char OP_SWEEP = 'W';
+const char OP_NOD = 'N';
+const char OP_SHAKE = 'K';
+const char OP_SEQUENCE = 'Q';
+const char MOTION_OPS[] = "GPWNK"; // Opcodes that take one optional value
+
+// Applied when a count is left out
+const int DEFAULT_SPIN_TIMES = 1;
+const int DEFAULT_SWEEP_REPETITIONS = 2;
+const int DEFAULT_NOD_TIMES = 2;
+const int DEFAULT_SHAKE_TIMES = 2;
+
+// JSON command names, only used for manual testing from the Serial Monitor
+struct JsonCommand {
+  const char* name;
+  char op;
+  const char* param;
+};
+const JsonCommand jsonCommands[] = {
+  {"GOTO", OP_GOTO, "angle"},
+  {"SPIN", OP_SPIN, "times"},
+  {"SWEEP", OP_SWEEP, "repetitions"},
+  {"NOD", OP_NOD, "times"},
+  {"SHAKE", OP_SHAKE, "times"},
+};
+const int numJsonCommands = sizeof(jsonCommands) / sizeof(JsonCommand);
+
+#endif // COMMAND_TABLE_H
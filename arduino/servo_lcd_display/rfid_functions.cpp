@@ -1,15 +1,83 @@
 #include "rfid_functions.h"
 #include "servo_actions.h"
+#include "serial_protocol.h"
+#include <EEPROM.h>
+
+static bool allowlistReady = false;
+
+//==============================================================================
+// ALLOWLIST - Bloom filter of authorized UIDs pushed by the host
+//==============================================================================
+
+static int hexValue(char c) {
+  if (c >= '0' && c <= '9') return c - '0';
+  if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+  if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+  return -1;
+}
+
+bool loadAllowlist(const char* payload) {
+  const char* hex = strchr(payload, ',');
+  if (hex == NULL) {
+    return false;
+  }
+  hex++;
+  int offset = atoi(payload);
+  int length = strlen(hex) / 2;
+  if (offset < 0 || strlen(hex) % 2 != 0 || offset + length > ALLOWLIST_BYTES) {
+    return false;
+  }
+  for (const char* c = hex; *c; c++) {
+    if (hexValue(*c) < 0) {
+      return false;
+    }
+  }
+
+  if (offset == 0) {
+    allowlistReady = false; // A new list replaces the old one
+  }
+  for (int i = 0; i < length; i++) {
+    // update() skips unchanged bytes, so re-pushing the same list costs no EEPROM wear
+    EEPROM.update(ALLOWLIST_EEPROM_ADDRESS + offset + i, hexValue(hex[2 * i]) * 16 + hexValue(hex[2 * i + 1]));
+  }
+  if (offset + length == ALLOWLIST_BYTES) {
+    allowlistReady = true;
+  }
+  return true;
+}
+
+/**
+ * FNV-1a over the UID bytes, split into two 16-bit halves for double hashing.
+ */
+static bool allowlistContains(const byte* uid, byte size) {
+  uint32_t hash = 2166136261UL;
+  for (byte i = 0; i < size; i++) {
+    hash = (hash ^ uid[i]) * 16777619UL;
+  }
+  uint16_t first = hash & 0xFFFF;
+  uint16_t step = (hash >> 16) | 1;
+  for (byte i = 0; i < ALLOWLIST_HASHES; i++) {
+    uint16_t bit = (uint16_t)(first + (uint16_t)(i * step)) % (ALLOWLIST_BYTES * 8);
+    if (!(EEPROM.read(ALLOWLIST_EEPROM_ADDRESS + bit / 8) & (1 << (bit % 8)))) {
+      return false;
+    }
+  }
+  return true;
+}
+
+//==============================================================================
+// CARD SCANNING
+//==============================================================================
 
 /**
  * Handles RFID scanning specifically for the authentication phase.
  */
-void handleAuthenticationScan() {
+char handleAuthenticationScan() {
+  char decision = '\0';
   // Look for new cards
   if (mfrc522.PICC_IsNewCardPresent() && mfrc522.PICC_ReadCardSerial()) {
     
-    // A card has been detected!
-    Serial.print("Card detected for auth! UID:"); // Note the prefix matches Python's expectation
+    // A card has been detected! The prefixes match Python's expectation.
     String uidString = "";
     for (byte i = 0; i < mfrc522.uid.size; i++) {
       if(mfrc522.uid.uidByte[i] < 0x10) {
@@ -18,12 +86,22 @@ void handleAuthenticationScan() {
       uidString += String(mfrc522.uid.uidByte[i], HEX);
     }
     uidString.toUpperCase();
+
+    if (allowlistReady) {
+      // Decide now; Python confirms the decision when it reads the report
+      bool granted = allowlistContains(mfrc522.uid.uidByte, mfrc522.uid.size);
+      Serial.print(granted ? F("Auth granted! UID:") : F("Auth denied! UID:"));
+      decision = granted ? OP_AUTH_SUCCESS : OP_AUTH_FAIL;
+    } else {
+      Serial.print(F("Card detected for auth! UID:"));
+    }
     Serial.println(uidString); // Send the UID to the Python script
 
     // Halt PICC to prevent reading the same card repeatedly right away
     mfrc522.PICC_HaltA();
     mfrc522.PCD_StopCrypto1();
   }
+  return decision;
 }
 
 /**
@@ -58,8 +136,8 @@ void handleRfid() {
       lcd.setCursor(0,1);
       lcd.print("UID: " + uidString);
 
-      // Give physical feedback by nodding
-      executeNod(1);
+      // Give physical feedback by nodding (queued behind any current motion)
+      runMotion(OP_NOD, 1);
 
       // Halt PICC and stop encryption to prevent reading the same card repeatedly
       mfrc522.PICC_HaltA();
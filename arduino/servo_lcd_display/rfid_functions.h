@@ -3,11 +3,34 @@
 
 #include "config.h" 
 
+// --- On-device Allowlist ---
+// The host pushes a Bloom filter of the authorized card UIDs (OP_ALLOWLIST
+// frames) before authentication. It is kept in EEPROM, not SRAM, and used
+// from the first complete push after a reset until a new push starts. A
+// card is in it when all ALLOWLIST_HASHES bits of its UID are set; the
+// filter never misses an authorized card, and the host overrides the rare
+// false match. It takes the whole 1 KB EEPROM and is sized for up to 800
+// cards; the host sends no filter for more. Must match src/credentials.py.
+const int ALLOWLIST_BYTES = 1024;
+const byte ALLOWLIST_HASHES = 7;
+const int ALLOWLIST_EEPROM_ADDRESS = 0;
+
 /**
  * @brief Handles scanning for a card during the initial authentication phase.
- * If a card is found, its UID is printed to the Serial port for Python to read.
+ * The UID is printed to the Serial port for Python to read. With an
+ * allowlist loaded the board decides itself and reports the decision.
+ * @return OP_AUTH_SUCCESS or OP_AUTH_FAIL for a decision to apply, or '\0'
+ * if no card was scanned or the decision is left to the host.
+ */
+char handleAuthenticationScan();
+
+/**
+ * @brief Writes one OP_ALLOWLIST frame, "<offset>,<hex bytes>", to EEPROM.
+ * Offset 0 starts a new list; it is used once its last byte is written,
+ * so an empty frame at offset 0 withdraws the list.
+ * @return false if the payload is malformed or out of range.
  */
-void handleAuthenticationScan();
+bool loadAllowlist(const char* payload);
 
 /**
  * @brief Checks for a new RFID card during normal operation.
@@ -15,4 +38,4 @@ void handleAuthenticationScan();
  */
 void handleRfid();
 
-#endif // RFID_FUNCTIONS_H
\ No newline at end of file
+#endif // RFID_FUNCTIONS_H
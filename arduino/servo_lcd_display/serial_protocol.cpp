@@ -0,0 +1,82 @@
+#include "serial_protocol.h" // Include the header for this implementation
+#include <string.h>
+#include <stdlib.h>
+
+//==============================================================================
+// SERIAL PROTOCOL FUNCTIONS - Line reading and frame encoding/decoding
+//==============================================================================
+
+static byte lineLength = 0;
+
+bool readSerialLine(char* buffer, byte size) {
+  while (Serial.available() > 0) {
+    char c = Serial.read();
+    if (c == '\r') {
+      continue;
+    }
+    if (c == '\n') {
+      buffer[lineLength] = '\0';
+      lineLength = 0;
+      return true;
+    }
+    // Overlong lines are truncated; the checksum will reject them as frames
+    if (lineLength < size - 1) {
+      buffer[lineLength++] = c;
+    }
+  }
+  return false;
+}
+
+bool parseFrame(char* line, byte* seq, char* op, char** payload) {
+  char* star = strrchr(line, '*');
+  if (line[0] != FRAME_START || star == NULL || star - line < 4) {
+    return false;
+  }
+
+  byte checksum = 0;
+  for (char* p = line + 1; p < star; p++) {
+    checksum ^= *p;
+  }
+  if (checksum != (byte)strtol(star + 1, NULL, 16)) {
+    return false;
+  }
+  *star = '\0';
+
+  char seqHex[3] = { line[1], line[2], '\0' };
+  *seq = (byte)strtol(seqHex, NULL, 16);
+  *op = line[3];
+  *payload = line + 4;
+  return true;
+}
+
+byte parseIntArgs(const char* payload, int* args, byte maxArgs) {
+  byte count = 0;
+  const char* cursor = payload;
+  while (*cursor && count < maxArgs) {
+    args[count++] = atoi(cursor);
+    cursor = strchr(cursor, ',');
+    if (cursor == NULL) {
+      break;
+    }
+    cursor++;
+  }
+  return count;
+}
+
+void sendReply(byte seq, char kind, int value) {
+  char body[16];
+  if (value >= 0) {
+    snprintf(body, sizeof(body), "%02X%c%d", seq, kind, value);
+  } else {
+    snprintf(body, sizeof(body), "%02X%c", seq, kind);
+  }
+
+  byte checksum = 0;
+  for (char* p = body; *p; p++) {
+    checksum ^= *p;
+  }
+
+  char reply[22];
+  snprintf(reply, sizeof(reply), "%c%s*%02X", REPLY_START, body, checksum);
+  Serial.println(reply);
+}
@@ -0,0 +1,64 @@
+#ifndef SERIAL_PROTOCOL_H
+#define SERIAL_PROTOCOL_H
+
+#include "config.h" // Include our main configuration
+
+// --- Framed Serial Protocol ---
+// Host -> Arduino:  !<seq><op>[arg,arg...]*<checksum>
+// Arduino -> Host:  @<seq><kind>[value]*<checksum>
+// seq and checksum are two hex digits. The checksum is the XOR of every
+// character between the start marker and '*'. Must match src/arduino.py.
+const char FRAME_START = '!';
+const char REPLY_START = '@';
+const char REPLY_ACK = 'A';
+const char REPLY_DONE = 'D';
+const char REPLY_NAK = 'N';
+
+// Control opcodes
+const char OP_THINKING = 'T';
+const char OP_IDLE = 'I';
+const char OP_RESET = 'R';
+const char OP_SHUTDOWN = 'X';
+const char OP_AWAIT_AUTH = 'U';
+const char OP_AUTH_SUCCESS = 'S';
+const char OP_AUTH_FAIL = 'F';
+const char OP_STOP = 'Z'; // Preempts the current motion and drops the queue
+const char OP_STREAM = 'J'; // A chunk of trajectory setpoints, see servo_actions.h
+const char OP_ALLOWLIST = 'L'; // Part of the authorized-card filter, see rfid_functions.h
+const char OP_SYNC = 'Y'; // First frame of a connection; resets duplicate detection
+
+// Motion opcodes (OP_GOTO ... OP_SEQUENCE) and defaults are generated from
+// the host's command registry. A SEQUENCE's args are "<op><value>" steps,
+// e.g. N2,W,G45.
+#include "command_table.h"
+
+const byte SERIAL_LINE_MAX = 96;
+const byte MAX_FRAME_ARGS = 4;
+
+// --- Function Prototypes (Declarations) ---
+
+/**
+ * @brief Collects incoming bytes into buffer without blocking.
+ * @return true once a complete line (without the newline) is in buffer.
+ */
+bool readSerialLine(char* buffer, byte size);
+
+/**
+ * @brief Parses and checksum-verifies a host frame in place.
+ * On success payload points at the (null-terminated) text after the opcode.
+ * @return false if the line is not a valid frame.
+ */
+bool parseFrame(char* line, byte* seq, char* op, char** payload);
+
+/**
+ * @brief Splits a comma-separated payload into integers.
+ * @return The number of values stored in args.
+ */
+byte parseIntArgs(const char* payload, int* args, byte maxArgs);
+
+/**
+ * @brief Sends a reply frame. A negative value is left out.
+ */
+void sendReply(byte seq, char kind, int value);
+
+#endif // SERIAL_PROTOCOL_H
@@ -1,8 +1,13 @@
 #include "servo_actions.h" // Include the header for this implementation
 #include "display_functions.h" // We need this to call displayActionStatus
+#include "serial_protocol.h"   // Opcodes and DONE replies
+
+// Internal opcode for the shake used as feedback on a failed scan. It never
+// appears in a frame.
+const char OP_SHAKE_SILENT = 'k';
 
 //==============================================================================
-// COMMAND EXECUTION FUNCTIONS - Called by the JSON parser
+// COMMAND EXECUTION FUNCTIONS - Called by the frame and JSON parsers
 //==============================================================================
 
 void executeGoTo(int angle) {
@@ -13,83 +18,366 @@ void executeGoTo(int angle) {
   Serial.print("Motor moved to: "); Serial.println(currentAngle);
 }
 
-void executeSpin(int times) {
-  displayActionStatus("Action: Spin", "Times: " + String(times));
-  Serial.println("Executing spin sequence...");
-  int startAngle = myservo.read();
-  for (int i = 0; i < times; i++) {
-    myservo.write(MIN_ANGLE); delay(400);
-    myservo.write(MAX_ANGLE); delay(400);
-  }
-  myservo.write(startAngle);
-  currentAngle = startAngle;
-  Serial.println("Spin sequence complete.");
-}
-
-void executeSweep(int repetitions) {
-  displayActionStatus("Action: Sweep", "Reps: " + String(repetitions));
-  Serial.println("Executing sweep sequence...");
-  int startAngle = myservo.read();
-  for (int i = 0; i < repetitions; i++) {
-    for (int pos = MIN_ANGLE; pos <= MAX_ANGLE; pos += 2) { myservo.write(pos); delay(15); }
-    for (int pos = MAX_ANGLE; pos >= MIN_ANGLE; pos -= 2) { myservo.write(pos); delay(15); }
-  }
-  myservo.write(startAngle);
-  currentAngle = startAngle;
-  Serial.println("Sweep sequence complete.");
-}
-
-void executeNod(int times) {
-  displayActionStatus("Action: Nod", "Times: " + String(times));
-  Serial.println("Executing nod sequence...");
-  int center = 90;
-  int nod_range = 30;
-  myservo.write(center); delay(200);
-  for (int i = 0; i < times; i++) {
-    myservo.write(center - nod_range); delay(300);
-    myservo.write(center + nod_range); delay(300);
-  }
-  myservo.write(center);
-  currentAngle = center;
-  Serial.println("Nod sequence complete.");
-}
-
-void executeShake(int times) {
-  displayActionStatus("Action: Shake", "Times: " + String(times));
-  Serial.println("Executing chaotic shake sequence...");
-  int center = 90;
-  int shake_range = 45;
-  int shake_movements = times * 6;
-  randomSeed(analogRead(A0));
-  myservo.write(center); delay(200);
-  for (int i = 0; i < shake_movements; i++) {
-    int randomAngle = random(center - shake_range, center + shake_range + 1);
-    int randomDelay = random(70, 150);
-    myservo.write(randomAngle);
-    delay(randomDelay);
-  }
-  myservo.write(center);
-  currentAngle = center;
-  Serial.println("Shake sequence complete.");
-}
-
 /**
  * @brief Performs the shake motion without changing the LCD or system state.
  * This is a "silent" action used for feedback during other states.
+ * Any queued motion is dropped so the feedback starts immediately.
+ */
+void startShakeSilent(int times) {
+  abortMotion();
+  enqueueStep(OP_SHAKE_SILENT, times, 0, true);
+}
+
+/**
+ * Queues a motion command without a frame (legacy JSON input and RFID
+ * feedback). A negative value means "use the default".
+ */
+void runMotion(char op, int value) {
+  if (!enqueueStep(op, value, 0, true)) {
+    Serial.println(F("Motion queue full, command dropped."));
+  }
+}
+
+//==============================================================================
+// MOTION QUEUE - Steps waiting to be run
+//==============================================================================
+
+static QueuedStep stepQueue[MAX_QUEUED_STEPS];
+static byte queueHead = 0;
+static byte queueCount = 0;
+
+byte queueSpace() {
+  return MAX_QUEUED_STEPS - queueCount;
+}
+
+bool enqueueStep(char op, int value, byte seq, bool last) {
+  if (queueCount >= MAX_QUEUED_STEPS) {
+    return false;
+  }
+  QueuedStep& step = stepQueue[(queueHead + queueCount) % MAX_QUEUED_STEPS];
+  step.op = op;
+  step.value = value;
+  step.seq = seq;
+  step.last = last;
+  queueCount++;
+  return true;
+}
+
+static bool dequeueStep(QueuedStep* step) {
+  if (queueCount == 0) {
+    return false;
+  }
+  *step = stepQueue[queueHead];
+  queueHead = (queueHead + 1) % MAX_QUEUED_STEPS;
+  queueCount--;
+  return true;
+}
+
+/**
+ * Drops every queued step. Frames that lose their last step still get a
+ * DONE, so the host is never left waiting for one.
+ */
+void clearQueue() {
+  QueuedStep step;
+  while (dequeueStep(&step)) {
+    if (step.last && step.seq != 0) {
+      sendReply(step.seq, REPLY_DONE, currentAngle);
+    }
+  }
+  queueHead = 0;
+}
+
+//==============================================================================
+// MOTION ENGINE - Step generators advanced from loop()
+//==============================================================================
+
+struct ActiveMotion {
+  bool running;
+  char op;
+  int count;          // times / repetitions
+  int step;           // Next step to run
+  int totalSteps;     // Servo writes before the final return write
+  int startAngle;
+  unsigned long nextAt;
+  byte seq;
+  bool last;
+};
+
+static ActiveMotion active = { false };
+
+// Stream playback buffer (a ring of setpoints)
+static byte streamBuffer[STREAM_BUFFER_SIZE];
+static byte streamHead = 0;
+static byte streamCount = 0;
+static bool streamOpen = false; // Started and still expecting frames
+static unsigned int streamUnderruns = 0;
+
+bool motionBusy() {
+  return active.running || queueCount > 0;
+}
+
+static void beginMotion(const QueuedStep& next, unsigned long now) {
+  active.running = true;
+  active.op = next.op;
+  active.seq = next.seq;
+  active.last = next.last;
+  active.step = 0;
+  active.startAngle = myservo.read();
+  active.nextAt = now;
+
+  switch (next.op) {
+    case OP_SPIN:
+      active.count = next.value < 0 ? DEFAULT_SPIN_TIMES : next.value;
+      active.totalSteps = active.count * 2;
+      displayActionStatus("Action: Spin", "Times: " + String(active.count));
+      Serial.println("Executing spin sequence...");
+      break;
+    case OP_SWEEP:
+      active.count = next.value < 0 ? DEFAULT_SWEEP_REPETITIONS : next.value;
+      // One pass is MIN..MAX and back in SWEEP_STEP_DEG increments
+      active.totalSteps = active.count * 2 * ((MAX_ANGLE - MIN_ANGLE) / SWEEP_STEP_DEG + 1);
+      displayActionStatus("Action: Sweep", "Reps: " + String(active.count));
+      Serial.println("Executing sweep sequence...");
+      break;
+    case OP_NOD:
+      active.count = next.value < 0 ? DEFAULT_NOD_TIMES : next.value;
+      active.totalSteps = 1 + active.count * 2;
+      displayActionStatus("Action: Nod", "Times: " + String(active.count));
+      Serial.println("Executing nod sequence...");
+      break;
+    case OP_SHAKE:
+    case OP_SHAKE_SILENT:
+      active.count = next.value < 0 ? DEFAULT_SHAKE_TIMES : next.value;
+      active.totalSteps = 1 + active.count * SHAKE_MOVES_PER_TIME;
+      if (next.op == OP_SHAKE) {
+        displayActionStatus("Action: Shake", "Times: " + String(active.count));
+        Serial.println("Executing chaotic shake sequence...");
+      }
+      randomSeed(analogRead(A0));
+      break;
+    case OP_STREAM:
+      active.count = 0;
+      active.totalSteps = 0; // Runs until the stream is closed and played
+      displayActionStatus("Action: Stream", "Smooth motion");
+      Serial.println("Executing streamed motion...");
+      break;
+    default: // OP_GOTO has a single write and no steps
+      active.count = next.value;
+      active.totalSteps = 0;
+      break;
+  }
+}
+
+/**
+ * Runs the current step. Returns the delay until the next step in ms.
+ */
+static unsigned long advanceMotion() {
+  int index = active.step++;
+  switch (active.op) {
+    case OP_SPIN:
+      myservo.write(index % 2 == 0 ? MIN_ANGLE : MAX_ANGLE);
+      return SPIN_STEP_MS;
+
+    case OP_SWEEP: {
+      int positions = (MAX_ANGLE - MIN_ANGLE) / SWEEP_STEP_DEG + 1;
+      int offset = index % (positions * 2);
+      if (offset < positions) {
+        myservo.write(MIN_ANGLE + offset * SWEEP_STEP_DEG);
+      } else {
+        myservo.write(MAX_ANGLE - (offset - positions) * SWEEP_STEP_DEG);
+      }
+      return SWEEP_STEP_MS;
+    }
+
+    case OP_NOD:
+      if (index == 0) {
+        myservo.write(CENTER_ANGLE);
+        return NOD_SETTLE_MS;
+      }
+      myservo.write(index % 2 == 1 ? CENTER_ANGLE - NOD_RANGE : CENTER_ANGLE + NOD_RANGE);
+      return NOD_STEP_MS;
+
+    case OP_STREAM:
+      if (streamCount > 0) {
+        myservo.write(streamBuffer[streamHead]);
+        streamHead = (streamHead + 1) % STREAM_BUFFER_SIZE;
+        streamCount--;
+      } else {
+        streamUnderruns++; // Hold position until more setpoints arrive
+      }
+      return STREAM_PERIOD_MS;
+
+    default: // OP_SHAKE, OP_SHAKE_SILENT
+      if (index == 0) {
+        myservo.write(CENTER_ANGLE);
+        return SHAKE_SETTLE_MS;
+      }
+      myservo.write(random(CENTER_ANGLE - SHAKE_RANGE, CENTER_ANGLE + SHAKE_RANGE + 1));
+      return random(SHAKE_MIN_MS, SHAKE_MAX_MS);
+  }
+}
+
+static void finishMotion() {
+  active.running = false;
+
+  switch (active.op) {
+    case OP_GOTO:
+      executeGoTo(active.count);
+      break;
+    case OP_SPIN:
+      myservo.write(active.startAngle);
+      currentAngle = active.startAngle;
+      Serial.println("Spin sequence complete.");
+      break;
+    case OP_SWEEP:
+      myservo.write(active.startAngle);
+      currentAngle = active.startAngle;
+      Serial.println("Sweep sequence complete.");
+      break;
+    case OP_NOD:
+      myservo.write(CENTER_ANGLE);
+      currentAngle = CENTER_ANGLE;
+      Serial.println("Nod sequence complete.");
+      break;
+    case OP_SHAKE:
+      myservo.write(CENTER_ANGLE);
+      currentAngle = CENTER_ANGLE;
+      Serial.println("Shake sequence complete.");
+      break;
+    case OP_SHAKE_SILENT:
+      myservo.write(CENTER_ANGLE);
+      // Note: We do NOT update currentAngle here because the calling
+      // function might not want the center angle to be assumed.
+      break;
+    case OP_STREAM:
+      currentAngle = myservo.read();
+      Serial.print(F("Stream complete, underruns: ")); Serial.println(streamUnderruns);
+      break;
+  }
+
+  if (active.last && active.seq != 0) {
+    sendReply(active.seq, REPLY_DONE, currentAngle);
+  }
+}
+
+static bool motionDone() {
+  if (active.op == OP_STREAM) {
+    return !streamOpen && streamCount == 0;
+  }
+  return active.step >= active.totalSteps;
+}
+
+/**
+ * Advances the motion engine. Runs every step that is due, up to
+ * MAX_STEPS_PER_TICK, and starts the next queued motion when one finishes.
+ * Steps are scheduled from the previous step's due time rather than from
+ * now, so a slow loop() does not stretch the overall motion.
+ */
+void motionTick(unsigned long now) {
+  for (byte steps = 0; steps < MAX_STEPS_PER_TICK; steps++) {
+    if (!active.running) {
+      QueuedStep next;
+      if (!dequeueStep(&next)) {
+        return;
+      }
+      beginMotion(next, now);
+    }
+    if ((long)(now - active.nextAt) < 0) {
+      return;
+    }
+    if (motionDone()) {
+      finishMotion();
+    } else {
+      active.nextAt += advanceMotion();
+    }
+  }
+}
+
+/**
+ * Preempts the current motion where it is and drops everything queued.
+ */
+void abortMotion() {
+  if (active.running) {
+    active.running = false;
+    if (active.op != OP_SHAKE_SILENT) {
+      currentAngle = myservo.read();
+    }
+    if (active.last && active.seq != 0) {
+      sendReply(active.seq, REPLY_DONE, currentAngle);
+    }
+    Serial.println(F("Motion preempted."));
+  }
+  clearQueue();
+  // Later frames of an interrupted stream are rejected
+  streamOpen = false;
+  streamCount = 0;
+}
+
+//==============================================================================
+// SETPOINT STREAMING - Buffers OP_STREAM frames for the motion engine
+//==============================================================================
+
+static void pushSetpoint(int angle) {
+  streamBuffer[(streamHead + streamCount) % STREAM_BUFFER_SIZE] = angle;
+  streamCount++;
+}
+
+/**
+ * Buffers one stream frame's setpoints. The first frame starts the stream
+ * motion (only when nothing else is running or queued); later ones extend
+ * it. Returns false, buffering nothing, if a setpoint is out of range, the
+ * frame is out of turn or the buffer does not have room for all of it.
  */
-void executeShakeSilent(int times) {
-  int center = 90;
-  int shake_range = 45;
-  int shake_movements = times * 6;
-  randomSeed(analogRead(A0));
-  myservo.write(center); delay(200);
-  for (int i = 0; i < shake_movements; i++) {
-    int randomAngle = random(center - shake_range, center + shake_range + 1);
-    int randomDelay = random(70, 150);
-    myservo.write(randomAngle);
-    delay(randomDelay);
-  }
-  myservo.write(center);
-  // Note: We do NOT update currentAngle here because the calling
-  // function might not want the center angle to be assumed.
-}
\ No newline at end of file
+bool streamSetpoints(byte seq, int first, const char* deltas, byte flags) {
+  bool starting = flags & STREAM_FIRST;
+  if (starting ? motionBusy() : !streamOpen) {
+    return false;
+  }
+  size_t count = strlen(deltas) + 1;
+  if (count > (size_t)(STREAM_BUFFER_SIZE - (starting ? 0 : streamCount))) {
+    return false;
+  }
+
+  // Check every setpoint before buffering any of them
+  int angle = first;
+  for (size_t i = 0; ; i++) {
+    if (angle < MIN_ANGLE || angle > MAX_ANGLE) {
+      return false;
+    }
+    if (deltas[i] == '\0') {
+      break;
+    }
+    int delta = deltas[i] - STREAM_DELTA_ZERO;
+    if (delta < -STREAM_MAX_DELTA || delta > STREAM_MAX_DELTA) {
+      return false;
+    }
+    angle += delta;
+  }
+
+  if (starting) {
+    streamHead = 0;
+    streamCount = 0;
+    streamUnderruns = 0;
+    streamOpen = true;
+    enqueueStep(OP_STREAM, -1, 0, false);
+  }
+  angle = first;
+  pushSetpoint(angle);
+  for (const char* c = deltas; *c; c++) {
+    angle += *c - STREAM_DELTA_ZERO;
+    pushSetpoint(angle);
+  }
+
+  if (flags & STREAM_LAST) {
+    // The stream motion now ends with this frame, which gets its DONE
+    streamOpen = false;
+    if (active.running) {
+      active.seq = seq;
+      active.last = true;
+    } else { // Not started yet, so it is the only queued step
+      stepQueue[queueHead].seq = seq;
+      stepQueue[queueHead].last = true;
+    }
+  }
+  return true;
+}
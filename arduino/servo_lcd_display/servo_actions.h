@@ -3,12 +3,61 @@
 
 #include "config.h" // Include our main configuration
 
+// --- Motion Engine ---
+// Every action is a step generator advanced by motionTick() from loop(), so
+// nothing blocks: serial input, RFID and the LCD keep running while the servo
+// moves. Motion commands (including every step of a sequence) queue behind
+// the current one; abortMotion() preempts it. The DONE reply for a frame is
+// sent after its last step has finished.
+const byte MAX_QUEUED_STEPS = 8;
+const byte MAX_STEPS_PER_TICK = 4; // Caps how long one motionTick() can take
+
+// Action timing (ms). Mirrored by the host-side twin in src/kinematics.py.
+const int SPIN_STEP_MS = 400;
+const int SWEEP_STEP_MS = 15;
+const int SWEEP_STEP_DEG = 2;
+const int NOD_SETTLE_MS = 200;
+const int NOD_STEP_MS = 300;
+const int NOD_RANGE = 30;
+const int SHAKE_SETTLE_MS = 200;
+const int SHAKE_RANGE = 45;
+const int SHAKE_MOVES_PER_TIME = 6;
+const int SHAKE_MIN_MS = 70;
+const int SHAKE_MAX_MS = 150;
+const int CENTER_ANGLE = 90;
+
+// --- Setpoint Streaming ---
+// The host can plan a smooth trajectory itself (src/trajectory.py) and stream
+// it as setpoints in OP_STREAM frames: "<first>,<deltas>,<flags>", where each
+// later setpoint is one character, its change from the one before offset from
+// STREAM_DELTA_ZERO. The stream runs as one motion that plays a buffered
+// setpoint every STREAM_PERIOD_MS; when the buffer runs dry the servo holds
+// where it is until more arrive. Mirrored in src/arduino.py.
+const int STREAM_PERIOD_MS = 20;
+const byte STREAM_BUFFER_SIZE = 128;
+const char STREAM_DELTA_ZERO = 'O';
+const int STREAM_MAX_DELTA = 31;
+const byte STREAM_FIRST = 1; // Flag of a stream's first frame
+const byte STREAM_LAST = 2;  // Flag of its last frame; DONE follows once played
+
+struct QueuedStep {
+  char op;
+  int value;  // Negative means "use the default"
+  byte seq;   // Frame sequence number, 0 for steps without one
+  bool last;  // True for the final step of its frame
+};
+
 // --- Function Prototypes (Declarations) ---
 void executeGoTo(int angle);
-void executeSpin(int times);
-void executeSweep(int repetitions);
-void executeNod(int times);
-void executeShake(int times);
-void executeShakeSilent(int times);
+void startShakeSilent(int times);
+void runMotion(char op, int value);
+
+byte queueSpace();
+bool enqueueStep(char op, int value, byte seq, bool last);
+void clearQueue();
+bool motionBusy();
+void motionTick(unsigned long now);
+void abortMotion();
+bool streamSetpoints(byte seq, int first, const char* deltas, byte flags);
 
-#endif // SERVO_ACTIONS_H
\ No newline at end of file
+#endif // SERVO_ACTIONS_H
@@ -5,6 +5,7 @@
 #include "display_functions.h"
 #include "servo_actions.h"
 #include "rfid_functions.h"
+#include "serial_protocol.h"
 
 //==============================================================================
 // GLOBAL VARIABLE DEFINITIONS
@@ -43,6 +44,23 @@ const char* thinkingFrames[] = {".  ", ".. ", "..."};
 // "After" - Define the variable here where the array is defined
 int numThinkingFrames = sizeof(thinkingFrames) / sizeof(const char*);
 
+// --- Serial Input ---
+char inputLine[SERIAL_LINE_MAX];
+byte lastFrameSeq = 0; // 0 is never used by the host
+
+// Plain-text control commands, still accepted for use from the Serial Monitor
+struct TextCommand {
+  const char* name;
+  char op;
+};
+const TextCommand textCommands[] = {
+  {"AWAIT_AUTH_CMD", OP_AWAIT_AUTH}, {"AUTH_FAIL_CMD", OP_AUTH_FAIL},
+  {"AUTH_SUCCESS_CMD", OP_AUTH_SUCCESS}, {"THINKING_START", OP_THINKING},
+  {"IDLE_STATE", OP_IDLE}, {"RESET_STATE", OP_RESET}, {"SHUTDOWN_CMD", OP_SHUTDOWN},
+  {"STOP_MOTION", OP_STOP}};
+const int numTextCommands = sizeof(textCommands) / sizeof(TextCommand);
+// JSON command names (jsonCommands) are in the generated command_table.h
+
 
 //==============================================================================
 // SETUP - Runs once at the beginning
@@ -75,82 +93,17 @@ void loop() {
      handleRfid();
   }
 
-  if (Serial.available() > 0) {
-    String input = Serial.readStringUntil('\n');
-    input.trim();
-
-    if (input.equalsIgnoreCase("AWAIT_AUTH_CMD")) {
-      currentDisplayState = AWAITING_AUTH;
-      displayAwaitingAuth();
-    }
-    else if (input.equalsIgnoreCase("AUTH_FAIL_CMD")) {
-      currentDisplayState = AUTH_FAILURE;
-      authFailDisplayStartTime = millis();
-      lcd.clear();
-      lcd.print(F("Access Denied!"));
-      executeShakeSilent(1);
-    }
-    else if (input.equalsIgnoreCase("AUTH_SUCCESS_CMD")) {
-      lcd.clear();
-      lcd.print(F("Authenticated!"));
-      currentAngle = INITIAL_ANGLE;
-      myservo.write(currentAngle);
-      delay(2000);
-      displayIdle();
-    }
-    else if (input.equalsIgnoreCase("THINKING_START")) {
-      currentDisplayState = THINKING;
-      animationFrame = 0;
-      lastAnimationTime = millis();
-      lcd.clear();
-    }
-    else if (input.equalsIgnoreCase("IDLE_STATE")) {
-      displayIdle();
-    }
-    else if (input.equalsIgnoreCase("RESET_STATE")) {
-      Serial.println(F("System reset command received."));
-      currentAngle = INITIAL_ANGLE;
-      myservo.write(currentAngle);
-      currentDisplayState = WELCOME_SEQUENCE;
-      welcomeMessageIndex = 0;
-      displayWelcomeMessage();
-    }
-    else if (input.equalsIgnoreCase("SHUTDOWN_CMD")) {
-      Serial.println(F("Shutdown command received."));
-      myservo.write(INITIAL_ANGLE);
-      currentDisplayState = SHUTTING_DOWN;
-      shutdownStartTime = millis();
-      lcd.clear();
-      lcd.setCursor(0, 0); lcd.print(F("System"));
-      lcd.setCursor(0, 1); lcd.print(F("Shutting Down..."));
-    }
-    else {
-      // --- INCREASED JSON DOCUMENT SIZE FOR ROBUSTNESS ---
-      StaticJsonDocument<384> doc;
-      DeserializationError error = deserializeJson(doc, input);
-
-      if (error) {
-        Serial.print(F("JSON Parse Error: ")); Serial.println(error.c_str());
-        // "Before" was okay because input was a String
-        // "After" - input is a String, which is fine
-        displayActionStatus("JSON Parse Err!", input);
-      } else {
-        const char* command = doc["command"];
-        if (strcmp(command, "GOTO") == 0)       { executeGoTo(doc["angle"]); }
-        else if (strcmp(command, "SPIN") == 0)  { executeSpin(doc["times"] | 1); }
-        else if (strcmp(command, "SWEEP") == 0) { executeSweep(doc["repetitions"] | 2); }
-        else if (strcmp(command, "NOD") == 0)   { executeNod(doc["times"] | 2); }
-        else if (strcmp(command, "SHAKE") == 0) { executeShake(doc["times"] | 2); }
-        else {
-          Serial.print(F("Unknown JSON command: ")); Serial.println(command);
-          // "Before" command was a const char*
-          // "After" - Explicitly cast it to a String for the function
-          displayActionStatus("Unknown Command", String(command));
-        }
-      }
+  if (readSerialLine(inputLine, SERIAL_LINE_MAX) && inputLine[0] != '\0') {
+    if (inputLine[0] == FRAME_START) {
+      handleFrame(inputLine);
+    } else {
+      handleTextLine(inputLine);
     }
   }
 
+  // Advance the motion engine; it never blocks, so input is checked every pass
+  motionTick(millis());
+
   // --- Part 2: Handle Display State Updates ---
   if (currentDisplayState == AUTH_FAILURE) {
     if (millis() - authFailDisplayStartTime > authFailDisplayDuration) {
@@ -159,7 +112,11 @@ void loop() {
     }
   }
   else if (currentDisplayState == AWAITING_AUTH) {
-    handleAuthenticationScan();
+    // With an allowlist the board decides at once; Python confirms it
+    char decision = handleAuthenticationScan();
+    if (decision != '\0') {
+      runControl(decision);
+    }
   }
   else if (currentDisplayState == WELCOME_SEQUENCE) {
     if (millis() - lastWelcomeTime > welcomeInterval) {
@@ -177,7 +134,8 @@ void loop() {
     }
   }
   else if (currentDisplayState == EXECUTING_ACTION) {
-    if (millis() - actionDisplayStartTime > actionDisplayDuration) {
+    // Keep showing the action for as long as the servo is still moving
+    if (!motionBusy() && millis() - actionDisplayStartTime > actionDisplayDuration) {
       displayIdle();
     }
   }
@@ -194,4 +152,200 @@ void loop() {
       while (1) {}
     }
   }
-}
\ No newline at end of file
+}
+
+
+//==============================================================================
+// COMMAND HANDLING - Framed protocol and legacy text/JSON input
+//==============================================================================
+
+bool isControlOp(char op) {
+  return op != '\0' && strchr("TIRXUSFZ", op) != NULL;
+}
+
+bool isMotionOp(char op) {
+  return op != '\0' && strchr(MOTION_OPS, op) != NULL;
+}
+
+void runControl(char op) {
+  switch (op) {
+    case OP_AWAIT_AUTH:
+      currentDisplayState = AWAITING_AUTH;
+      displayAwaitingAuth();
+      break;
+    case OP_AUTH_FAIL:
+      currentDisplayState = AUTH_FAILURE;
+      authFailDisplayStartTime = millis();
+      lcd.clear();
+      lcd.print(F("Access Denied!"));
+      startShakeSilent(1);
+      break;
+    case OP_AUTH_SUCCESS:
+      lcd.clear();
+      lcd.print(F("Authenticated!"));
+      currentAngle = INITIAL_ANGLE;
+      myservo.write(currentAngle);
+      // Shown like an action status, so the loop keeps running meanwhile
+      currentDisplayState = EXECUTING_ACTION;
+      actionDisplayStartTime = millis();
+      break;
+    case OP_THINKING:
+      currentDisplayState = THINKING;
+      animationFrame = 0;
+      lastAnimationTime = millis();
+      lcd.clear();
+      break;
+    case OP_IDLE:
+      displayIdle();
+      break;
+    case OP_STOP:
+      abortMotion();
+      break;
+    case OP_RESET:
+      Serial.println(F("System reset command received."));
+      abortMotion();
+      currentAngle = INITIAL_ANGLE;
+      myservo.write(currentAngle);
+      currentDisplayState = WELCOME_SEQUENCE;
+      welcomeMessageIndex = 0;
+      displayWelcomeMessage();
+      break;
+    case OP_SHUTDOWN:
+      Serial.println(F("Shutdown command received."));
+      abortMotion();
+      myservo.write(INITIAL_ANGLE);
+      currentDisplayState = SHUTTING_DOWN;
+      shutdownStartTime = millis();
+      lcd.clear();
+      lcd.setCursor(0, 0); lcd.print(F("System"));
+      lcd.setCursor(0, 1); lcd.print(F("Shutting Down..."));
+      break;
+  }
+}
+
+/**
+ * Queues the steps of a motion frame. Returns false (queueing nothing) if a
+ * step is malformed or the queue does not have room for all of them.
+ */
+bool queueMotionFrame(byte seq, char op, char* payload) {
+  if (op != OP_SEQUENCE) {
+    int args[MAX_FRAME_ARGS];
+    byte argCount = parseIntArgs(payload, args, MAX_FRAME_ARGS);
+    if ((op == OP_GOTO && argCount == 0) || queueSpace() == 0) {
+      return false;
+    }
+    return enqueueStep(op, argCount > 0 ? args[0] : -1, seq, true);
+  }
+
+  // Validate the whole sequence before queueing any of it
+  byte stepCount = 0;
+  for (char* token = payload; token != NULL && *token; token = strchr(token, ',')) {
+    if (*token == ',') token++;
+    bool hasValue = token[1] != '\0' && token[1] != ',';
+    if (!isMotionOp(*token) || (*token == OP_GOTO && !hasValue)) {
+      return false;
+    }
+    stepCount++;
+  }
+  if (stepCount == 0 || stepCount > queueSpace()) {
+    return false;
+  }
+
+  byte queued = 0;
+  for (char* token = payload; token != NULL && *token; token = strchr(token, ',')) {
+    if (*token == ',') token++;
+    int value = (token[1] != '\0' && token[1] != ',') ? atoi(token + 1) : -1;
+    queued++;
+    enqueueStep(*token, value, seq, queued == stepCount);
+  }
+  return true;
+}
+
+/**
+ * Buffers a stream frame, "<first>,<deltas>,<flags>". Returns false if it
+ * is malformed or streamSetpoints() rejects it.
+ */
+bool queueStreamFrame(byte seq, char* payload) {
+  char* deltas = strchr(payload, ',');
+  char* flags = strrchr(payload, ',');
+  if (deltas == NULL || flags == deltas) {
+    return false;
+  }
+  *flags = '\0'; // Delta characters never include ','
+  return streamSetpoints(seq, atoi(payload), deltas + 1, atoi(flags + 1));
+}
+
+void handleFrame(char* line) {
+  byte seq;
+  char op;
+  char* payload;
+
+  // Corrupted frames are dropped silently; the host re-sends when no ACK arrives
+  if (!parseFrame(line, &seq, &op, &payload)) {
+    return;
+  }
+  // The host numbers frames afresh on each connection. If this board was not
+  // reset when the port opened, forget the previous connection's last seq.
+  if (op == OP_SYNC) {
+    lastFrameSeq = seq;
+    sendReply(seq, REPLY_ACK, -1);
+    return;
+  }
+  // A repeated seq means our ACK was lost. Acknowledge again, don't re-run.
+  if (seq == lastFrameSeq) {
+    sendReply(seq, REPLY_ACK, -1);
+    return;
+  }
+
+  if (isControlOp(op)) {
+    lastFrameSeq = seq;
+    sendReply(seq, REPLY_ACK, -1);
+    runControl(op);
+    sendReply(seq, REPLY_DONE, currentAngle);
+  }
+  else if ((isMotionOp(op) || op == OP_SEQUENCE) && queueMotionFrame(seq, op, payload)) {
+    lastFrameSeq = seq;
+    sendReply(seq, REPLY_ACK, -1); // DONE is sent once the last step has run
+  }
+  else if (op == OP_ALLOWLIST && loadAllowlist(payload)) {
+    lastFrameSeq = seq;
+    sendReply(seq, REPLY_ACK, -1);
+    sendReply(seq, REPLY_DONE, currentAngle);
+  }
+  else if (op == OP_STREAM && queueStreamFrame(seq, payload)) {
+    lastFrameSeq = seq;
+    sendReply(seq, REPLY_ACK, -1); // The last frame's DONE follows its playback
+  }
+  else {
+    sendReply(seq, REPLY_NAK, -1);
+  }
+}
+
+void handleTextLine(char* line) {
+  for (int i = 0; i < numTextCommands; i++) {
+    if (strcasecmp(line, textCommands[i].name) == 0) {
+      runControl(textCommands[i].op);
+      return;
+    }
+  }
+
+  // --- INCREASED JSON DOCUMENT SIZE FOR ROBUSTNESS ---
+  StaticJsonDocument<384> doc;
+  DeserializationError error = deserializeJson(doc, line);
+
+  if (error) {
+    Serial.print(F("JSON Parse Error: ")); Serial.println(error.c_str());
+    displayActionStatus("JSON Parse Err!", String(line));
+    return;
+  }
+
+  const char* command = doc["command"] | "";
+  for (int i = 0; i < numJsonCommands; i++) {
+    if (strcmp(command, jsonCommands[i].name) == 0) {
+      runMotion(jsonCommands[i].op, doc[jsonCommands[i].param] | -1);
+      return;
+    }
+  }
+  Serial.print(F("Unknown JSON command: ")); Serial.println(command);
+  displayActionStatus("Unknown Command", String(command));
+}
@@ -0,0 +1,6 @@
+"""
+End-to-end latency benchmark with local stand-ins for Ollama and the Arduino.
+Run with: python -m benchmark.run --help
+Model and option tuning: python -m benchmark.tune --help
+Prompt size per request: python -m benchmark.prompt_size --help
+"""
@@ -0,0 +1,234 @@
+import json
+import re
+import zlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Roughly how many characters one token covers, for prompt and response sizes.
+CHARS_PER_TOKEN = 4
+
+USER_REQUEST_PATTERN = re.compile(r"User Request:\s*(.*)")
+
+
+class FakeOllamaServer:
+    """
+    Local stand-in for the Ollama HTTP API (/api/tags, /api/generate and
+    /api/embed).
+
+    The "model" answers from a lookup table of user request -> command dict,
+    so the benchmark measures the host code rather than model quality.
+    Timing is simulated:
+    - load_time:   paid by the first request after start (or after keep_alive 0)
+    - prompt_rate: prompt tokens evaluated per second; a system prompt that
+                   matches the previous request is treated as cached
+    - token_rate:  response tokens generated per second
+    - tail_tokens: whitespace tokens generated after the JSON object, as
+                   models with format=json tend to do before stopping
+    - stall:       seconds every generation hangs before its first token,
+                   like a stuck server; /api/tags keeps answering
+    - error_status: HTTP status every generation fails with (e.g. 500), or
+                   None to answer normally
+    - healthy:     False fails /api/tags with a 503, like a server whose
+                   health check is down
+    - models:      per-model overrides, {name: {"token_rate": ..., "accuracy": ...}},
+                   to compare models in the tuner. A model gets a fixed,
+                   repeatable (1 - accuracy) share of requests wrong.
+    - embed_time:  seconds an /api/embed request takes. Embeddings are
+                   hashed bags of words, so requests sharing most of their
+                   words are similar, as with a real embedding model.
+    Options are honoured the way Ollama does: generation stops after
+    num_predict tokens, and a prompt longer than num_ctx loses its
+    beginning (the instructions), so the answer is wrong.
+    Responses carry the same duration fields as Ollama's final chunk.
+    """
+    def __init__(self, responses, token_rate=40.0, load_time=2.0, prompt_rate=400.0,
+                 tail_tokens=20, default_response=None, stall=0.0, models=None,
+                 embed_time=0.02, error_status=None, healthy=True, host="127.0.0.1", port=0):
+        self.responses = {text.lower(): response for text, response in responses.items()}
+        self.default_response = default_response or {"command": "NOD", "times": 1}
+        self.token_rate = token_rate
+        self.load_time = load_time
+        self.prompt_rate = prompt_rate
+        self.tail_tokens = tail_tokens
+        self.stall = stall
+        self.error_status = error_status
+        self.healthy = healthy
+        self.models = models or {}
+        self.embed_time = embed_time
+        self.loaded = False
+        self.cached_system = None
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/generate"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # --- Simulated model ---
+    def answer_for(self, prompt, model=None):
+        match = USER_REQUEST_PATTERN.search(prompt or "")
+        request = match.group(1).strip().strip('"').lower() if match else ""
+        accuracy = self.models.get(model, {}).get("accuracy", 1.0)
+        if zlib.crc32(f"{model}:{request}".encode()) % 1000 >= accuracy * 1000:
+            return self.default_response
+        return self.responses.get(request, self.default_response)
+
+    def embedding_for(self, text, dimensions=64):
+        vector = [0.0] * dimensions
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            vector[zlib.crc32(word.encode()) % dimensions] += 1.0
+        return vector
+
+    def tokens_for(self, response):
+        text = json.dumps(response)
+        tokens = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        return tokens + ["\n"] * self.tail_tokens
+
+    def _load(self):
+        """Returns the seconds spent loading the model for this request."""
+        with self._lock:
+            if self.loaded:
+                return 0.0
+            self.loaded = True
+        time.sleep(self.load_time)
+        return self.load_time
+
+    def _prompt_eval(self, payload):
+        """Returns (prompt tokens evaluated, seconds spent)."""
+        system = payload.get("system")
+        prompt = payload.get("prompt", "")
+        with self._lock:
+            cached = system is not None and system == self.cached_system
+            self.cached_system = system
+        chars = len(prompt) + (0 if cached or system is None else len(system))
+        count = max(1, chars // CHARS_PER_TOKEN)
+        seconds = count / self.prompt_rate
+        time.sleep(seconds)
+        return count, seconds
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; like Ollama, don't let
+            # Nagle hold the body back for the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, data):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, data):
+                line = json.dumps(data).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/api/tags" and not server.healthy:
+                    self.send_error(503)
+                elif self.path == "/api/tags":
+                    self._send_json({"models": [{"name": "fake"}]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path == "/api/embed":
+                    payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                    inputs = payload.get("input", "")
+                    time.sleep(server.embed_time)
+                    self._send_json({"model": payload.get("model"), "embeddings": [
+                        server.embedding_for(text) for text in ([inputs] if isinstance(inputs, str) else inputs)
+                    ]})
+                    return
+                if self.path != "/api/generate":
+                    self.send_error(404)
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests += 1
+                if server.error_status:
+                    self.send_error(server.error_status)
+                    return
+                start = time.perf_counter()
+                if payload.get("keep_alive") in (0, "0"):
+                    server.loaded = False
+                load_seconds = server._load()
+
+                # An empty prompt only loads the model, as in Ollama
+                if not payload.get("prompt"):
+                    self._send_json({"model": payload.get("model"), "response": "", "done": True,
+                                     "load_duration": int(load_seconds * 1e9),
+                                     "total_duration": int((time.perf_counter() - start) * 1e9)})
+                    return
+
+                if server.stall:
+                    time.sleep(server.stall)
+                prompt_count, prompt_seconds = server._prompt_eval(payload)
+                options = payload.get("options") or {}
+                model = payload.get("model")
+                answer = server.answer_for(payload.get("prompt"), model)
+                full_prompt = len(payload.get("system") or "") + len(payload.get("prompt", ""))
+                if full_prompt // CHARS_PER_TOKEN > options.get("num_ctx", float("inf")):
+                    answer = server.default_response
+                tokens = server.tokens_for(answer)
+                if options.get("num_predict", -1) >= 0:
+                    tokens = tokens[:options["num_predict"]]
+                delay = 1.0 / server.models.get(model, {}).get("token_rate", server.token_rate)
+
+                def stats(eval_count, eval_seconds):
+                    return {
+                        "done": True,
+                        "total_duration": int((time.perf_counter() - start) * 1e9),
+                        "load_duration": int(load_seconds * 1e9),
+                        "prompt_eval_count": prompt_count,
+                        "prompt_eval_duration": int(prompt_seconds * 1e9),
+                        "eval_count": eval_count,
+                        "eval_duration": int(eval_seconds * 1e9),
+                    }
+
+                if not payload.get("stream", True):
+                    time.sleep(delay * len(tokens))
+                    data = {"model": payload.get("model"), "response": "".join(tokens)}
+                    data.update(stats(len(tokens), delay * len(tokens)))
+                    self._send_json(data)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                eval_start = time.perf_counter()
+                try:
+                    for token in tokens:
+                        time.sleep(delay)
+                        self._send_chunk({"model": payload.get("model"), "response": token, "done": False})
+                    final = {"model": payload.get("model"), "response": ""}
+                    final.update(stats(len(tokens), time.perf_counter() - eval_start))
+                    self._send_chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the rest of the generation
+                    self.close_connection = True
+
+        return Handler
@@ -0,0 +1,142 @@
+import os
+import pty
+import queue
+import threading
+import time
+import tty
+import src.config as cfg
+from src.arduino import (
+    CONTROL_OPCODES, FRAME_START, MOTION_OPCODES, REPLY_ACK, REPLY_DONE, REPLY_NAK,
+    REPLY_START, SEQUENCE_OPCODE, SYNC_OPCODE, decode_frame, encode_frame
+)
+from src.kinematics import ServoTwin
+
+OPCODE_COMMANDS = {op: (command, param) for command, (op, param) in MOTION_OPCODES.items()}
+
+
+def frame_to_command(op, args):
+    """Turns a motion frame back into a command dict (the inverse of command_to_frame)."""
+    if op == SEQUENCE_OPCODE:
+        steps = []
+        for step in args:
+            step = str(step)
+            steps.append(frame_to_command(step[0], (int(step[1:]),) if step[1:] else ()))
+        return {"command": "SEQUENCE", "steps": steps}
+    command, param = OPCODE_COMMANDS[op]
+    command_dict = {"command": command}
+    if args:
+        command_dict[param] = args[0]
+    return command_dict
+
+
+class FakeSerialDevice:
+    """
+    A pseudo-terminal that speaks the Arduino's framed protocol, so
+    ArduinoController can open it like a real serial port (Linux/macOS only).
+
+    Frames are ACKed as soon as they are read. Control frames are DONE right
+    away; motions are queued and DONE once their predicted duration (from the
+    same ServoTwin model the host uses) has passed, scaled by motion_scale.
+    A repeated sequence number is ACKed again but not run twice.
+    The ready line is printed reset_time seconds after start(), like a
+    board running its bootloader after the port opens.
+    """
+    def __init__(self, motion_scale=0.1, ack_delay=0.0, reset_time=0.0):
+        self.motion_scale = motion_scale
+        self.ack_delay = ack_delay
+        self.reset_time = reset_time
+        self.master, self._slave = pty.openpty()
+        tty.setraw(self._slave) # No echo or newline translation
+        self.port = os.ttyname(self._slave)
+        self.twin = ServoTwin(cfg.MOTOR_INITIAL_ANGLE, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE,
+                              cfg.MOTOR_DEGREES_PER_SECOND)
+        self.frames = 0
+        self.bytes_received = 0
+        self._last_seq = None
+        self._motions = queue.Queue()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._read_loop, name="fake-serial-read", daemon=True),
+            threading.Thread(target=self._motion_loop, name="fake-serial-motion", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        ready = threading.Timer(self.reset_time, self._ready)
+        ready.daemon = True
+        ready.start()
+        return self
+
+    def _ready(self):
+        if not self._stop.is_set():
+            self._write("Arduino Ready")
+
+    def stop(self):
+        self._stop.set()
+        self._motions.put(None)
+        os.close(self.master)
+        os.close(self._slave)
+
+    def _write(self, line):
+        data = line if isinstance(line, bytes) else (line + "\n").encode()
+        with self._write_lock:
+            os.write(self.master, data)
+
+    def _reply(self, seq, kind, value=None):
+        self._write(encode_frame(seq, kind, () if value is None else (value,), start=REPLY_START))
+
+    def _read_loop(self):
+        buffer = b""
+        while not self._stop.is_set():
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            if not data:
+                return
+            self.bytes_received += len(data)
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self._handle_line(line.decode("ascii", errors="ignore").strip())
+
+    def _handle_line(self, line):
+        if not line.startswith(FRAME_START):
+            return
+        frame = decode_frame(line)
+        if frame is None:
+            return
+        if self.ack_delay:
+            time.sleep(self.ack_delay)
+        if frame.kind == SYNC_OPCODE:
+            self._last_seq = frame.seq
+            self._reply(frame.seq, REPLY_ACK)
+            return
+        if frame.seq == self._last_seq:
+            self._reply(frame.seq, REPLY_ACK)
+            return
+        self._last_seq = frame.seq
+        self.frames += 1
+
+        if frame.kind in CONTROL_OPCODES.values():
+            self._reply(frame.seq, REPLY_ACK)
+            self._reply(frame.seq, REPLY_DONE, self.twin.angle)
+        elif frame.kind in OPCODE_COMMANDS or frame.kind == SEQUENCE_OPCODE:
+            self._reply(frame.seq, REPLY_ACK)
+            self._motions.put((frame.seq, frame_to_command(frame.kind, frame.args)))
+        else:
+            self._reply(frame.seq, REPLY_NAK)
+
+    def _motion_loop(self):
+        while True:
+            item = self._motions.get()
+            if item is None:
+                return
+            seq, command_dict = item
+            prediction = self.twin.predict(command_dict, self.twin.angle)
+            time.sleep(prediction.seconds * self.motion_scale)
+            self.twin.angle = prediction.end_angle
+            self._reply(seq, REPLY_DONE, self.twin.angle)
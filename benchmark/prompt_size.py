@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+
+import src.config as cfg
+import src.llm as llm
+from src.commands import COMMANDS, select_examples
+from benchmark.fake_ollama import CHARS_PER_TOKEN
+from benchmark.tune import DEFAULT_CORPUS
+
+
+def tokens(text):
+    """Estimated prompt tokens, counted the way the fake Ollama server does."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def measure(corpus, examples):
+    """
+    Prompt tokens per request over the corpus with at most `examples`
+    few-shot examples (None: every example). split is what a request costs
+    when the system prompt is cached, inline what it costs without a split.
+    coverage is the share of requests whose expected command is among the
+    examples sent with it.
+    """
+    cfg.OLLAMA_PROMPT_EXAMPLES = examples
+    system = llm.build_system_prompt(cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE)
+    split, covered = [], 0
+    for item in corpus:
+        prompt = llm.build_llm_prompt(item["input"], 90, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE)
+        split.append(tokens(prompt))
+        sent = {command["command"] for _, command in select_examples(item["input"], examples)}
+        covered += item["response"]["command"] in sent
+    mean_split = sum(split) / len(split)
+    return {
+        "examples": "all" if examples is None else examples,
+        "system_tokens": tokens(system),
+        "split_tokens": mean_split,
+        "inline_tokens": tokens(system) + mean_split,
+        "coverage": covered / len(corpus),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="Estimate the prompt tokens per request for different numbers of few-shot examples.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON list of {input, response}")
+    parser.add_argument("--examples", default=f"all,{cfg.OLLAMA_PROMPT_EXAMPLES},1",
+                        help="comma-separated example counts to compare ('all' sends every example)")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+    counts = [None if value == "all" else int(value) for value in args.examples.split(",") if value]
+    results = [measure(corpus, count) for count in counts]
+
+    total = sum(len(spec.examples) for spec in COMMANDS)
+    print(f"{os.path.basename(args.corpus)}: {len(corpus)} requests, {total} examples in the registry, "
+          f"~{CHARS_PER_TOKEN} chars per token")
+    print(f"{'examples':>9}{'system':>9}{'split':>9}{'inline':>9}{'coverage':>10}")
+    for result in results:
+        print(f"{result['examples']!s:>9}{result['system_tokens']:>9}{result['split_tokens']:>9.0f}"
+              f"{result['inline_tokens']:>9.0f}{result['coverage']:>10.0%}")
+    baseline = results[0]
+    for result in results[1:]:
+        saved = 1 - result["split_tokens"] / baseline["split_tokens"]
+        print(f"{result['examples']} examples: {saved:.0%} fewer tokens per request than "
+              f"{baseline['examples']} (split layout)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,318 @@
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import src.config as cfg
+import src.llm as llm
+import src.metrics as metrics
+import main
+from src.arduino import REPLY_ACK
+from benchmark.fake_ollama import FakeOllamaServer
+from benchmark.fake_serial import FakeSerialDevice
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus.json")
+PERCENTILES = (50, 95, 99)
+
+# Stages in report order. A command only has the stages it went through
+# (e.g. a fast-path hit has no prompt_build or llm).
+STAGES = ("fast_path", "cache", "prompt_build", "llm", "llm_first_token", "llm_dispatch",
+          "parse", "serial_write", "ack", "done", "total")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100)) # ceil
+    return ordered[int(rank) - 1]
+
+
+class StageRecorder:
+    """
+    Times stages by wrapping the functions that implement them. Durations
+    are summed per command, since a stage can run more than once (e.g. a
+    SEQUENCE resend or several parser feeds).
+    """
+    def __init__(self):
+        self.current = None
+        self.samples = []
+
+    def begin(self, label):
+        self.current = {"input": label, "stages": {}}
+
+    def end(self, total_seconds, ok):
+        self.current["stages"]["total"] = total_seconds
+        self.current["ok"] = ok
+        self.samples.append(self.current)
+        self.current = None
+
+    def add(self, stage, seconds):
+        if self.current is not None:
+            stages = self.current["stages"]
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def wrap(self, owner, name, stage):
+        """Replaces owner.name with a version that records its duration as stage."""
+        original = getattr(owner, name)
+        recorder = self
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                recorder.add(stage if isinstance(stage, str) else stage(*args, **kwargs),
+                             time.perf_counter() - start)
+        setattr(owner, name, timed)
+
+    def summary(self):
+        result = {}
+        for stage in STAGES:
+            values = [s["stages"][stage] for s in self.samples if stage in s["stages"]]
+            if not values:
+                continue
+            entry = {"count": len(values), "mean_ms": sum(values) / len(values) * 1000}
+            for pct in PERCENTILES:
+                entry[f"p{pct}_ms"] = percentile(values, pct) * 1000
+            result[stage] = entry
+        return result
+
+
+def instrument(app, recorder):
+    """Wraps the stage functions LlmServoControl and ArduinoController call."""
+    recorder.wrap(main, "parse_command_with_keywords", "fast_path")
+    recorder.wrap(main, "build_llm_prompt", "prompt_build")
+    recorder.wrap(main, "send_to_ollama", "llm")
+    recorder.wrap(main, "parse_llm_response_to_json", "parse")
+    recorder.wrap(llm.IncrementalJsonParser, "feed", "parse")
+    if app.cache:
+        recorder.wrap(app.cache, "lookup", "cache")
+
+    original_stream = main.stream_from_ollama
+    def stream(*args, **kwargs):
+        start = time.perf_counter()
+        text, timing = original_stream(*args, **kwargs)
+        recorder.add("llm", time.perf_counter() - start)
+        for key in ("first_token", "dispatch"):
+            if timing.get(key) is not None:
+                recorder.add(f"llm_{key}", timing[key])
+        return text, timing
+    main.stream_from_ollama = stream
+
+    if len(app.fleet) > 1:
+        # Boards run concurrently, so serial time can't be charged to one command
+        return
+    recorder.wrap(app.arduino.ser, "write", "serial_write")
+    recorder.wrap(app.arduino, "_wait_for_reply",
+                  lambda seq, kinds, timeout: "ack" if REPLY_ACK in kinds else "done")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def spread_over_boards(corpus, count):
+    """Targets the corpus items at rig1..rigN in turn ("... on rig 2")."""
+    spread = []
+    for i, item in enumerate(corpus):
+        name = f"rig{i % count + 1}"
+        response = dict(item["response"], device=name)
+        spread.append({"input": f"{item['input']} on rig {i % count + 1}", "response": response})
+    return spread
+
+
+def run_benchmark(args):
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+    if args.boards > 1:
+        corpus = spread_over_boards(corpus, args.boards)
+
+    # With --stall the first backend hangs, so the gateway has to route around it
+    backends = [FakeOllamaServer(
+        {item["input"]: item["response"] for item in corpus},
+        token_rate=args.token_rate, load_time=args.load_time, prompt_rate=args.prompt_rate,
+        tail_tokens=args.tail_tokens, stall=args.stall if i == 0 else 0.0
+    ).start() for i in range(args.backends)]
+    ollama = backends[0]
+    devices = [FakeSerialDevice(motion_scale=args.motion_scale, ack_delay=args.ack_delay,
+                                reset_time=args.reset_time).start()
+               for _ in range(args.boards)]
+
+    cfg.OLLAMA_API_URL = ollama.api_url
+    if args.backends > 1:
+        cfg.OLLAMA_BACKENDS = [backend.api_url.split("/api/")[0] for backend in backends]
+    cfg.OLLAMA_REQUEST_TIMEOUT = args.request_timeout
+    cfg.USE_MOCK_ARDUINO = False
+    cfg.SERIAL_PORT = devices[0].port
+    if args.boards > 1:
+        cfg.BOARDS = {f"rig{i + 1}": device.port for i, device in enumerate(devices)}
+    cfg.OLLAMA_REWARM_IDLE_SECONDS = 0
+    cfg.OLLAMA_STREAM = not args.no_stream
+    if args.no_fast_path:
+        cfg.FAST_PATH_MIN_CONFIDENCE = 2.0
+    # Off by default, so repeated passes still measure the LLM path
+    cfg.CACHE_ENABLED = args.cache != "off"
+    cfg.CACHE_SEMANTIC = args.cache == "semantic"
+    cfg.CACHE_PATH = None
+
+    recorder = StageRecorder()
+    log = sys.stdout if args.verbose else io.StringIO()
+    setup_start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        app = main.LlmServoControl()
+        ready = app.setup()
+    setup_seconds = time.perf_counter() - setup_start
+    if not ready:
+        print(log.getvalue() if not args.verbose else "", end="")
+        raise SystemExit("Setup failed against the fake Ollama server / serial device.")
+    instrument(app, recorder)
+
+    # With several boards commands are only queued on their board, as the
+    # runtime does, and total is the time to hand them over. wall_seconds
+    # shows how much the boards overlapped.
+    wait = args.boards == 1
+    pending = []
+    wall_start = time.perf_counter()
+    try:
+        for _ in range(args.repeat):
+            for item in corpus:
+                recorder.begin(item["input"])
+                metrics.new_trace(item["input"])
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(log):
+                    command = app.get_llm_command(item["input"])
+                    result = bool(command) and app.execute_command(command, wait=wait)
+                    if not wait and result:
+                        pending.append((recorder.current, result))
+                    ok = result is not False
+                recorder.end(time.perf_counter() - start, ok)
+        # Board workers print too, so keep their output in the log while they finish
+        with contextlib.redirect_stdout(log):
+            for sample, futures in pending:
+                sample["ok"] = all(future.result() for future in futures)
+        wall_seconds = time.perf_counter() - wall_start
+    finally:
+        with contextlib.redirect_stdout(log):
+            app.shutdown()
+        for device in devices:
+            device.stop()
+        for backend in backends:
+            backend.stop()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "corpus": os.path.basename(args.corpus),
+            "repeat": args.repeat,
+            "token_rate": args.token_rate,
+            "load_time": args.load_time,
+            "prompt_rate": args.prompt_rate,
+            "tail_tokens": args.tail_tokens,
+            "motion_scale": args.motion_scale,
+            "reset_time": args.reset_time,
+            "boards": args.boards,
+            "backends": args.backends,
+            "stall": args.stall,
+            "stream": cfg.OLLAMA_STREAM,
+            "split_prompt": cfg.OLLAMA_SPLIT_PROMPT,
+            "fast_path": not args.no_fast_path,
+            "cache": args.cache,
+        },
+        "setup_seconds": setup_seconds,
+        "wall_seconds": wall_seconds,
+        "commands": len(recorder.samples),
+        "failures": sum(1 for s in recorder.samples if not s["ok"]),
+        "serial": {"frames": sum(d.frames for d in devices),
+                   "bytes_received": sum(d.bytes_received for d in devices),
+                   "frames_per_board": [d.frames for d in devices]},
+        "ollama": {"requests_per_backend": [backend.requests for backend in backends]},
+        "cache": {"hits": app.cache.stats.hits, "misses": app.cache.stats.misses} if app.cache else None,
+        "stages": recorder.summary(),
+        "samples": recorder.samples,
+    }
+
+
+def print_report(result, baseline=None):
+    meta = result["meta"]
+    print(f"Benchmark @ {meta['commit']}: {result['commands']} commands, {result['failures']} failed, "
+          f"setup {result['setup_seconds']:.2f}s, wall {result.get('wall_seconds', 0):.2f}s")
+    if meta.get("boards", 1) > 1:
+        print(f"Boards: {meta['boards']}, frames per board: {result['serial']['frames_per_board']}")
+    if meta.get("backends", 1) > 1:
+        print(f"Ollama backends: {meta['backends']} (first stalls {meta['stall']}s), "
+              f"requests per backend: {result['ollama']['requests_per_backend']}")
+    if result.get("cache"):
+        hits = result["cache"]["hits"]
+        print(f"Intent cache ({meta['cache']}): {hits['exact']} exact and {hits['semantic']} semantic hits, "
+              f"{result['cache']['misses']} misses")
+    header = f"{'stage':<16}{'count':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'p50 delta':>12}{'p95 delta':>12}"
+    print(header)
+    for stage, entry in result["stages"].items():
+        line = (f"{stage:<16}{entry['count']:>6}{entry['p50_ms']:>10.1f}"
+                f"{entry['p95_ms']:>10.1f}{entry['p99_ms']:>10.1f}")
+        old = baseline["stages"].get(stage) if baseline else None
+        if old:
+            line += f"{entry['p50_ms'] - old['p50_ms']:>+12.1f}{entry['p95_ms'] - old['p95_ms']:>+12.1f}"
+        print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="End-to-end latency benchmark against a fake Ollama server and a pty serial device.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON list of {input, response}")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the corpus")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="fake model tokens per second")
+    parser.add_argument("--load-time", type=float, default=2.0, help="fake model load seconds")
+    parser.add_argument("--prompt-rate", type=float, default=400.0, help="fake prompt eval tokens per second")
+    parser.add_argument("--tail-tokens", type=int, default=20, help="tokens generated after the JSON")
+    parser.add_argument("--motion-scale", type=float, default=0.1, help="fraction of real motion time to simulate")
+    parser.add_argument("--boards", type=int, default=1,
+                        help="pty boards to spread the corpus over ('... on rig 2'); >1 runs them concurrently")
+    parser.add_argument("--backends", type=int, default=1,
+                        help="fake Ollama servers behind the gateway (OLLAMA_BACKENDS)")
+    parser.add_argument("--stall", type=float, default=0.0,
+                        help="seconds the first backend hangs on every generation")
+    parser.add_argument("--request-timeout", type=float, default=30.0,
+                        help="OLLAMA_REQUEST_TIMEOUT; lower it with --stall to fail over sooner")
+    parser.add_argument("--reset-time", type=float, default=0.5,
+                        help="seconds before the fake device prints its ready line")
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="seconds before the fake device replies")
+    parser.add_argument("--no-stream", action="store_true", help="use send_to_ollama instead of streaming")
+    parser.add_argument("--no-fast-path", action="store_true", help="send every command to the LLM")
+    parser.add_argument("--cache", choices=("off", "exact", "semantic"), default="off",
+                        help="intent cache tiers to use (in memory only)")
+    parser.add_argument("--out", default="benchmark-results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to show deltas against")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main_cli()
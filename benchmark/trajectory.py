@@ -0,0 +1,101 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+
+import src.config as cfg
+from src.arduino import STREAM_PERIOD_MS, ArduinoController, stream_bytes_per_second
+from src.trajectory import TrajectoryPlanner, compare
+
+DEFAULT_COMMANDS = [
+    {"command": "GOTO", "angle": 150},
+    {"command": "NOD", "times": 2},
+    {"command": "SWEEP", "repetitions": 1},
+    {"command": "SHAKE", "times": 1},
+    {"command": "SPIN", "times": 1},
+    {"command": "SEQUENCE", "steps": [{"command": "GOTO", "angle": 20}, {"command": "NOD", "times": 1}]},
+]
+
+
+def play(arduino, planner, commands, angle):
+    """
+    Plans and streams each command to the emulated board, comparing what it
+    played with the plan. Returns one result per command.
+    """
+    emulator = arduino.emulator
+    results = []
+    for command in commands:
+        trajectory = planner.plan(command, angle)
+        start = len(emulator.servo_log)
+        underruns_before = emulator.stream_underruns
+        ok = arduino.send_trajectory(trajectory.setpoints, done_timeout=trajectory.seconds + cfg.SERIAL_DONE_TIMEOUT)
+        result = compare(trajectory, emulator.servo_log[start:]) or {}
+        result.update(command=command["command"], setpoints=len(trajectory), sent=ok,
+                      planned_end=trajectory.end_angle, reported_end=arduino.last_reported_angle,
+                      underruns=emulator.stream_underruns - underruns_before if ok else None)
+        results.append(result)
+        angle = trajectory.end_angle
+    return results
+
+
+def passed(result, tolerance_ms):
+    return (result["sent"] and "max_angle_error" in result and result["max_angle_error"] == 0
+            and result["max_late_ms"] < tolerance_ms and not result["underruns"]
+            and result["reported_end"] == result["planned_end"])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="Stream planned trajectories to the firmware emulator and check what it played against the plan.")
+    parser.add_argument("--commands", help="JSON list of resolved commands (default: one of each)")
+    parser.add_argument("--profile", choices=("trapezoid", "scurve"), default=cfg.MOTION_PROFILE)
+    parser.add_argument("--tolerance-ms", type=float, default=STREAM_PERIOD_MS,
+                        help="how late a setpoint may be played against its slot (default: one period, "
+                             "which would mean a missed slot)")
+    parser.add_argument("--verbose", action="store_true", help="show the controller's own output")
+    args = parser.parse_args()
+
+    commands = json.loads(args.commands) if args.commands else DEFAULT_COMMANDS
+    cfg.USE_MOCK_ARDUINO = True
+    cfg.MOCK_TIME_SCALE = 1.0 # Playback is paced in real time, as with hardware
+    cfg.MOTION_PROFILE = args.profile
+    planner = TrajectoryPlanner.from_config()
+
+    log = io.StringIO()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log)
+    with quiet:
+        arduino = ArduinoController(cfg.SERIAL_PORT, cfg.SERIAL_BAUDRATE)
+        arduino.connect()
+        try:
+            results = play(arduino, planner, commands, cfg.MOTOR_INITIAL_ANGLE)
+        finally:
+            arduino.disconnect()
+
+    rate = stream_bytes_per_second(arduino.stream_chunk)
+    print(f"{args.profile} profile, {planner.max_velocity:g} deg/s, {planner.max_acceleration:g} deg/s^2; "
+          f"{arduino.stream_chunk} setpoints per frame, {rate:.0f} B/s "
+          f"({rate / (cfg.SERIAL_BAUDRATE / 10):.1%} of {cfg.SERIAL_BAUDRATE} baud)")
+    print(f"{'command':<10}{'points':>7}{'planned s':>11}{'played s':>10}{'late ms':>9}"
+          f"{'angle err':>11}{'underruns':>11}{'end':>9}")
+    failures = 0
+    for result in results:
+        ok = passed(result, args.tolerance_ms)
+        failures += not ok
+        if "max_angle_error" in result:
+            timing = (f"{result['planned_seconds']:>11.2f}{result['executed_seconds']:>10.2f}"
+                      f"{result['max_late_ms']:>9.0f}{result['max_angle_error']:>11}")
+        else:
+            timing = f"{'-':>11}{'-':>10}{'-':>9}{'-':>11}"
+        print(f"{result['command']:<10}{result['setpoints']:>7}{timing}{result['underruns']!s:>11}"
+              f"{result['reported_end']!s:>5}/{result['planned_end']:<3}  {'ok' if ok else 'FAIL'}")
+    if failures:
+        print(f"{failures} of {len(results)} trajectories were not played as planned.")
+        if not args.verbose:
+            print(log.getvalue())
+        sys.exit(1)
+    print("Every trajectory was played as planned.")
+
+
+if __name__ == "__main__":
+    main_cli()
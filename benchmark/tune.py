@@ -0,0 +1,214 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import time
+from datetime import datetime, timezone
+
+import src.config as cfg
+import src.llm as llm
+from src.commands import command_schema, num_predict_budget, validate_command
+from benchmark.fake_ollama import FakeOllamaServer
+from benchmark.run import git_commit, percentile
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "intents.json")
+
+# Stand-in models for --fake, so the sweep and the report can be tried
+# without Ollama. Rates are tokens per second.
+FAKE_MODELS = {
+    "phi3:mini": {"token_rate": 40.0, "accuracy": 0.9},
+    "phi3:mini-q8_0": {"token_rate": 28.0, "accuracy": 0.95},
+    "qwen2.5:1.5b": {"token_rate": 70.0, "accuracy": 0.8},
+    "llama3.2:3b": {"token_rate": 35.0, "accuracy": 0.97},
+}
+
+
+def parse_list(text, cast=str):
+    """'a,b' -> ['a', 'b']. 'default' stands for leaving the option unset."""
+    return [None if item == "default" else cast(item) for item in text.split(",") if item]
+
+
+def same_command(actual, expected):
+    """Compares commands after validation, so defaults and clamping don't count as errors."""
+    return actual is not None and validate_command(actual)[0] == validate_command(expected)[0]
+
+
+def candidates(args):
+    """Every combination of model and options to try, as (model, options)."""
+    sweeps = {
+        "num_ctx": parse_list(args.num_ctx, int),
+        "num_predict": parse_list(args.num_predict, int),
+        "num_thread": parse_list(args.num_thread, int),
+        "temperature": parse_list(args.temperature, float),
+    }
+    for model in parse_list(args.models):
+        for values in itertools.product(*sweeps.values()):
+            options = {name: value for name, value in zip(sweeps, values) if value is not None}
+            yield model, options
+
+
+def evaluate(model, options, corpus, args):
+    """
+    Runs the corpus through send_to_ollama / parse_llm_response_to_json with
+    one model and set of options. Returns the accuracy, latency and token
+    rate figures for it.
+    """
+    schema = command_schema() if cfg.OLLAMA_STRUCTURED_OUTPUT else None
+    system_prompt = llm.build_system_prompt(cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE)
+    responses = []
+    original_generate = llm._generate
+    def generate(api_url, payload):
+        data = original_generate(api_url, payload)
+        responses.append(data)
+        return data
+
+    # Loads the model (and evicts the previous one) before anything is timed
+    llm.send_to_ollama(llm.build_llm_prompt("nod", 90, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE),
+                       cfg.OLLAMA_API_URL, model, system_prompt=system_prompt, schema=schema, options=options)
+
+    latencies, correct, errors, mistakes = [], 0, 0, []
+    llm._generate = generate
+    try:
+        for _ in range(args.repeat):
+            for item in corpus:
+                prompt = llm.build_llm_prompt(item["input"], 90, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE)
+                start = time.perf_counter()
+                text = llm.send_to_ollama(prompt, cfg.OLLAMA_API_URL, model, system_prompt=system_prompt,
+                                          schema=schema, options=options)
+                command = llm.parse_llm_response_to_json(text) if text is not None else None
+                latencies.append(time.perf_counter() - start)
+                if text is None:
+                    errors += 1
+                if same_command(command, item["response"]):
+                    correct += 1
+                elif len(mistakes) < 5:
+                    mistakes.append({"input": item["input"], "got": command, "expected": item["response"]})
+    finally:
+        llm._generate = original_generate
+
+    eval_tokens = sum(data.get("eval_count", 0) for data in responses)
+    eval_seconds = sum(data.get("eval_duration", 0) for data in responses) / 1e9
+    total = len(latencies)
+    return {
+        "model": model,
+        "options": options,
+        "accuracy": correct / total,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "tokens_per_second": eval_tokens / eval_seconds if eval_seconds else None,
+        "mistakes": mistakes,
+    }
+
+
+def recommend(results, tolerance):
+    """The fastest (by p95) candidate whose accuracy is within tolerance of the best."""
+    best_accuracy = max(result["accuracy"] for result in results)
+    eligible = [result for result in results if result["accuracy"] >= best_accuracy - tolerance]
+    return min(eligible, key=lambda result: result["p95_ms"])
+
+
+def config_snippet(result):
+    """The src/config.py lines for a recommended candidate."""
+    options = dict(result["options"])
+    if cfg.OLLAMA_STRUCTURED_OUTPUT and options.get("num_predict") == num_predict_budget(command_schema()):
+        del options["num_predict"] # The same as the automatic budget
+    return f'OLLAMA_MODEL = "{result["model"]}"\nOLLAMA_OPTIONS = {options!r}\n'
+
+
+def run_tuning(args):
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+
+    server = None
+    if args.fake:
+        server = FakeOllamaServer({item["input"]: item["response"] for item in corpus},
+                                  load_time=args.fake_load_time, tail_tokens=0, models=FAKE_MODELS).start()
+        cfg.OLLAMA_API_URL = server.api_url
+    cfg.OLLAMA_BACKENDS = []
+    cfg.OLLAMA_OPTIONS = {}
+
+    results = []
+    log = io.StringIO()
+    def quiet():
+        return contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log)
+    try:
+        with quiet():
+            available = llm.check_ollama_availability()
+        if not available:
+            raise SystemExit("Ollama is not reachable (use --fake for the local stand-in).")
+        for model, options in candidates(args):
+            print(f"Trying {model} {options or '(defaults)'}...", flush=True)
+            with quiet():
+                results.append(evaluate(model, options, corpus, args))
+    finally:
+        llm.get_ollama_client().close()
+        if server:
+            server.stop()
+
+    best = recommend(results, args.tolerance)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "corpus": os.path.basename(args.corpus),
+            "repeat": args.repeat,
+            "fake": args.fake,
+            "structured_output": cfg.OLLAMA_STRUCTURED_OUTPUT,
+        },
+        "results": results,
+        "recommended": best,
+        "config": config_snippet(best),
+    }
+
+
+def print_report(report):
+    print(f"\n{'model':<20}{'options':<44}{'acc':>6}{'p50 ms':>9}{'p95 ms':>9}{'tok/s':>8}")
+    for result in sorted(report["results"], key=lambda r: (-r["accuracy"], r["p95_ms"])):
+        rate = f"{result['tokens_per_second']:.1f}" if result["tokens_per_second"] else "-"
+        options = ", ".join(f"{k}={v}" for k, v in result["options"].items()) or "defaults"
+        print(f"{result['model']:<20}{options:<44}{result['accuracy']:>6.0%}"
+              f"{result['p50_ms']:>9.0f}{result['p95_ms']:>9.0f}{rate:>8}")
+    best = report["recommended"]
+    print(f"\nRecommended ({best['accuracy']:.0%} accurate, p95 {best['p95_ms']:.0f} ms). In src/config.py:")
+    print(report["config"])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="Sweep Ollama models and options over a labeled intent corpus and recommend a config.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON list of {input, response}")
+    parser.add_argument("--models", default=cfg.OLLAMA_MODEL,
+                        help="comma-separated models; quantizations are separate tags (phi3:mini-q8_0)")
+    parser.add_argument("--num-ctx", default="default", help="comma-separated num_ctx values")
+    parser.add_argument("--num-predict", default="default",
+                        help="comma-separated num_predict values ('default' is the schema budget)")
+    parser.add_argument("--num-thread", default="default", help="comma-separated num_thread values")
+    parser.add_argument("--temperature", default="default", help="comma-separated temperatures")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus per candidate")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="accuracy a faster candidate may give up against the most accurate one")
+    parser.add_argument("--fake", action="store_true",
+                        help=f"use a local stand-in server with fake models ({', '.join(FAKE_MODELS)})")
+    parser.add_argument("--fake-load-time", type=float, default=0.0, help="fake model load seconds")
+    parser.add_argument("--out", default="tuning-results.json", help="where to write the JSON results")
+    parser.add_argument("--config-out", help="also write the recommended config lines to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    args = parser.parse_args()
+
+    report = run_tuning(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.config_out:
+        with open(args.config_out, "w") as f:
+            f.write(report["config"])
+    print_report(report)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,41 +1,127 @@
+import argparse
+import asyncio
+import functools
 import time
+from concurrent.futures import ThreadPoolExecutor
 import src.config as cfg
-from src.voice import listen_for_voice_command_google
+import src.metrics as metrics
 from src.arduino import (
-    ArduinoController, CMD_THINKING_START, CMD_IDLE_STATE,
+    CMD_THINKING_START, CMD_IDLE_STATE,
     CMD_RESET_STATE, CMD_SHUTDOWN, CMD_AWAIT_AUTH, CMD_AUTH_SUCCESS, CMD_AUTH_FAIL
 )
 from src.llm import (
+    FastPathStats,
     build_llm_prompt,
+    build_system_prompt,
     check_ollama_availability,
+    format_timing,
+    get_ollama_client,
     parse_command_with_keywords,
     parse_llm_response_to_json,
-    send_to_ollama
+    prompt_eval_stats,
+    send_to_ollama,
+    stream_from_ollama,
+    valid_command
 )
+from src.cache import IntentCache
+from src.commands import command_schema, help_lines, validate_command
+from src.credentials import ALLOWLIST_CAPACITY, CredentialStore
+from src.fleet import Fleet
+from src.runtime import ServoRuntime
+from src.voice import close_voice_session, voice_stats_report
 
 class LlmServoControl:
     """Manages the LLM-controlled motor application."""
     def __init__(self):
-        self.current_angle = cfg.MOTOR_INITIAL_ANGLE
-        self.arduino = ArduinoController(cfg.SERIAL_PORT, cfg.SERIAL_BAUDRATE)
+        self.fleet = Fleet.from_config()
+        # The default board, which also runs the RFID authentication
+        self.twin = self.fleet.default.twin
+        self.arduino = self.fleet.default.arduino
+        self.fast_path_stats = FastPathStats()
+        # The device selector is only offered to the LLM when there is a choice
+        self.devices = self.fleet.target_names() if len(self.fleet) > 1 else None
+        self.output_schema = command_schema(self.devices) if cfg.OLLAMA_STRUCTURED_OUTPUT else None
+        self.system_prompt = None
+        self.cache = IntentCache.from_config() if cfg.CACHE_ENABLED else None
+        self.planner = self._create_planner() if cfg.MOTION_STREAMING else None
+        self.credentials = CredentialStore.from_config()
+        self.allowlist_version = None # Credential store version the board's allowlist was built from
+        self.startup_seconds = None
+        if cfg.OLLAMA_SPLIT_PROMPT:
+            self.system_prompt = build_system_prompt(cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE, self.devices)
+
+    @staticmethod
+    def _create_planner():
+        """The trajectory planner for streamed motion, or None without NumPy."""
+        try:
+            # Imported here so NumPy is only needed for streaming
+            from src.trajectory import TrajectoryPlanner
+        except ImportError:
+            print("Motion streaming needs NumPy (pip install numpy); the firmware will run motions itself.")
+            return None
+        return TrajectoryPlanner.from_config()
 
     def setup(self):
-        """Initializes system checks and connections. Returns True on success."""
+        """
+        Initializes system checks and connections. Returns True on success.
+        The Ollama check and model preload run alongside the board
+        connections, so startup takes as long as the slower of the two.
+        """
+        metrics.start()
         print("Checking system dependencies...")
-        if not check_ollama_availability():
+        start_time = time.perf_counter()
+        timings = {}
+        def timed(name, func):
+            def run():
+                started = time.perf_counter()
+                try:
+                    return func()
+                finally:
+                    timings[name] = time.perf_counter() - started
+            return run
+
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as pool:
+            ollama_ready = pool.submit(timed("ollama", self._start_ollama))
+            boards_ready = pool.submit(timed("boards", self.fleet.connect))
+        ready = ollama_ready.result() and boards_ready.result()
+
+        if not ollama_ready.result():
             print("Exiting. Please start Ollama and try again.")
-            return False
-        
-        if not self.arduino.connect():
+        if not boards_ready.result():
             print("Failed to connect to Arduino. Exiting.")
+        if not ready:
+            get_ollama_client().close()
+            self.fleet.disconnect()
+            return False
+        if len(self.fleet) > 1:
+            print(f"Boards: {', '.join(self.fleet.names)} (default: {self.fleet.default.name})")
+
+        self.startup_seconds = time.perf_counter() - start_time
+        for name, seconds in timings.items():
+            metrics.observe("servo_startup_seconds", seconds, stage=name)
+        metrics.observe("servo_startup_seconds", self.startup_seconds, stage="total")
+        print(f"Ready in {self.startup_seconds:.2f}s "
+              f"(Ollama check and preload {timings['ollama']:.2f}s, boards {timings['boards']:.2f}s, in parallel)")
+        return True
+
+    def _start_ollama(self):
+        """Checks that Ollama is up and preloads the model. Returns False if it is not running."""
+        if not check_ollama_availability():
             return False
-            
+        ollama = get_ollama_client()
+        print(f"Preloading model {cfg.OLLAMA_MODEL}...")
+        ollama.preload()
+        ollama.start_rewarm(cfg.OLLAMA_REWARM_IDLE_SECONDS)
+        ollama.start_health_checks(cfg.OLLAMA_HEALTH_CHECK_SECONDS)
         return True
 
     def authenticate(self):
         """
         Handles the RFID authentication flow before starting the main app.
-        Returns True on success, False on failure/timeout.
+        With an allowlist loaded the board grants or denies a scan itself;
+        every decision is checked against the credential store here and
+        overridden if the two disagree. Returns True on success, False on
+        failure/timeout.
         """
         # Check if authentication is bypassed
         if cfg.BYPASS_RFID_AUTH:
@@ -43,165 +129,394 @@ class LlmServoControl:
             print("RFID authentication is disabled in config.")
             print("Proceeding directly to motor control...")
             # Still send auth success to Arduino for consistent LCD display
-            self.arduino.send_command(CMD_AUTH_SUCCESS)
-            time.sleep(2) # Give Arduino time to display the message
+            # The message stays up for a few seconds without blocking the Arduino
+            self.arduino.send_command(CMD_AUTH_SUCCESS, wait_done=True)
             return True
         
         print("\n--- Awaiting Authentication ---")
+        self.sync_allowlist()
         print("Please scan an authorized RFID card on the reader.")
         self.arduino.send_command(CMD_AWAIT_AUTH)
 
-        # Define the correct, full prefix the Arduino sends
-        auth_prefix = "Card detected for auth! UID:"
-
         while True: # Loop to allow multiple scan attempts
-            # Wait for the correct prefix
-            uid = self.arduino.wait_for_response(auth_prefix, timeout=60)
-
-            if uid is None:
+            scan = self.arduino.wait_for_auth_scan(cfg.AUTH_SCAN_TIMEOUT)
+            if scan is None:
                 print("\nAuthentication timed out. No card scanned.")
                 return False
 
-            uid_lower = uid.lower()
-
-            # --- DEBUGGING LINES ---
-            # print(f"DEBUG: Checking for UID: '{uid_lower}'")
-            # print(f"DEBUG: Available keys in config: {list(cfg.AUTHORIZED_UIDS.keys())}")
-            # --- END OF DEBUGGING LINES ---
-
-            if uid_lower in cfg.AUTHORIZED_UIDS:
-                user = cfg.AUTHORIZED_UIDS[uid_lower]
+            user = self.decide_scan(scan)
+            if user is not None:
                 print(f"Authentication successful! Welcome, {user}.")
-                self.arduino.send_command(CMD_AUTH_SUCCESS)
-                time.sleep(2) # Give Arduino time to display the message
                 return True
-            else:
-                print(f"Unauthorized card scanned (UID: {uid}). Please try again.")
-                self.arduino.send_command(CMD_AUTH_FAIL)
+            print(f"Unauthorized card scanned (UID: {scan[0]}). Please try again.")
+            self.sync_allowlist()
 
-    def get_llm_command(self, user_input):
+    def decide_scan(self, scan):
         """
-        Determines the target command from user input by querying the LLM.
+        Checks a (uid, board_decision, read_at) report from wait_for_auth_scan
+        against the credential store and overrides the board's decision when
+        the two disagree. Returns the card's user, or None if it is not authorized.
         """
+        # Timed from reading the board's report to the final decision,
+        # including the host's override when it sends one
+        uid, board_decision, start_time = scan
+        user = self.credentials.lookup(uid)
+        granted = user is not None
+        if board_decision == granted:
+            decided_by = "board" # Already shown on the board; nothing to send
+        else:
+            if board_decision is not None:
+                # A false match of the filter, or the store changed since the push
+                print(f"The board {'granted' if board_decision else 'denied'} card {uid}; overriding it.")
+                metrics.inc("servo_auth_overrides_total")
+            decided_by = "host"
+            self.arduino.send_command(CMD_AUTH_SUCCESS if granted else CMD_AUTH_FAIL, wait_done=granted)
+        metrics.observe("servo_auth_seconds", time.perf_counter() - start_time, decided_by=decided_by)
+        metrics.inc("servo_auth_decisions_total", result="granted" if granted else "denied",
+                    decided_by=decided_by)
+        return user
+
+    def sync_allowlist(self):
+        """
+        Pushes the credential store's hashed allowlist to the default board
+        (which runs the RFID authentication) if the store changed since the
+        last push, so the board can decide scans itself.
+        """
+        if not cfg.AUTH_ON_DEVICE:
+            return
+        self.credentials.refresh()
+        version = self.credentials.version
+        if version == self.allowlist_version:
+            return
+        allowlist = self.credentials.allowlist()
+        with metrics.span("allowlist_push", cards=len(self.credentials), withdrawn=allowlist is None):
+            pushed = self.arduino.send_allowlist(allowlist)
+        if pushed and allowlist is None:
+            self.allowlist_version = version
+            print(f"{len(self.credentials)} cards are more than the Arduino's allowlist holds "
+                  f"({ALLOWLIST_CAPACITY}); every scan is decided here.")
+        elif pushed:
+            self.allowlist_version = version
+            print(f"Allowlist of {len(self.credentials)} cards loaded on the Arduino "
+                  f"(~{self.credentials.false_match_rate():.2%} of unknown cards pass it; the host checks them).")
+        else:
+            print("Could not load the allowlist on the Arduino; every scan is decided here.")
+
+    def get_llm_command(self, user_input, on_command=None):
+        """
+        Determines the target command from user input.
+        Simple commands are handled by the rule-based parser; the LLM is only
+        queried when the parser is not confident.
+
+        If on_command is given it is called with the command as soon as it is
+        known, which in streaming mode is before the LLM finishes generating.
+
+        With several boards, a trailing selector ("... on rig 2") is split off
+        before the fast path and added to the command as its "device".
+
+        Requests the fast path misses are looked up in the intent cache
+        before the LLM is queried, and the LLM's answers are added to it.
+        """
+        start_time = time.perf_counter()
+        text, target = user_input, None
+        if len(self.fleet) > 1:
+            text, target = self.fleet.split_target(user_input)
+        # The angle the request is relative to is the one of the board it names
+        boards = self.fleet.select(target)
+        twin = boards[0].twin if len(boards) == 1 else self.twin
+
+        with metrics.span("fast_path") as span:
+            command_dict, confidence = parse_command_with_keywords(
+                text, twin.angle, cfg.MOTOR_MIN_ANGLE,
+                cfg.MOTOR_MAX_ANGLE, cfg.MOTOR_DEFAULT_STEP
+            )
+            span.set(confidence=round(confidence, 2))
+        if command_dict and confidence >= cfg.FAST_PATH_MIN_CONFIDENCE:
+            if target:
+                command_dict["device"] = target
+            self.fast_path_stats.record_hit(time.perf_counter() - start_time)
+            metrics.inc("servo_commands_total", path="fast")
+            print(f"Fast path matched (confidence {confidence:.2f}): {command_dict}")
+            if on_command:
+                on_command(command_dict)
+            return command_dict
+
+        vector = None
+        if self.cache:
+            with metrics.span("cache") as span:
+                command_dict, tier, vector = self.cache.lookup(text)
+                span.set(tier=tier)
+            command_dict = valid_command(command_dict) if command_dict else None
+            if command_dict:
+                if target and "device" not in command_dict:
+                    command_dict["device"] = target
+                metrics.inc("servo_commands_total", path="cache")
+                print(f"Intent cache hit ({tier}): {command_dict}")
+                if on_command:
+                    on_command(command_dict)
+                return command_dict
+
         print("Querying LLM for structured command...")
-        self.arduino.send_command(CMD_THINKING_START)
+        metrics.inc("servo_commands_total", path="llm")
+        # Leave the action on the LCD while the servo is still moving. Sent
+        # through the board's worker so it stays the only writer to its port.
+        for board in boards:
+            if not board.twin.is_busy():
+                board.submit(lambda arduino=board.arduino: arduino.send_command(CMD_THINKING_START))
+
+        angle = twin.angle # The LLM's answer is relative to this; the cache needs it too
+        with metrics.span("prompt_build"):
+            prompt = build_llm_prompt(
+                user_input, angle, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE,
+                split=cfg.OLLAMA_SPLIT_PROMPT, devices=self.devices
+            )
 
-        prompt = build_llm_prompt(
-            user_input, self.current_angle, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE
-        )
-        llm_response_text = send_to_ollama(prompt, cfg.OLLAMA_API_URL, cfg.OLLAMA_MODEL)
+        if cfg.OLLAMA_STREAM:
+            dispatched = []
+            def dispatch(command_obj):
+                if target and "device" not in command_obj:
+                    command_obj["device"] = target
+                print(f"LLM suggests command: {command_obj}")
+                dispatched.append(command_obj)
+                if on_command:
+                    on_command(command_obj)
+
+            with metrics.span("llm", stream=True) as span:
+                llm_response_text, timing = stream_from_ollama(
+                    prompt, cfg.OLLAMA_API_URL, cfg.OLLAMA_MODEL, on_command=dispatch,
+                    system_prompt=self.system_prompt, schema=self.output_schema
+                )
+                span.set(**{f"{key}_ms": round(value * 1000, 1) for key, value in timing.items()
+                            if key in ("first_token", "dispatch") and value is not None})
+            self.fast_path_stats.record_llm(time.perf_counter() - start_time)
+            print(f"LLM timing: {format_timing(timing)}")
+            if dispatched:
+                self.remember(text, dispatched[0], target, angle, vector)
+                return dispatched[0]
+        else:
+            with metrics.span("llm", stream=False):
+                llm_response_text = send_to_ollama(
+                    prompt, cfg.OLLAMA_API_URL, cfg.OLLAMA_MODEL, system_prompt=self.system_prompt,
+                    schema=self.output_schema
+                )
+            self.fast_path_stats.record_llm(time.perf_counter() - start_time)
 
         if llm_response_text:
-            return parse_llm_response_to_json(llm_response_text)
+            with metrics.span("parse"):
+                command_dict = parse_llm_response_to_json(llm_response_text)
+            if command_dict and target and "device" not in command_dict:
+                command_dict["device"] = target
+            if command_dict and on_command:
+                on_command(command_dict)
+            if command_dict:
+                # After the dispatch, which is what the user is waiting for
+                self.remember(text, command_dict, target, angle, vector)
+            return command_dict
         
         print("LLM failed or did not provide a valid command.")
         return None
+
+    def remember(self, text, command_dict, target, angle, vector=None):
+        """
+        Adds an LLM answer to a request made at angle to the intent cache.
+        The device the request named is left out, so the entry also serves
+        the same request for another board. Answers the validator rejects
+        are not cached.
+        """
+        command_dict = validate_command(command_dict)[0] if self.cache else None
+        if command_dict is None:
+            return
+        if target and command_dict.get("device") == target:
+            command_dict = {key: value for key, value in command_dict.items() if key != "device"}
+        self.cache.store(text, command_dict, angle, vector)
+
+    @property
+    def current_angle(self):
+        """The angle the motor will be at once every sent command has finished."""
+        return self.twin.angle
+
+    @current_angle.setter
+    def current_angle(self, angle):
+        self.twin.angle = angle
+
+    def resolve_command(self, command_dict, start_angle, twin=None):
+        """
+        Turns ADJUST into an absolute GOTO, including inside a SEQUENCE, where
+        the twin supplies the running angle after each step.
+        """
+        cmd = command_dict.get("command")
+
+        # Pre-process ADJUST command into a GOTO command
+        if cmd == "ADJUST":
+            degrees = command_dict.get("degrees", 0)
+            target_angle = start_angle + degrees
+            # Clamp the angle to the valid range
+            clamped_angle = max(cfg.MOTOR_MIN_ANGLE, min(cfg.MOTOR_MAX_ANGLE, target_angle))
+            # Mutate the command to a simple GOTO for the Arduino
+            return {"command": "GOTO", "angle": clamped_angle}
+
+        if cmd == "SEQUENCE":
+            angle = start_angle
+            steps = []
+            for step in command_dict.get("steps", []):
+                step = self.resolve_command(step, angle, twin)
+                angle = (twin or self.twin).predict(step, angle).end_angle
+                steps.append(step)
+            return {"command": "SEQUENCE", "steps": steps}
+
+        return command_dict
+
+    def execute_command(self, command_dict, wait=True):
+        """
+        Sends a parsed command to the board(s) its "device" selects (the
+        default board when it has none). Each board runs it on its own
+        worker, so boards move in parallel. Returns True if every board
+        succeeded, or the futures when wait is False.
+
+        The command is validated first: out-of-range values are clamped and
+        a command the firmware cannot run is refused (returns False) before
+        anything is written to a port.
+        """
+        command_dict = valid_command(command_dict)
+        if command_dict is None:
+            return False
+        target = command_dict.get("device")
+        boards = self.fleet.select(target)
+        if not boards:
+            print(f"Unknown device '{target}'. Known: {', '.join(self.fleet.target_names())}")
+            return False
+        command_dict = {key: value for key, value in command_dict.items() if key != "device"}
+        results = self.fleet.run(boards, functools.partial(self.execute_on_board, command_dict=command_dict), wait)
+        return results if not wait else all(results)
+
+    def execute_on_board(self, board, command_dict):
+        """
+        Sends a command to one board and updates that board's angle state.
+        ADJUST is resolved here into an absolute GOTO and a SEQUENCE is sent
+        as one batched message. With motion streaming the command is planned
+        into a trajectory here and streamed as setpoints instead. The twin
+        predicts the end angle and duration; the Arduino's DONE report is
+        checked against it. Returns True on success.
+        """
+        twin, arduino = board.twin, board.arduino
+        tag = f"[{board.name}] " if len(self.fleet) > 1 else ""
+        cmd = command_dict.get("command")
+        resolved = self.resolve_command(command_dict, twin.angle, twin)
+        if resolved != command_dict:
+            print(f"{tag}Translated {cmd} to: {resolved}")
+
+        previous_angle = twin.angle
+        trajectory = None
+        if self.planner and arduino.stream_chunk:
+            with metrics.span("plan", command=cmd):
+                trajectory = self.planner.plan(resolved, twin.angle)
+        prediction = twin.commit(resolved, trajectory.prediction() if trajectory else None)
+        print(f"{tag}Expected: end at {prediction.end_angle} deg in {prediction.seconds:.1f}s")
+
+        # Send the final command to Arduino
+        done_timeout = prediction.max_seconds + cfg.SERIAL_DONE_TIMEOUT
+        with metrics.span("execute", command=cmd, board=board.name) as span:
+            if trajectory:
+                sent = arduino.send_trajectory(trajectory.setpoints, done_timeout=done_timeout)
+            else:
+                sent = arduino.send_json_command(resolved, done_timeout=done_timeout)
+            span.set(ok=sent, streamed=trajectory is not None)
+        if sent:
+            if arduino.last_reported_angle is not None:
+                # The Arduino reported where the motion actually ended
+                twin.observe(arduino.last_reported_angle, prediction)
+                print(f"{tag}Command '{cmd}' complete. Motor angle: {twin.angle}")
+            else:
+                print(f"{tag}Command '{cmd}' sent. New assumed angle: {twin.angle}")
+            return True
+
+        print(f"{tag}Failed to send command to Arduino. Angle not updated.")
+        metrics.inc("servo_command_failures_total", command=cmd)
+        twin.reset(previous_angle)
+        arduino.send_command(CMD_IDLE_STATE)
+        return False
     
     def display_command_help(self):
-        """Prints a formatted help screen with available commands and examples."""
-        # ... (This function remains unchanged)
+        """Prints a formatted help screen generated from the command registry."""
         print("\n--- Available Commands & Examples ---")
         print("The AI can interpret a wide range of natural language phrases.")
         print("Here are the primary actions it can perform:\n")
         
-        commands = [
-            {"name": "GOTO", "desc": "Move to a specific angle.", "example": "'set to 45 degrees', 'go to 180'"},
-            {"name": "ADJUST", "desc": "Turn by a relative amount.", "example": "'turn a little to the right', 'move left by 20 deg'"},
-            {"name": "SPIN", "desc": "Rotate back and forth rapidly.", "example": "'spin around a few times', 'do a spin'"},
-            {"name": "SWEEP", "desc": "Scan smoothly side-to-side.", "example": "'sweep the area', 'look around'"},
-            {"name": "NOD", "desc": "Perform a 'yes' motion.", "example": "'nod your head', 'nod yes twice'"},
-            {"name": "SHAKE", "desc": "Perform a chaotic 'no' motion.", "example": "'shake your head no', 'shake it'"},
-        ]
-        
-        # Using f-strings for nice alignment
-        for cmd in commands:
-            print(f"  - {cmd['name']:<7} : {cmd['desc']:<35} e.g., {cmd['example']}")
-            
+        for line in help_lines():
+            print(line)
+
+        if len(self.fleet) > 1:
+            print(f"\nEnd a command with 'on <board>' to pick a board ({', '.join(self.fleet.names)}),")
+            print("a group, or 'on all' / 'everywhere' for every board, e.g. 'nod twice on rig 2'.")
+
         print("\n--- Special Keywords ---")
         print("  - speech  : Activate voice command mode.")
+        print("  - listen  : Toggle hands-free listening (voice commands at any time).")
         print("  - reset   : Reset the motor and the Arduino's display.")
+        print("  - stats   : Show fast-path and prompt evaluation statistics.")
         print("  - exit    : Shut down the system gracefully.")
         print("  - commands: Display this help message.")
         print("-" * 37 + "\n")
 
+    def reset(self):
+        """Resets every motor and display to their defaults."""
+        print("System resetting. Motor returning to default.")
+        def reset_board(board):
+            board.arduino.send_command(CMD_RESET_STATE)
+            board.twin.reset(cfg.MOTOR_INITIAL_ANGLE)
+        self.fleet.broadcast(reset_board)
+        print(f"Angle state reset to: {self.current_angle}")
+
+    def idle(self):
+        """Returns every board's display to idle once its queued motions are done."""
+        self.fleet.broadcast(lambda board: board.arduino.send_command(CMD_IDLE_STATE), wait=False)
+
+    def shutdown_device(self):
+        """Tells every Arduino to run its shutdown sequence, after its queued motions."""
+        self.fleet.broadcast(lambda board: board.arduino.send_command(CMD_SHUTDOWN, wait_done=True))
+
+    def print_stats(self):
+        print(self.fast_path_stats.report())
+        if self.cache:
+            stats = self.fast_path_stats
+            print(self.cache.stats.report(stats.llm_seconds / stats.llm_calls if stats.llm_calls else 0.0))
+        print(prompt_eval_stats.report())
+        voice_report = voice_stats_report()
+        if voice_report:
+            print(voice_report)
+
     def run(self):
-        """The main application loop for user interaction."""
+        """Runs the event-driven main loop until the user exits."""
         print("\nMotor Control CLI. Type 'speech' for voice, 'reset' for default, 'help' for list of commands or 'exit' to quit.")
         print(f"Current motor angle assumed to be: {self.current_angle}")
+        asyncio.run(ServoRuntime(self).run())
 
-        while True:
-            # ... (The rest of this function remains unchanged)
-            mode_input = input("You: ").strip()
-
-            if mode_input.lower() == 'speech':
-                user_input = listen_for_voice_command_google()
-            else:
-                user_input = mode_input
-
-            if not user_input:
-                print("No valid command received. Please try again.")
-                continue
-            
-            if user_input.lower() == 'exit':
-                self.arduino.send_command(CMD_SHUTDOWN)
-                time.sleep(1) # Give it a moment
-                break
+    def serve(self):
+        """Serves the command pipeline over HTTP (src/server.py) until interrupted."""
+        # Imported here so the CLI does not need Flask
+        from src.server import ServoServer
+        print(f"Current motor angle assumed to be: {self.current_angle}")
+        ServoServer(self).serve_forever()
 
-            if user_input.lower() == 'reset':
-                print("System resetting. Motor returning to default.")
-                self.arduino.send_command(CMD_RESET_STATE)
-                self.current_angle = cfg.MOTOR_INITIAL_ANGLE
-                print(f"Angle state reset to: {self.current_angle}")
-                continue
-
-            if user_input.lower() == 'help':
-                self.display_command_help()
-                continue
-
-            command_dict = self.get_llm_command(user_input)
-
-            if command_dict and "command" in command_dict:
-                cmd = command_dict.get("command")
-
-                # Python-side logic to handle state changes
-                new_angle = None
-                
-                # Pre-process ADJUST command into a GOTO command
-                if cmd == "ADJUST":
-                    degrees = command_dict.get("degrees", 0)
-                    target_angle = self.current_angle + degrees
-                    # Clamp the angle to the valid range
-                    clamped_angle = max(cfg.MOTOR_MIN_ANGLE, min(cfg.MOTOR_MAX_ANGLE, target_angle))
-                    # Mutate the command to a simple GOTO for the Arduino
-                    command_dict = {"command": "GOTO", "angle": clamped_angle}
-                    print(f"Translated ADJUST to GOTO: {command_dict}")
-
-                # Update local angle state if it's a command that sets a final angle
-                if command_dict.get("command") == "GOTO":
-                    new_angle = command_dict.get("angle")
-
-                # Send the final command to Arduino
-                if self.arduino.send_json_command(command_dict):
-                    if new_angle is not None:
-                        self.current_angle = new_angle
-                        print(f"Motor command sent. New assumed angle: {self.current_angle}")
-                    else: # For commands like SPIN or SWEEP that return to start
-                        print(f"Sequence command '{cmd}' sent. Angle remains: {self.current_angle}")
-                else:
-                    print("Failed to send command to Arduino. Angle not updated.")
-                    self.arduino.send_command(CMD_IDLE_STATE)
-            else:
-                print("AI could not determine a valid action. Please try rephrasing.")
-                self.arduino.send_command(CMD_IDLE_STATE)
-                
     def shutdown(self):
         """Properly closes resources."""
-        self.arduino.disconnect()
+        self.print_stats()
+        if self.cache:
+            self.cache.close()
+        get_ollama_client().close()
+        metrics.stop()
+        close_voice_session()
+        self.fleet.disconnect()
         print("Program finished.")
 
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control the servo with natural language.")
+    parser.add_argument("--serve", action="store_true",
+                        help="serve the command pipeline over HTTP instead of the interactive CLI")
+    args = parser.parse_args()
+
     app = LlmServoControl()
     
     if app.setup():
@@ -226,11 +541,14 @@ if __name__ == "__main__":
 
         if app.authenticate():
             try:
-                app.run()
+                if args.serve:
+                    app.serve()
+                else:
+                    app.run()
             except KeyboardInterrupt:
                 print("\nExiting due to user interruption...")
             finally:
                 app.shutdown()
         else:
             print("Authentication failed. Shutting down.")
-            app.shutdown()
\ No newline at end of file
+            app.shutdown()
@@ -1,7 +1,10 @@
 import serial
 import time
-import json
+import threading
+from collections import deque, namedtuple
 import src.config as cfg
+import src.metrics as metrics
+from src.commands import COMMANDS_BY_NAME, MAX_SEQUENCE_STEPS, motion_opcodes
 
 CMD_THINKING_START = "THINKING_START"
 CMD_IDLE_STATE = "IDLE_STATE"
@@ -10,50 +13,282 @@ CMD_SHUTDOWN = "SHUTDOWN_CMD"
 CMD_AWAIT_AUTH = "AWAIT_AUTH_CMD"
 CMD_AUTH_SUCCESS = "AUTH_SUCCESS_CMD"
 CMD_AUTH_FAIL = "AUTH_FAIL_CMD"
+CMD_STOP_MOTION = "STOP_MOTION"
+
+# The first line the firmware prints at the end of setup()
+READY_LINE = "Arduino Ready"
+
+# Reports of a card scanned during authentication: left for the host to
+# decide, or already granted or denied by the board's allowlist
+AUTH_SCAN_PREFIX = "Card detected for auth! UID:"
+AUTH_GRANTED_PREFIX = "Auth granted! UID:"
+AUTH_DENIED_PREFIX = "Auth denied! UID:"
+
+# --- Framed serial protocol ---
+# Host -> Arduino:  !<seq><op>[arg,arg...]*<checksum>
+# Arduino -> Host:  @<seq><kind>[value]*<checksum>
+# seq is a two-digit hex sequence number (01-FF, 00 is never used), op is a
+# single opcode character (see serial_protocol.h) and checksum is the two-digit hex XOR of every
+# character between the start marker and '*'. The Arduino answers each frame
+# with an ACK as soon as it is parsed and a DONE carrying the final angle once
+# the action has finished. A repeated sequence number is ACKed again but not
+# executed twice, so a frame can be re-sent safely when an ACK is lost.
+# The host numbers frames from 01 on each connection, so it starts with a
+# sync frame (!<seq>Y): a board that did not reset when the port opened
+# would otherwise take a first frame reusing its last seq for a repeat.
+FRAME_START = "!"
+REPLY_START = "@"
+REPLY_ACK = "A"
+REPLY_DONE = "D"
+REPLY_NAK = "N"
+SYNC_OPCODE = "Y"
+
+CONTROL_OPCODES = {
+    CMD_THINKING_START: "T",
+    CMD_IDLE_STATE: "I",
+    CMD_RESET_STATE: "R",
+    CMD_SHUTDOWN: "X",
+    CMD_AWAIT_AUTH: "U",
+    CMD_AUTH_SUCCESS: "S",
+    CMD_AUTH_FAIL: "F",
+    CMD_STOP_MOTION: "Z",
+}
+
+# Motion command -> (opcode, parameter name), from the command registry in
+# src/commands.py. Missing parameters are left out of the frame and the
+# firmware applies its own default.
+MOTION_OPCODES = motion_opcodes()
+
+# A SEQUENCE is sent as one frame whose args are "<opcode><value>" steps,
+# e.g. !07QN2,W,G45*xx. The firmware queues and runs them in order and sends
+# a single DONE after the last one (at most MAX_SEQUENCE_STEPS).
+SEQUENCE_OPCODE = COMMANDS_BY_NAME["SEQUENCE"].opcode
+
+# --- Setpoint streaming ---
+# A trajectory planned on the host (src/trajectory.py) is sent as setpoints
+# the firmware buffers and plays back, one every STREAM_PERIOD_MS:
+#   !<seq>J<first>,<deltas>,<flags>*<checksum>
+# first is the frame's first setpoint in degrees. Every later one is a single
+# character: its change from the setpoint before, offset from
+# STREAM_DELTA_ZERO ('O' no change, 'P' +1, 'N' -1...), so a frame carries
+# about one byte per setpoint. flags marks the first frame of a stream and the
+# last one, whose DONE arrives once the board has played every setpoint.
+# Mirrors servo_actions.h.
+STREAM_OPCODE = "J"
+STREAM_PERIOD_MS = 20
+STREAM_BUFFER_SIZE = 128
+STREAM_DELTA_ZERO = "O"
+STREAM_MAX_DELTA = 31
+STREAM_FIRST = 1
+STREAM_LAST = 2
+# The firmware reads lines of up to 95 characters (SERIAL_LINE_MAX), which
+# fits 83 setpoints per frame.
+STREAM_MAX_CHUNK = 80
+
+# The board's allowlist of authorized cards (src/credentials.py) is written
+# in parts, !<seq>L<offset>,<hex bytes>*<checksum>. Offset 0 starts a new
+# list, and the board uses it once the last byte has been written.
+ALLOWLIST_OPCODE = "L"
+ALLOWLIST_CHUNK = 32 # Bytes per frame
+
+Frame = namedtuple("Frame", ["seq", "kind", "args"])
+
+
+def frame_checksum(body):
+    checksum = 0
+    for char in body.encode("ascii"):
+        checksum ^= char
+    return checksum
+
+def encode_frame(seq, op, args=(), start=FRAME_START):
+    """Encodes one frame as bytes, including the trailing newline."""
+    body = f"{seq:02X}{op}{','.join(str(a) for a in args)}"
+    return f"{start}{body}*{frame_checksum(body):02X}\n".encode("ascii")
+
+def decode_frame(line):
+    """
+    Decodes a frame or reply line. Returns a Frame, or None if the line is not
+    a frame or its checksum does not match. Numeric args are returned as ints,
+    sequence steps as strings.
+    """
+    line = line.strip()
+    if len(line) < 7 or line[0] not in (FRAME_START, REPLY_START):
+        return None
+    body, sep, checksum = line[1:].rpartition("*")
+    if not sep or len(body) < 3:
+        return None
+    try:
+        if int(checksum, 16) != frame_checksum(body):
+            return None
+        seq = int(body[:2], 16)
+        args = tuple(int(a) if a.lstrip("-").isdigit() else a
+                     for a in body[3:].split(",")) if body[3:] else ()
+    except ValueError:
+        return None
+    return Frame(seq, body[2], args)
+
+def command_to_frame(command_dict):
+    """
+    Converts a motion command dict into (opcode, args).
+    Raises ValueError for commands the firmware does not understand.
+    """
+    command = command_dict.get("command")
+    if command == "SEQUENCE":
+        steps = command_dict.get("steps") or []
+        if not 0 < len(steps) <= MAX_SEQUENCE_STEPS:
+            raise ValueError(f"A sequence needs 1-{MAX_SEQUENCE_STEPS} steps")
+        encoded = []
+        for step in steps:
+            op, args = command_to_frame(step)
+            if op == SEQUENCE_OPCODE:
+                raise ValueError("Sequences cannot be nested")
+            encoded.append(f"{op}{args[0] if args else ''}")
+        return SEQUENCE_OPCODE, tuple(encoded)
+    if command not in MOTION_OPCODES:
+        raise ValueError(f"No opcode for command: {command}")
+    op, param = MOTION_OPCODES[command]
+    value = command_dict.get(param)
+    if value is None:
+        if command == "GOTO":
+            raise ValueError("GOTO requires an angle")
+        return op, ()
+    return op, (int(value),)
+
+def encode_setpoints(setpoints, flags):
+    """
+    Encodes one chunk of setpoints as a stream frame's args.
+    Raises ValueError if two neighbours differ by more than STREAM_MAX_DELTA.
+    """
+    setpoints = [int(a) for a in setpoints]
+    deltas = []
+    for before, after in zip(setpoints, setpoints[1:]):
+        if abs(after - before) > STREAM_MAX_DELTA:
+            raise ValueError(f"Setpoint step {before} -> {after} is larger than {STREAM_MAX_DELTA} deg")
+        deltas.append(chr(ord(STREAM_DELTA_ZERO) + after - before))
+    return setpoints[0], "".join(deltas), flags
+
+def decode_setpoints(payload):
+    """
+    Decodes a stream frame's payload text (after the opcode) into
+    (setpoints, flags). Returns None if it is malformed.
+    """
+    first, sep, rest = payload.partition(",")
+    deltas, sep2, flags = rest.rpartition(",")
+    try:
+        angle, flags = int(first), int(flags)
+    except ValueError:
+        return None
+    if not sep or not sep2:
+        return None
+    setpoints = [angle]
+    for char in deltas:
+        delta = ord(char) - ord(STREAM_DELTA_ZERO)
+        if abs(delta) > STREAM_MAX_DELTA:
+            return None
+        setpoints.append(setpoints[-1] + delta)
+    return setpoints, flags
+
+def stream_bytes_per_second(chunk):
+    """Serial bytes per second a stream sent in frames of chunk setpoints needs."""
+    frame = encode_frame(0xFF, STREAM_OPCODE, (180, STREAM_DELTA_ZERO * (chunk - 1), STREAM_FIRST))
+    return len(frame) * 1000 / (chunk * STREAM_PERIOD_MS)
+
+def stream_chunk_size(baudrate):
+    """
+    Setpoints per stream frame: cfg.STREAM_CHUNK_SETPOINTS, or more if that
+    would take more than cfg.STREAM_BANDWIDTH_SHARE of the line (larger
+    frames spend fewer bytes on framing). None if even the largest frame
+    does not fit the budget.
+    """
+    budget = baudrate / 10 * cfg.STREAM_BANDWIDTH_SHARE # 8N1: 10 bits per byte
+    for chunk in range(max(2, min(cfg.STREAM_CHUNK_SETPOINTS, STREAM_MAX_CHUNK)), STREAM_MAX_CHUNK + 1):
+        if stream_bytes_per_second(chunk) <= budget:
+            return chunk
+    return None
 
 
 class ArduinoController:
     """
     Manages serial communication with the Arduino.
-    Can operate in a 'mock' mode for testing without hardware.
+    In mock mode the port is attached to a Python emulator of the firmware
+    (src/emulator.py) instead of hardware, and everything else runs the same.
     """
-    def __init__(self, port, baudrate, initial_wait_time=2):
+    def __init__(self, port, baudrate, ready_timeout=None):
         self.port = port
         self.baudrate = baudrate
-        self.initial_wait_time = initial_wait_time
+        self.ready_timeout = cfg.SERIAL_READY_TIMEOUT if ready_timeout is None else ready_timeout
         self.ser = None
 
+        # Line routing. When an external reader (the async runtime) owns the
+        # serial port, every line it reads is passed to route_line() and
+        # wait_for_response() waits on the inbox instead of reading itself.
+        self.external_reader = False
+        self._line_handlers = []
+        self._inbox = deque(maxlen=50)
+        self._inbox_cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._seq = 0
+        self.last_reported_angle = None
+        self.stream_chunk = stream_chunk_size(baudrate)
+
         self.mock_mode = cfg.USE_MOCK_ARDUINO
-        self._is_mock_connected = False # State for the mock connection
+        self.emulator = None
         if self.mock_mode:
             print("-" * 50)
             print("--- ARDUINO CONTROLLER IS IN MOCK MODE ---")
-            print("--- No hardware connection will be attempted. ---")
+            print("--- Using the firmware emulator, no hardware. ---")
             print("-" * 50)
     
     def connect(self):
-        """Establishes the serial connection or simulates it if in mock mode."""
+        """Establishes the serial connection, or attaches the emulator in mock mode."""
         if self.mock_mode:
-            print(f"MOCK: Simulating connection to Arduino on {self.port}...")
-            self._is_mock_connected = True
-            time.sleep(0.5) # Simulate a small delay
-            print("MOCK: Connection successful.")
+            # Imported here since the emulator itself builds on this module
+            from src.emulator import EmulatedSerial, create_emulator
+            self.emulator = create_emulator().start()
+            self.ser = EmulatedSerial(self.emulator)
+            print(f"MOCK: Firmware emulator attached (time scale {cfg.MOCK_TIME_SCALE or 'instant'}).")
+            self._wait_until_ready()
+            self._clear_initial_buffer()
+            self._sync_seq()
             return True
 
         try:
             self.ser = serial.Serial(self.port, self.baudrate, timeout=1)
             print(f"Connected to Arduino on {self.port}")
-            time.sleep(self.initial_wait_time) # Wait for Arduino to reset
+            self._wait_until_ready()
             self._clear_initial_buffer()
+            self._sync_seq()
             return True
         except serial.SerialException as e:
             print(f"Error opening serial port {self.port}: {e}")
             self.ser = None
             return False
-        
+
+    def _wait_until_ready(self):
+        """
+        Waits for the firmware's ready line while the board resets, instead
+        of sleeping for a fixed time. Returns True if it arrived in time.
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + self.ready_timeout
+        timeout, self.ser.timeout = self.ser.timeout, 0.1 # Short reads, so the deadline is kept
+        try:
+            while time.perf_counter() < deadline:
+                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+                if line:
+                    print(f"Arduino (init): {line}")
+                if line.startswith(READY_LINE):
+                    print(f"Arduino ready after {time.perf_counter() - start_time:.2f}s")
+                    return True
+        finally:
+            self.ser.timeout = timeout
+        print(f"No ready line from the Arduino within {self.ready_timeout}s; continuing "
+              f"(the board may not reset when the port opens).")
+        return False
+
     def _clear_initial_buffer(self):
         """Clears any startup messages from the Arduino buffer."""
-        if not self.is_connected() or self.mock_mode:
+        if not self.is_connected():
             return
         time.sleep(0.1)
         while self.ser.in_waiting > 0:
@@ -62,154 +297,282 @@ class ArduinoController:
                     print(f"Arduino (init): {init_msg}")
 
     def is_connected(self):
-        """Checks if the serial connection is active or if mock connection is up."""
-        if self.mock_mode:
-            return self._is_mock_connected
-        
-        return self.ser and self.ser.is_open
+        """Checks if the serial connection (or the emulator's port) is open."""
+        return bool(self.ser and self.ser.is_open)
 
-    def send_command(self, command_str):
-        """Sends a generic command string or simulates it."""
+    def send_command(self, command_str, wait_done=False):
+        """
+        Sends one of the control commands as a frame and waits for its ACK,
+        or for its DONE when wait_done is set.
+        """
         if not self.is_connected():
             print("Cannot send command: Arduino not connected.")
             return False
-        
-        if self.mock_mode:
-            print(f"MOCK: Sending control command to Arduino: {command_str}")
-            print("MOCK Arduino: OK") 
-            return True
 
+        op = CONTROL_OPCODES.get(command_str.strip())
+        if op is None:
+            print(f"Unknown control command: {command_str}")
+            return False
+        return self._transact(op, (), wait_done)
+
+    def _sync_seq(self):
+        """Tells the board a new connection starts at this seq, see SYNC_OPCODE."""
+        self._seq = 0
+        return self._transact(SYNC_OPCODE, (), False)
+
+    def _next_seq(self):
+        self._seq = self._seq % 255 + 1
+        return self._seq
+
+    def _transact(self, op, args, wait_done, done_timeout=None):
+        """
+        Sends a frame, re-sending it once if the ACK does not arrive, then
+        optionally waits for DONE. Returns True on success.
+        """
+        self.last_reported_angle = None
         try:
-            # print(f"Sending control command to Arduino: {command_str}") # Less verbose for this one
-            self.ser.write(f"{command_str.strip()}\n".encode('utf-8'))
-            time.sleep(0.05)
-            # No response read here, it's a fire-and-forget command
-            return True
+            with self._write_lock:
+                seq = self._next_seq()
+                frame = encode_frame(seq, op, args)
+                with metrics.span("serial_write", op=op, bytes=len(frame)):
+                    self.ser.write(frame)
+            sent_at = time.perf_counter()
+            metrics.inc("serial_frames_sent_total", op=op)
+            metrics.inc("serial_bytes_sent_total", len(frame))
+            ack = self._wait_for_reply(seq, (REPLY_ACK, REPLY_NAK), cfg.SERIAL_ACK_TIMEOUT)
+            if ack is None:
+                metrics.inc("serial_resends_total")
+                with self._write_lock:
+                    self.ser.write(frame) # Same seq, so it is not executed twice
+                metrics.inc("serial_bytes_sent_total", len(frame))
+                ack = self._wait_for_reply(seq, (REPLY_ACK, REPLY_NAK), cfg.SERIAL_ACK_TIMEOUT)
         except serial.SerialException as e:
-            print(f"Error writing control command to Arduino: {e}")
+            print(f"Error writing command to Arduino: {e}")
+            metrics.inc("serial_errors_total")
+            return False
+
+        if ack is None:
+            print(f"No ACK from Arduino for frame {frame.decode().strip()}")
+            metrics.inc("serial_ack_timeouts_total")
             return False
+        metrics.observe("serial_roundtrip_seconds", time.perf_counter() - sent_at, reply="ack")
+        if ack.kind == REPLY_NAK:
+            print(f"Arduino rejected frame {frame.decode().strip()}")
+            metrics.inc("serial_naks_total")
+            return False
+        if not wait_done:
+            return True
+
+        done = self._wait_for_reply(seq, (REPLY_DONE,), done_timeout or cfg.SERIAL_DONE_TIMEOUT)
+        if done is None:
+            print("Timed out waiting for the Arduino to finish the action.")
+            metrics.inc("serial_done_timeouts_total")
+            return False
+        metrics.observe("serial_roundtrip_seconds", time.perf_counter() - sent_at, reply="done")
+        if done.args:
+            self.last_reported_angle = done.args[0]
+        return True
+
+    def _wait_for_reply(self, seq, kinds, timeout):
+        """Waits for a reply frame with the given seq and one of the given kinds."""
+        def match(line):
+            frame = decode_frame(line)
+            return frame is not None and frame.seq == seq and frame.kind in kinds
+        line = self._wait_for_line(match, timeout)
+        return decode_frame(line) if line else None
+
+    def add_line_handler(self, prefix, callback):
+        """Registers callback(line) for every routed line starting with prefix."""
+        self._line_handlers.append((prefix, callback))
+
+    def read_line(self):
+        """
+        Blocks for up to the serial timeout (1s) for one line from the Arduino.
+        Returns the stripped line, or None if nothing arrived.
+        """
+        if not self.is_connected():
+            time.sleep(0.1)
+            return None
+        try:
+            raw = self.ser.readline()
+        except serial.SerialException as e:
+            print(f"Error reading from Arduino: {e}")
+            return None
+        if raw:
+            metrics.inc("serial_bytes_received_total", len(raw))
+        line = raw.decode('utf-8', errors='ignore').strip()
+        return line or None
+
+    def route_line(self, line):
+        """
+        Stores a line for wait_for_response() and passes it to matching
+        handlers. Returns True if at least one handler took it.
+        """
+        with self._inbox_cond:
+            self._inbox.append(line)
+            self._inbox_cond.notify_all()
+        # Protocol replies are consumed by whoever is waiting on them
+        handled = line.startswith(REPLY_START)
+        for prefix, callback in self._line_handlers:
+            if line.startswith(prefix):
+                callback(line)
+                handled = True
+        return handled
+
+    def _take_from_inbox(self, match, timeout):
+        """Waits for a routed line for which match(line) is true and removes it."""
+        deadline = time.monotonic() + timeout
+        with self._inbox_cond:
+            while True:
+                for line in self._inbox:
+                    if match(line):
+                        self._inbox.remove(line)
+                        return line
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._inbox_cond.wait(remaining)
+
+    def _wait_for_line(self, match, timeout):
+        """
+        Returns the first line for which match(line) is true, or None on
+        timeout. Reads the port itself unless an external reader owns it.
+        """
+        if self.external_reader:
+            return self._take_from_inbox(match, timeout)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._take_from_inbox(match, 0)
+            if line is not None:
+                return line
+            if time.monotonic() >= deadline:
+                return None
+            line = self.read_line()
+            if line and not self.route_line(line):
+                print(f"Arduino: {line}")
 
     def wait_for_response(self, prefix, timeout=30):
         """
         Waits for a specific response line from the Arduino.
         Returns the data part of the response, or None on timeout.
-        
-        In mock mode, this method can simulate different RFID scenarios:
-        - If BYPASS_RFID_AUTH is True, it returns a valid UID immediately
-        - If BYPASS_RFID_AUTH is False, it can simulate various auth scenarios
         """
         if not self.is_connected():
             return None
 
-        if self.mock_mode:
-            print("MOCK: Waiting for response...")
-            
-            # If we're in mock mode but NOT bypassing RFID, simulate the full auth process
-            if not cfg.BYPASS_RFID_AUTH and prefix == "Card detected for auth! UID:":
-                return self._simulate_rfid_auth_scenarios()
-            
-            # For non-RFID responses or when bypassing RFID, return success
-            time.sleep(1)
-            if prefix == "Card detected for auth! UID:":
-                # Return a valid UID for successful auth
-                mock_uid = next(iter(cfg.AUTHORIZED_UIDS))
-                print(f"MOCK Arduino: {prefix}{mock_uid}")
-                return mock_uid
-            else:
-                # For other types of responses, return a generic success
-                print(f"MOCK Arduino: {prefix}SUCCESS")
-                return "SUCCESS"
-
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if self.ser.in_waiting > 0:
-                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                if line.startswith(prefix):
-                    print(f"Arduino response received: {line}")
-                    return line[len(prefix):].strip()
-            time.sleep(0.1) # Don't spam the CPU
-        
-        print("Timed out waiting for Arduino response.")
-        return None
+        line = self._wait_for_line(lambda l: l.startswith(prefix), timeout)
+        if line is None:
+            print("Timed out waiting for Arduino response.")
+            return None
+        print(f"Arduino response received: {line}")
+        return line[len(prefix):].strip()
 
-    def _simulate_rfid_auth_scenarios(self):
+    def wait_for_auth_scan(self, timeout):
         """
-        Simulates different RFID authentication scenarios for testing.
-        This allows testing the full authentication flow even in mock mode.
+        Waits for the board to report a card scanned for authentication.
+        Returns (uid, decision, read_at): decision is True or False when the
+        board decided with its allowlist, None when it left it to the host,
+        and read_at is the time.perf_counter() the report was read at.
+        Returns None on timeout.
         """
-        print("MOCK: Simulating RFID card scan scenarios...")
-        print("MOCK: Options - (1) Valid card, (2) Invalid card, (3) Timeout")
-        print("MOCK: Auto-selecting scenario...")
-        
-        # You can modify this logic to test different scenarios
-        # For now, let's simulate a mix of scenarios
-        import random
-        scenario = random.choice([1, 1, 1, 2])  # Mostly valid, sometimes invalid
-        
-        if scenario == 1:
-            # Valid card
-            time.sleep(2)  # Simulate delay
-            mock_uid = next(iter(cfg.AUTHORIZED_UIDS))
-            print(f"MOCK Arduino: Card detected for auth! UID:{mock_uid}")
-            return mock_uid
-        elif scenario == 2:
-            # Invalid card
-            time.sleep(2)  # Simulate delay
-            invalid_uid = "DEADBEEF"  # Not in authorized list
-            print(f"MOCK Arduino: Card detected for auth! UID:{invalid_uid}")
-            return invalid_uid
-        else:
-            # Timeout
-            time.sleep(5)
-            print("MOCK: Simulating timeout (no card scanned)")
+        if not self.is_connected():
+            return None
+        prefixes = {AUTH_SCAN_PREFIX: None, AUTH_GRANTED_PREFIX: True, AUTH_DENIED_PREFIX: False}
+        line = self._wait_for_line(lambda l: l.startswith(tuple(prefixes)), timeout)
+        if line is None:
             return None
+        read_at = time.perf_counter()
+        print(f"Arduino response received: {line}")
+        prefix = next(p for p in prefixes if line.startswith(p))
+        return line[len(prefix):].strip(), prefixes[prefix], read_at
 
-    def send_json_command(self, command_dict):
-        """Serializes a dictionary to a JSON string and sends it, or simulates it."""
+    def send_allowlist(self, data):
+        """
+        Writes a hashed allowlist of authorized cards to the board, which
+        checks scans against it from then on. Empty data withdraws the
+        board's list. Returns True once every part is acknowledged; after a
+        failure the board leaves decisions to the host.
+        """
+        if not self.is_connected():
+            print("Cannot send allowlist: Arduino not connected.")
+            return False
+        if not data:
+            return self._transact(ALLOWLIST_OPCODE, (0, ""), False) # Starts a list that is never finished
+        for offset in range(0, len(data), ALLOWLIST_CHUNK):
+            if not self._transact(ALLOWLIST_OPCODE, (offset, data[offset:offset + ALLOWLIST_CHUNK].hex()), False):
+                return False
+        return True
+
+    def send_json_command(self, command_dict, wait_done=True, preempt=False, done_timeout=None):
+        """
+        Encodes a motion command as a frame and sends it.
+        Waits for the ACK and, unless wait_done is False, for the DONE that
+        reports the final angle (stored in last_reported_angle). Motions queue
+        behind the one in progress unless preempt is set, which stops it first.
+        done_timeout defaults to cfg.SERIAL_DONE_TIMEOUT.
+        """
         if not self.is_connected():
             print("Cannot send command: Arduino not connected.")
             return False
         
-        json_string = json.dumps(command_dict)
-        
-        if self.mock_mode:
-            print(f"MOCK: Sending JSON command to Arduino: {json_string}")
-            print("MOCK Arduino: JSON_RECEIVED")
-            return True
-
         try:
-            print(f"Sending JSON command to Arduino: {json_string}")
-            self.ser.write(f"{json_string}\n".encode('utf-8'))
-            time.sleep(0.1)
-            self._read_response()
-            return True
-        except (serial.SerialException, TypeError) as e:
-            print(f"Error writing JSON command to Arduino: {e}")
+            op, args = command_to_frame(command_dict)
+        except (ValueError, TypeError) as e:
+            print(f"Cannot encode command {command_dict}: {e}")
             return False
+        if preempt and not self.send_command(CMD_STOP_MOTION):
+            return False
+        print(f"Sending command to Arduino: {command_dict}")
+        return self._transact(op, args, wait_done, done_timeout)
 
-    def _read_response(self):
-        """Reads and prints all available lines from the Arduino."""
-        if self.mock_mode or not self.is_connected():
-            return
-            
-        time.sleep(0.2)
-        response_lines = []
-        while self.ser.in_waiting > 0:
-            line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-            if line:
-                response_lines.append(line)
-        if response_lines:
-            print(f"Arduino: {' | '.join(response_lines)}")
+    def send_trajectory(self, setpoints, done_timeout=None):
+        """
+        Streams planned setpoints to the board, which plays them back one
+        every STREAM_PERIOD_MS. Frames are paced so the setpoints the board
+        has not played yet never exceed its buffer, and the call returns once
+        the DONE after the last one arrives (the final angle is stored in
+        last_reported_angle). A stream that fails part way is stopped, so the
+        board does not hold the motion open. Returns True on success.
+        """
+        if not self.is_connected():
+            print("Cannot send trajectory: Arduino not connected.")
+            return False
+        if self.stream_chunk is None:
+            print(f"Cannot stream setpoints at {self.baudrate} baud within the bandwidth budget.")
+            return False
 
-    def disconnect(self):
-        """Closes the serial connection or simulates it."""
-        if self.mock_mode:
-            if self._is_mock_connected:
-                print("MOCK: Simulating Arduino disconnection...")
-                self._is_mock_connected = False
-                print("MOCK: Connection closed.")
-            return
+        chunk, period = self.stream_chunk, STREAM_PERIOD_MS / 1000
+        print(f"Streaming {len(setpoints)} setpoints ({len(setpoints) * period:.1f}s) to Arduino")
+        started, sent = None, 0
+        for index in range(0, len(setpoints), chunk):
+            part = setpoints[index:index + chunk]
+            flags = (STREAM_FIRST if index == 0 else 0) | (STREAM_LAST if index + chunk >= len(setpoints) else 0)
+            if started is not None:
+                # Playback started with the first frame; one setpoint of
+                # headroom covers the two clocks drifting apart
+                unplayed = sent - (time.perf_counter() - started) / period
+                wait = (unplayed + len(part) + 1 - STREAM_BUFFER_SIZE) * period
+                if wait > 0:
+                    time.sleep(wait)
+            try:
+                args = encode_setpoints(part, flags)
+            except ValueError as e:
+                print(f"Cannot encode trajectory: {e}")
+                ok = False
+            else:
+                ok = self._transact(STREAM_OPCODE, args, bool(flags & STREAM_LAST), done_timeout)
+            if not ok:
+                if started is not None:
+                    self.send_command(CMD_STOP_MOTION)
+                return False
+            if started is None:
+                started = time.perf_counter()
+            sent += len(part)
+            metrics.inc("serial_stream_setpoints_total", len(part))
+        return True
 
+    def disconnect(self):
+        """Closes the serial connection (stopping the emulator in mock mode)."""
         if self.is_connected():
             print("Closing Arduino connection...")
             self.ser.close()
@@ -0,0 +1,394 @@
+import copy
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import requests
+import src.config as cfg
+import src.metrics as metrics
+from src.kinematics import ServoTwin
+from src.llm import _replace_word_numbers, get_ollama_client
+
+# --- Intent cache ---
+# Operators repeat the same phrasings, so LLM answers are cached in two tiers:
+# - exact:    keyed on the normalized request text
+# - semantic: the request is embedded by a local Ollama embedding model and
+#             matched against earlier requests by cosine similarity
+# Entries hold commands that do not depend on the angle a request was made
+# at: a GOTO the LLM computed from it ("go up 30" -> GOTO 120) is stored as
+# the ADJUST it amounts to, so a hit is applied to whatever the angle is then.
+
+# The file layout. Files from other versions are discarded on load (version
+# 1 could hold GOTOs computed from the angle at the time).
+CACHE_VERSION = 2
+
+# Direction words, by the direction they name. A semantic hit needs the same
+# directions, since embeddings put "turn up a bit" right next to "turn down a bit".
+DIRECTIONS = {
+    "up": "up", "upward": "up", "upwards": "up", "raise": "up", "raised": "up", "raising": "up",
+    "down": "down", "downward": "down", "downwards": "down", "lower": "down", "lowered": "down",
+    "lowering": "down",
+    "left": "left", "right": "right",
+    "clockwise": "clockwise", "counterclockwise": "counterclockwise", "anticlockwise": "counterclockwise",
+    "open": "open", "opened": "open", "opening": "open",
+    "close": "close", "closed": "close", "closing": "close",
+}
+# Words that make a move relative or set its size ("open" vs "open a bit").
+RELATIVE_WORDS = {
+    "more", "less", "further", "little", "bit", "slightly", "tad", "touch", "nudge", "by",
+}
+# Words naming a fixed position; a GOTO to it does not depend on the angle.
+MIDDLE_WORDS = {"middle", "center", "centre", "home"}
+# Leading and trailing words that never change the meaning of a request.
+POLITE_PREFIX = re.compile(r"^(?:(?:please|can you|could you|would you|now)\s+)+")
+POLITE_SUFFIX = re.compile(r"(?:\s+(?:please|now|thanks|thank you))+$")
+
+
+def normalize(text):
+    """'Please, nod TWICE!' -> 'nod 2'."""
+    text = re.sub(r"[^a-z0-9\s-]", " ", text.lower().replace("counter-clockwise", "counterclockwise"))
+    text = _replace_word_numbers(re.sub(r"\s+", " ", text).strip())
+    return POLITE_SUFFIX.sub("", POLITE_PREFIX.sub("", text))
+
+def signature(normalized):
+    """
+    The numbers, directions and relative words of a request. Embeddings put
+    "go to 45" right next to "go to 50", and "go up 30" next to "go down 30",
+    so a semantic hit also needs the same signature.
+    """
+    words = normalized.split()
+    return (sorted(w for w in words if w.lstrip("-").isdigit()),
+            sorted({DIRECTIONS[w] for w in words if w in DIRECTIONS}),
+            sorted(w for w in words if w in RELATIVE_WORDS))
+
+def _fixed_targets(words, min_angle, max_angle):
+    """The angles of the fixed positions a request names ("open", "middle")."""
+    if RELATIVE_WORDS.intersection(words):
+        return set() # "open a bit" is a nudge, not the open position
+    directions = {DIRECTIONS.get(w) for w in words}
+    targets = set()
+    if "open" in directions:
+        targets.add(max_angle)
+    if "close" in directions:
+        targets.add(min_angle)
+    if MIDDLE_WORDS.intersection(words):
+        targets.add((min_angle + max_angle) // 2)
+    return targets
+
+def angle_independent(normalized, command_dict, angle, min_angle, max_angle):
+    """
+    The command in a form that does not depend on the angle the request was
+    made at, or None if that cannot be told. A GOTO to an angle the request
+    states ("go to 45") or to a fixed position ("open") stays absolute; any
+    other GOTO was computed from angle and becomes an ADJUST. When the stated
+    number is both (at 0, "go up 30" and "go to 30" both answer 30), direction
+    words make it relative. A computed GOTO that ends at a limit may have
+    been clamped, so the answer is not cached.
+    """
+    words = normalized.split()
+    numbers = {abs(int(w)) for w in words if w.lstrip("-").isdigit()}
+    fixed = _fixed_targets(words, min_angle, max_angle)
+    # Decides a stated number that is both the target and the distance to it
+    relative = any(w in DIRECTIONS or w in RELATIVE_WORDS for w in words)
+    twin = ServoTwin(angle, min_angle, max_angle, cfg.MOTOR_DEGREES_PER_SECOND) # For end angles only
+
+    def convert(step, start):
+        if step.get("command") != "GOTO":
+            return step
+        target = int(step.get("angle", 0))
+        delta = target - start
+        if target in fixed:
+            return step
+        if target in numbers and (not delta or abs(delta) not in numbers or not relative):
+            return step
+        if target in (min_angle, max_angle):
+            return None
+        adjust = {key: value for key, value in step.items() if key != "angle"}
+        return {**adjust, "command": "ADJUST", "degrees": delta}
+
+    if command_dict.get("command") != "SEQUENCE":
+        return convert(command_dict, angle)
+    steps, running = [], angle
+    for step in command_dict.get("steps", []):
+        converted = convert(step, running)
+        if converted is None:
+            return None
+        steps.append(converted)
+        if step.get("command") == "ADJUST":
+            running = max(min_angle, min(max_angle, running + int(step.get("degrees", 0))))
+        else:
+            running = twin.predict(step, running).end_angle
+    return {**command_dict, "steps": steps}
+
+class CacheStats:
+    """Hits per tier, and the LLM time they saved. Thread-safe, like the cache."""
+    def __init__(self):
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, tier, elapsed):
+        with self._lock:
+            self.lookup_seconds += elapsed
+            if tier:
+                self.hits[tier] += 1
+            else:
+                self.misses += 1
+        if tier:
+            metrics.inc("servo_cache_hits_total", tier=tier)
+        else:
+            metrics.inc("servo_cache_misses_total")
+
+    @property
+    def hit_rate(self):
+        total = sum(self.hits.values()) + self.misses
+        return sum(self.hits.values()) / total if total else 0.0
+
+    def report(self, avg_llm_seconds):
+        """avg_llm_seconds is the observed LLM latency, as in FastPathStats."""
+        hits = sum(self.hits.values())
+        saved = max(0.0, hits * avg_llm_seconds - self.lookup_seconds)
+        return (f"Intent cache: {hits}/{hits + self.misses} LLM requests ({self.hit_rate:.0%}; "
+                f"{self.hits['exact']} exact, {self.hits['semantic']} semantic), ~{saved:.1f}s of LLM time saved")
+
+
+class IntentCache:
+    """
+    LRU cache of LLM answers with a TTL, an optional semantic tier and a JSON
+    file that keeps it across restarts. Thread-safe: the HTTP server runs
+    several LLM workers.
+
+    With save_delay the file is written on a background thread, at most once
+    per save_delay seconds, so storing an answer never waits on the disk.
+    close() writes what is still unsaved. Without it every change is written
+    straight away.
+    """
+    def __init__(self, path=None, max_entries=500, ttl=None, semantic=False,
+                 embed_model=None, threshold=0.9, model=None, save_delay=0):
+        self.path = path
+        self.save_delay = save_delay
+        self.model = model # The LLM whose answers are cached
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.stats = CacheStats()
+        self.entries = OrderedDict() # normalized text -> {"command", "created", "vector"}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_cond = threading.Condition() # Guards _unsaved and _closed
+        self._unsaved = False
+        self._closed = False
+        self._save_thread = None
+        self._matrix = None # Unit-length vectors of the entries that have one, rebuilt when stale
+        self._matrix_keys = []
+        self.np = None
+        if semantic:
+            try:
+                import numpy
+                self.np = numpy
+            except ImportError:
+                print("Intent cache: semantic tier needs NumPy (pip install numpy); using exact matches only.")
+        self.load()
+
+    @property
+    def semantic(self):
+        return self.np is not None
+
+    @classmethod
+    def from_config(cls):
+        return cls(cfg.CACHE_PATH, cfg.CACHE_MAX_ENTRIES, cfg.CACHE_TTL_SECONDS, cfg.CACHE_SEMANTIC,
+                   cfg.CACHE_EMBED_MODEL, cfg.CACHE_SIMILARITY_THRESHOLD, cfg.OLLAMA_MODEL,
+                   cfg.CACHE_SAVE_SECONDS)
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    # --- Lookup ---
+    def lookup(self, text):
+        """
+        Returns (command, tier, vector): a copy of the cached command and
+        "exact" or "semantic", or (None, None, vector) on a miss. vector is
+        the request's embedding (None without the semantic tier), to be
+        passed back to store().
+        """
+        start = time.perf_counter()
+        key = normalize(text)
+        command, tier, vector = self._lookup_exact(key), "exact", None
+        if command is None and self.semantic:
+            vector = self.embed(text)
+            command, tier = self._lookup_semantic(key, vector), "semantic"
+        self.stats.record(tier if command else None, time.perf_counter() - start)
+        return command, (tier if command else None), vector
+
+    def _lookup_exact(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, time.time()):
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return copy.deepcopy(entry["command"])
+
+    def _lookup_semantic(self, key, vector):
+        if vector is None:
+            return None
+        with self._lock:
+            matrix = self._vectors()
+            if matrix is None:
+                return None
+            similarities = matrix @ vector
+            # Best first, skipping candidates whose numbers or directions differ
+            wanted = signature(key)
+            for index in self.np.argsort(similarities)[::-1]:
+                if similarities[index] < self.threshold:
+                    return None
+                match = self._matrix_keys[index]
+                entry = self.entries[match]
+                if signature(match) == wanted and not self._expired(entry, time.time()):
+                    self.entries.move_to_end(match)
+                    print(f"Intent cache: '{key}' matched '{match}' (similarity {similarities[index]:.2f})")
+                    return copy.deepcopy(entry["command"])
+        return None
+
+    def _vectors(self):
+        """The index matrix, rebuilt if entries changed. Call with the lock held."""
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self.entries.items() if entry.get("vector") is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = self.np.array([self.entries[key]["vector"] for key in self._matrix_keys],
+                                         dtype=self.np.float32)
+        return self._matrix
+
+    def embed(self, text):
+        """Embeds text with the local embedding model. Returns a unit vector, or None on error."""
+        base_url = cfg.OLLAMA_API_URL.split("/api/")[0]
+        try:
+            response = get_ollama_client().post(f"{base_url}/api/embed",
+                                                {"model": self.embed_model, "input": text}, timeout=5)
+            response.raise_for_status()
+            vector = self.np.array(response.json()["embeddings"][0], dtype=self.np.float32)
+        except (requests.exceptions.RequestException, KeyError, IndexError, ValueError) as e:
+            print(f"Intent cache: embedding failed ({e}).")
+            return None
+        norm = self.np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    # --- Updates ---
+    def store(self, text, command_dict, angle, vector=None):
+        """
+        Caches an LLM answer to a request made at angle, in angle-independent
+        form (see angle_independent()). Returns True if stored.
+        """
+        key = normalize(text)
+        command_dict = angle_independent(key, command_dict, angle, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE)
+        if command_dict is None:
+            return False
+        with self._lock:
+            self.entries[key] = {
+                "command": copy.deepcopy(command_dict),
+                "created": time.time(),
+                "vector": [float(x) for x in vector] if vector is not None else None,
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._matrix = None
+        self._changed()
+        return True
+
+    def _remove(self, key):
+        del self.entries[key]
+        self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._matrix = None
+        self._changed()
+
+    # --- Persistence ---
+    def load(self):
+        """Reads the cache file, dropping expired entries. A missing or corrupt file starts empty."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Intent cache: could not read {self.path} ({e}), starting empty.")
+            return
+        if data.get("version") != CACHE_VERSION:
+            print(f"Intent cache: {self.path} is from an older version, starting empty.")
+            return
+        if data.get("model") != self.model:
+            print(f"Intent cache: {self.path} holds answers from another model, starting empty.")
+            return
+        now = time.time()
+        # Vectors from another embedding model are not comparable
+        same_model = data.get("embed_model") == self.embed_model
+        for key, entry in data.get("entries", []):
+            if self._expired(entry, now):
+                continue
+            if not same_model:
+                entry["vector"] = None
+            self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        print(f"Intent cache: loaded {len(self.entries)} entries from {self.path}")
+
+    def _changed(self):
+        """Writes the file now, or has the background writer write it within save_delay."""
+        if not self.path:
+            return
+        with self._save_cond:
+            deferred = self.save_delay and not self._closed
+            if deferred:
+                self._unsaved = True
+                if self._save_thread is None:
+                    self._save_thread = threading.Thread(target=self._save_loop, name="cache-save", daemon=True)
+                    self._save_thread.start()
+                self._save_cond.notify_all()
+        if not deferred:
+            self.save()
+
+    def _save_loop(self):
+        while True:
+            with self._save_cond:
+                self._save_cond.wait_for(lambda: self._unsaved or self._closed)
+                if not self._unsaved:
+                    return
+                # Changes made meanwhile go into the same write; close() cuts the wait short
+                self._save_cond.wait_for(lambda: self._closed, timeout=self.save_delay)
+                self._unsaved = False
+            self.save()
+
+    def close(self):
+        """Stops the background writer once it has written every change."""
+        with self._save_cond:
+            self._closed = True
+            self._save_cond.notify_all()
+        if self._save_thread is not None:
+            self._save_thread.join()
+            self._save_thread = None
+
+    def save(self):
+        if not self.path:
+            return
+        # Snapshot under the save lock too, so a slower writer cannot replace
+        # a newer snapshot with an older one
+        with self._save_lock:
+            with self._lock:
+                data = {"version": CACHE_VERSION, "model": self.model, "embed_model": self.embed_model,
+                        "entries": list(self.entries.items())}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Written to a temp file and renamed, so a crash never leaves half a file
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(self.path + ".tmp", self.path)
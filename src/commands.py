@@ -0,0 +1,414 @@
+import json
+import math
+import re
+from collections import Counter, namedtuple
+import src.config as cfg
+
+# --- Command registry ---
+# Every command is described once, here. The registry generates:
+# - the command section of the LLM system prompt and its few-shot examples
+# - the help screen
+# - the JSON schema sent as Ollama's structured output `format` (so the
+#   model can only generate well-formed commands) and its num_predict budget
+# - the validator every command passes before it is sent to a board
+# - the opcode table of src/arduino.py and the firmware's command_table.h
+#   (regenerate with `python -m src.commands` after changing it)
+
+# kind: "angle" is clamped to the motor range, "degrees" to +/- the range,
+# "count" to 1..COMMAND_MAX_REPEATS (below 1 is rejected). default is what
+# the firmware applies when the parameter is left out.
+Param = namedtuple("Param", ["name", "kind", "required", "default"], defaults=(None,))
+
+# opcode is the frame opcode (None for commands resolved on the host).
+# Notes may use {min} and {max} for the motor range. examples are
+# (utterance, command) pairs; the first two are shown in the help.
+CommandSpec = namedtuple("CommandSpec", ["name", "opcode", "params", "summary", "notes", "keywords", "examples"])
+
+COMMANDS = (
+    CommandSpec(
+        "GOTO", "G", (Param("angle", "angle", True),),
+        "Move to a specific angle.",
+        ('"open" means {max}, "close" means {min}, "middle" means 90.',),
+        "go goto move set position point open close middle center home angle",
+        (("set to 45 degrees", {"command": "GOTO", "angle": 45}),
+         ("go to 180", {"command": "GOTO", "angle": 180}),
+         ("move to 90 degrees", {"command": "GOTO", "angle": 90}),
+         ("point it straight up", {"command": "GOTO", "angle": 90})),
+    ),
+    CommandSpec(
+        "ADJUST", None, (Param("degrees", "degrees", True),),
+        "Turn by a relative amount.",
+        ("Positive is clockwise (towards {max}), negative is counter-clockwise (towards {min}).",),
+        "turn move rotate adjust nudge shift left right clockwise counterclockwise little bit more less",
+        (("turn a little to the right", {"command": "ADJUST", "degrees": 20}),
+         ("move left by 20 deg", {"command": "ADJUST", "degrees": -20}),
+         ("move 30 degrees left", {"command": "ADJUST", "degrees": -30}),
+         ("nudge it clockwise a touch", {"command": "ADJUST", "degrees": 10})),
+    ),
+    CommandSpec(
+        "SPIN", "P", (Param("times", "count", False, 1),),
+        "Rotate back and forth rapidly.",
+        ("Full rotations back and forth. This action ends at the starting angle.",),
+        "spin twirl rotate around full",
+        (("spin around a few times", {"command": "SPIN", "times": 3}),
+         ("do a spin", {"command": "SPIN", "times": 1}),
+         ("spin 3 times", {"command": "SPIN", "times": 3})),
+    ),
+    CommandSpec(
+        "SWEEP", "W", (Param("repetitions", "count", False, 2),),
+        "Scan smoothly side-to-side.",
+        ("Moves back and forth like a radar. This action ends at the starting angle.",),
+        "sweep scan radar look around area side",
+        (("sweep the area", {"command": "SWEEP", "repetitions": 2}),
+         ("look around", {"command": "SWEEP", "repetitions": 2}),
+         ("sweep back and forth 5 times", {"command": "SWEEP", "repetitions": 5})),
+    ),
+    CommandSpec(
+        "NOD", "N", (Param("times", "count", False, 2),),
+        "Perform a 'yes' motion.",
+        (),
+        "nod yes agree head",
+        (("nod your head", {"command": "NOD", "times": 2}),
+         ("nod yes twice", {"command": "NOD", "times": 2}),
+         ("agree with me", {"command": "NOD", "times": 1})),
+    ),
+    CommandSpec(
+        "SHAKE", "K", (Param("times", "count", False, 2),),
+        "Perform a chaotic 'no' motion.",
+        (),
+        "shake no disagree refuse head",
+        (("shake your head no", {"command": "SHAKE", "times": 2}),
+         ("shake it", {"command": "SHAKE", "times": 2}),
+         ("disagree three times", {"command": "SHAKE", "times": 3})),
+    ),
+    CommandSpec(
+        "SEQUENCE", "Q", (),
+        "Several actions in one request.",
+        ('"steps" is a list of the command objects above, at most {steps}, with no nested SEQUENCE.',
+         "Use this only when the user asks for more than one action."),
+        "then after and next followed",
+        (("nod twice then sweep and go to 45",
+          {"command": "SEQUENCE", "steps": [{"command": "NOD", "times": 2}, {"command": "SWEEP", "repetitions": 2},
+                                             {"command": "GOTO", "angle": 45}]}),
+         ("spin then shake", {"command": "SEQUENCE", "steps": [{"command": "SPIN", "times": 1},
+                                                               {"command": "SHAKE", "times": 2}]})),
+    ),
+)
+COMMANDS_BY_NAME = {spec.name: spec for spec in COMMANDS}
+COMMAND_PARAMS = {spec.name: spec.params for spec in COMMANDS if spec.name != "SEQUENCE"}
+KNOWN_COMMANDS = tuple(COMMANDS_BY_NAME)
+
+# A SEQUENCE is sent as one frame. Must match MAX_QUEUED_STEPS in firmware.
+MAX_SEQUENCE_STEPS = 8
+
+# Fewest characters a token of generated JSON covers. Digits, quotes and
+# punctuation often get a token each, so this is a floor, not an average.
+MIN_CHARS_PER_TOKEN = 2
+# Room for the end-of-generation token and any whitespace the grammar allows.
+NUM_PREDICT_SLACK = 8
+
+
+def motion_opcodes():
+    """Command -> (opcode, parameter name) for the commands the firmware runs on its own."""
+    return {spec.name: (spec.opcode, spec.params[0].name) for spec in COMMANDS
+            if spec.opcode and spec.params}
+
+def count_params():
+    """Command -> (parameter name, firmware default) for the commands that take a count."""
+    return {spec.name: (spec.params[0].name, spec.params[0].default) for spec in COMMANDS
+            if spec.params and spec.params[0].kind == "count"}
+
+
+def _param_range(kind):
+    span = cfg.MOTOR_MAX_ANGLE - cfg.MOTOR_MIN_ANGLE
+    if kind == "angle":
+        return cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE
+    if kind == "degrees":
+        return -span, span
+    return 1, cfg.COMMAND_MAX_REPEATS
+
+
+# --- Prompt ---
+def _describe_param(param, min_angle, max_angle):
+    if param.kind == "angle":
+        return f'"{param.name}" (integer, {min_angle}-{max_angle})'
+    if param.kind == "degrees":
+        return f'"{param.name}" (integer)'
+    return f'"{param.name}" (integer, 1-{cfg.COMMAND_MAX_REPEATS}, default {param.default})'
+
+def prompt_command_section(min_angle, max_angle):
+    """The numbered command list of the system prompt. Examples are sent per request."""
+    lines = []
+    for number, spec in enumerate(COMMANDS, 1):
+        lines.append(f'{number}.  "{spec.name}": {spec.summary}')
+        if spec.params:
+            lines.append("    - Parameters: " + ", ".join(_describe_param(p, min_angle, max_angle)
+                                                      for p in spec.params) + ".")
+        for note in spec.notes:
+            lines.append("    - Note: " + note.format(min=min_angle, max=max_angle, steps=MAX_SEQUENCE_STEPS))
+    return "\n".join(lines)
+
+def format_example(utterance, command_dict):
+    return f'"{utterance}" -> {json.dumps(command_dict)}'
+
+
+# --- Example selection ---
+# The prompt carries only the few-shot examples that share words with the
+# request. A small inverted index over the example utterances and each
+# command's keywords scores them, weighting rare words (IDF) above common ones.
+STOP_WORDS = {
+    "a", "an", "the", "to", "it", "me", "my", "your", "please", "can", "you", "could",
+    "would", "for", "of", "by", "with", "do", "on", "at", "this", "that",
+    "degrees", "degree", "deg", "times", "time",
+}
+
+def _words(text):
+    return [word for word in re.findall(r"[a-z]+", text.lower()) if word not in STOP_WORDS]
+
+class ExampleIndex:
+    def __init__(self, commands=COMMANDS):
+        self.examples = [] # (command name, utterance, command)
+        self.postings = {} # word -> {example index: weight}
+        for spec in commands:
+            keywords = spec.keywords.split()
+            for utterance, command_dict in spec.examples:
+                index = len(self.examples)
+                self.examples.append((spec.name, utterance, command_dict))
+                for word, count in Counter(_words(utterance) + keywords).items():
+                    self.postings.setdefault(word, {})[index] = count
+        total = len(self.examples)
+        self.idf = {word: math.log(1 + total / len(docs)) for word, docs in self.postings.items()}
+
+    def select(self, text, limit):
+        """
+        The best `limit` examples for text, one per command before any
+        command gets a second. Falls back to the first example, so the model
+        always sees the answer format. limit None returns every example.
+        """
+        if limit is None:
+            return [(utterance, command) for _, utterance, command in self.examples]
+        scores = Counter()
+        for word in set(_words(text)):
+            for index, weight in self.postings.get(word, {}).items():
+                scores[index] += self.idf[word] * weight
+        ranked = sorted(scores, key=lambda index: (-scores[index], index))
+        picked, seen = [], set()
+        for index in ranked:
+            if self.examples[index][0] not in seen:
+                picked.append(index)
+                seen.add(self.examples[index][0])
+        picked += [index for index in ranked if index not in picked]
+        picked = picked[:limit] or [0][:limit]
+        return [self.examples[index][1:] for index in picked]
+
+_example_index = None
+
+def select_examples(text, limit):
+    global _example_index
+    if _example_index is None:
+        _example_index = ExampleIndex()
+    return _example_index.select(text, limit)
+
+
+# --- Help ---
+def help_lines():
+    """One line per command: name, summary and two example phrasings."""
+    return [f"  - {spec.name:<8} : {spec.summary:<35} e.g., "
+            + ", ".join(f"'{utterance}'" for utterance, _ in spec.examples[:2])
+            for spec in COMMANDS]
+
+
+# --- Firmware ---
+def firmware_header():
+    """The text of arduino/servo_lcd_display/command_table.h."""
+    lines = [
+        "// command_table.h",
+        "// Generated by `python -m src.commands` from the registry in src/commands.py.",
+        "// Do not edit by hand; change the registry and regenerate.",
+        "#ifndef COMMAND_TABLE_H",
+        "#define COMMAND_TABLE_H",
+        "",
+        "// Motion opcodes",
+    ]
+    specs = [spec for spec in COMMANDS if spec.opcode]
+    lines += [f"const char OP_{spec.name} = '{spec.opcode}';" for spec in specs]
+    motion = "".join(spec.opcode for spec in specs if spec.params)
+    lines += [
+        f'const char MOTION_OPS[] = "{motion}"; // Opcodes that take one optional value',
+        "",
+        "// Applied when a count is left out",
+    ]
+    lines += [f"const int DEFAULT_{name}_{param.upper()} = {default};"
+              for name, (param, default) in count_params().items()]
+    lines += [
+        "",
+        "// JSON command names, only used for manual testing from the Serial Monitor",
+        "struct JsonCommand {",
+        "  const char* name;",
+        "  char op;",
+        "  const char* param;",
+        "};",
+        "const JsonCommand jsonCommands[] = {",
+    ]
+    lines += [f'  {{"{name}", OP_{name}, "{param}"}},' for name, (_, param) in motion_opcodes().items()]
+    lines += [
+        "};",
+        "const int numJsonCommands = sizeof(jsonCommands) / sizeof(JsonCommand);",
+        "",
+        "#endif // COMMAND_TABLE_H",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+# --- Schema ---
+def _command_schema(command):
+    properties = {"command": {"type": "string", "enum": [command]}}
+    required = ["command"]
+    for param in COMMAND_PARAMS[command]:
+        low, high = _param_range(param.kind)
+        properties[param.name] = {"type": "integer", "minimum": low, "maximum": high}
+        if param.required:
+            required.append(param.name)
+    return {"type": "object", "properties": properties, "required": required,
+            "additionalProperties": False}
+
+def command_schema(devices=None):
+    """
+    The JSON schema of one LLM answer: any single command, or a SEQUENCE of
+    1-MAX_SEQUENCE_STEPS of them. devices adds an optional "device" limited
+    to those names.
+    """
+    steps = [_command_schema(command) for command in COMMAND_PARAMS]
+    sequence = {
+        "type": "object",
+        "properties": {
+            "command": {"type": "string", "enum": ["SEQUENCE"]},
+            "steps": {"type": "array", "items": {"anyOf": steps},
+                      "minItems": 1, "maxItems": MAX_SEQUENCE_STEPS},
+        },
+        "required": ["command", "steps"],
+        "additionalProperties": False,
+    }
+    top_level = steps + [sequence]
+    if devices:
+        # Copies, so the steps inside a sequence stay without a device
+        device = {"type": "string", "enum": list(devices)}
+        top_level = [dict(schema, properties=dict(schema["properties"], device=device))
+                     for schema in top_level]
+    return {"anyOf": top_level}
+
+def max_json_length(schema):
+    """
+    Length of the longest JSON text (as json.dumps writes it) that the
+    schema allows. Only handles the constructs command_schema() uses.
+    """
+    if "anyOf" in schema:
+        return max(max_json_length(option) for option in schema["anyOf"])
+    if "enum" in schema:
+        return max(len(json.dumps(value)) for value in schema["enum"])
+    kind = schema.get("type")
+    if kind == "integer":
+        return max(len(str(schema["minimum"])), len(str(schema["maximum"])))
+    if kind == "array":
+        count = schema["maxItems"]
+        return 2 + count * max_json_length(schema["items"]) + 2 * (count - 1) # [a, b]
+    if kind == "object":
+        fields = [len(json.dumps(name)) + 2 + max_json_length(value) # "name": value
+                  for name, value in schema["properties"].items()]
+        return 2 + sum(fields) + 2 * (len(fields) - 1) # {a, b}
+    raise ValueError(f"Cannot size schema: {schema}")
+
+def num_predict_budget(schema):
+    """Tokens enough for the longest answer the schema allows, and not many more."""
+    return math.ceil(max_json_length(schema) / MIN_CHARS_PER_TOKEN) + NUM_PREDICT_SLACK
+
+
+# --- Validation ---
+def _to_int(value):
+    """Returns value as an int, or None. Accepts whole floats and numeric strings, not booleans."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else None
+
+def validate_command(command_obj, nested=False):
+    """
+    Checks a command before it reaches a board. Out-of-range angles and
+    counts are clamped; unknown commands, missing or non-numeric parameters,
+    counts below 1 and malformed sequences are rejected. Unknown keys are
+    dropped.
+
+    Returns (command, notes): the cleaned command (None when rejected) and a
+    list of what was changed, or why it was rejected.
+    """
+    if not isinstance(command_obj, dict):
+        return None, ["not a JSON object"]
+    command = command_obj.get("command")
+    if isinstance(command, str):
+        command = command.strip().upper()
+    if command not in KNOWN_COMMANDS:
+        return None, [f"unknown command {command_obj.get('command')!r}"]
+
+    cleaned = {"command": command}
+    notes = []
+    if "device" in command_obj:
+        device = command_obj["device"]
+        if nested:
+            notes.append("dropped the device of a sequence step")
+        elif isinstance(device, str) and device.strip():
+            cleaned["device"] = device.strip()
+        else:
+            return None, [f"invalid device {device!r}"]
+
+    if command == "SEQUENCE":
+        steps = command_obj.get("steps")
+        if nested:
+            return None, ["sequences cannot be nested"]
+        if not isinstance(steps, list) or not 0 < len(steps) <= MAX_SEQUENCE_STEPS:
+            return None, [f"a sequence needs 1-{MAX_SEQUENCE_STEPS} steps"]
+        cleaned["steps"] = []
+        for i, step in enumerate(steps, 1):
+            step, step_notes = validate_command(step, nested=True)
+            notes.extend(f"step {i}: {note}" for note in step_notes)
+            if step is None:
+                return None, notes
+            cleaned["steps"].append(step)
+        return cleaned, notes
+
+    for param in COMMAND_PARAMS[command]:
+        value = command_obj.get(param.name)
+        if value is None:
+            if param.required:
+                return None, [f"{command} requires {param.name}"]
+            continue
+        number = _to_int(value)
+        if number is None:
+            return None, [f"{param.name} must be a whole number, got {value!r}"]
+        low, high = _param_range(param.kind)
+        if param.kind == "count" and number < low:
+            return None, [f"{param.name} must be at least {low}, got {number}"]
+        clamped = max(low, min(high, number))
+        if clamped != number:
+            notes.append(f"{param.name} {number} clamped to {clamped}")
+        cleaned[param.name] = clamped
+
+    known = {"command", "device"} | {param.name for param in COMMAND_PARAMS[command]}
+    extra = sorted(str(key) for key in command_obj if key not in known)
+    if extra:
+        notes.append(f"ignored {', '.join(extra)}")
+    return cleaned, notes
+
+
+# python -m src.commands  regenerates the firmware's command table
+if __name__ == "__main__":
+    import os
+    path = os.path.join(os.path.dirname(__file__), "..", "arduino", "servo_lcd_display", "command_table.h")
+    with open(path, "w") as f:
+        f.write(firmware_header())
+    print(f"Wrote {os.path.normpath(path)}")
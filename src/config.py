@@ -2,6 +2,129 @@
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "phi3:mini"
 
+# Simple commands ("go to 90", "nod twice") are parsed by rules first and only
+# fall through to the LLM when the parser is less confident than this.
+# Set to a value above 1.0 to always use the LLM.
+FAST_PATH_MIN_CONFIDENCE = 0.8
+
+# Stream tokens from Ollama and dispatch the command as soon as the JSON object
+# is complete, cancelling the rest of the generation.
+OLLAMA_STREAM = True
+
+# Send a JSON schema of every command as Ollama's structured output format, so
+# the model can only answer with a command the motor can run, and cap the
+# answer length to fit it. Needs Ollama 0.5+; set to False for plain JSON mode.
+OLLAMA_STRUCTURED_OUTPUT = True
+
+# Extra Ollama generation options (num_ctx, num_thread, temperature, a fixed
+# num_predict...). `python -m benchmark.tune` recommends values for your hardware.
+OLLAMA_OPTIONS = {}
+
+# Send the fixed instructions as Ollama's system prompt so the model can reuse
+# its cached prefix. Set to False to inline everything (the old layout) when
+# comparing prompt eval telemetry.
+OLLAMA_SPLIT_PROMPT = True
+
+# Few-shot examples sent with each request, picked from the command registry
+# (src/commands.py) by how many words they share with it. None sends every
+# example, which costs more prompt tokens per request.
+OLLAMA_PROMPT_EXAMPLES = 3
+
+# How long Ollama keeps the model in memory after a request (Ollama duration
+# string, e.g. "30m", or -1 to keep it loaded indefinitely).
+OLLAMA_KEEP_ALIVE = "30m"
+# Re-warm the model in the background after this many idle seconds (0 disables).
+OLLAMA_REWARM_IDLE_SECONDS = 600
+# Seconds to wait for Ollama to respond (for streams: between chunks).
+OLLAMA_REQUEST_TIMEOUT = 30
+
+# Several Ollama servers to spread requests over, as base URLs, e.g.
+# ["http://gpu-box:11434", "http://localhost:11434"]. Each request goes to the
+# one with the lowest recent latency and load, and fails over to the next.
+# Leave empty to use OLLAMA_API_URL alone.
+OLLAMA_BACKENDS = []
+OLLAMA_HEALTH_CHECK_SECONDS = 15
+# A backend failing this many requests in a row is skipped for the cooldown.
+OLLAMA_BREAKER_FAILURES = 3
+OLLAMA_BREAKER_COOLDOWN = 30
+
+# --- Intent cache ---
+# LLM answers are remembered per (normalized) request text, so a repeated
+# request skips the LLM. Kept in CACHE_PATH across restarts (None: memory only).
+CACHE_ENABLED = True
+CACHE_PATH = "cache/intents.json"
+CACHE_MAX_ENTRIES = 500 # Least recently used entries are dropped beyond this
+CACHE_TTL_SECONDS = 7 * 24 * 3600 # None keeps entries until evicted
+# New answers are written to CACHE_PATH on a background thread, at most once
+# per CACHE_SAVE_SECONDS and once more on exit. 0 writes on every answer.
+CACHE_SAVE_SECONDS = 2
+# Semantic tier: also match differently worded requests by embedding them with
+# a local model ("ollama pull nomic-embed-text"). Needs NumPy.
+CACHE_SEMANTIC = False
+CACHE_EMBED_MODEL = "nomic-embed-text"
+CACHE_SIMILARITY_THRESHOLD = 0.9 # Cosine similarity a match needs
+
+# --- Voice ---
+# Speech recognizer: "google" (online), or "vosk", "whisper" or "sphinx" (offline).
+VOICE_BACKEND = "google"
+VOSK_MODEL_PATH = "models/vosk-model-small-en-us-0.15"
+WHISPER_MODEL = "base.en"
+# Ambient noise is measured once, when the microphone is first opened.
+VOICE_CALIBRATION_SECONDS = 0.5
+# Seconds of silence that end an utterance.
+VOICE_PAUSE_THRESHOLD = 0.5
+# Seconds to wait for speech to start, and the longest utterance accepted.
+VOICE_LISTEN_TIMEOUT = 5
+VOICE_PHRASE_TIME_LIMIT = 8
+# Hands-free mode ('listen'): utterances waiting for recognition, voice
+# commands waiting for inference, and the age after which a voice command is
+# dropped instead of run.
+VOICE_AUDIO_QUEUE_SIZE = 2
+VOICE_MAX_PENDING_COMMANDS = 2
+VOICE_MAX_UTTERANCE_AGE = 10
+
+# --- Metrics ---
+# Per-stage timing spans, Ollama timing fields and serial counters. Costs next
+# to nothing when disabled.
+METRICS_ENABLED = False
+METRICS_JSONL_PATH = "logs/metrics.jsonl"
+METRICS_JSONL_MAX_BYTES = 5 * 1024 * 1024 # Rotated to .1, .2, ... beyond this
+METRICS_JSONL_BACKUPS = 3
+# Prometheus text format file (e.g. for node_exporter's textfile collector),
+# and/or an HTTP port serving /metrics. Set either to None to disable it.
+METRICS_PROMETHEUS_FILE = "logs/metrics.prom"
+METRICS_PROMETHEUS_PORT = None
+METRICS_FLUSH_SECONDS = 5
+# Streamed generations are cancelled once the command is parsed, which loses
+# Ollama's timing fields. Let every Nth one finish in the background to sample
+# them (0 disables).
+METRICS_OLLAMA_SAMPLE_EVERY = 10
+
+# --- HTTP Server (python main.py --serve) ---
+# Clients log in by scanning an authorized card and get a session token.
+# Keep the server on a trusted network: there is no TLS.
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+# Threads running the fast path / LLM. Each one holds one Ollama request.
+SERVER_LLM_WORKERS = 2
+# Requests waiting for an LLM worker, and commands waiting on the boards.
+# Beyond either limit new commands are refused with 429 and a Retry-After.
+SERVER_QUEUE_SIZE = 16
+SERVER_MAX_DEVICE_BACKLOG = 8
+SERVER_SESSION_TTL = 8 * 3600 # Seconds a login token stays valid
+SERVER_JOB_HISTORY = 500 # Finished commands kept for status polling
+SERVER_EVENT_QUEUE_SIZE = 100 # Events buffered per /api/events client before it misses some
+# A login is granted to the card scanned on the default board's reader after
+# the request (the board prompts for it), so knowing a UID is not enough.
+# With SERVER_SECRET set, clients without a reader may log in with a UID and
+# that secret instead. None allows scan logins only.
+SERVER_SECRET = None
+SERVER_LOGIN_SCAN_TIMEOUT = 30 # Seconds a login waits for the card
+# After SERVER_LOGIN_MAX_FAILURES failed logins from one address, its next
+# attempts get 429 until SERVER_LOGIN_LOCKOUT_SECONDS after the first failure.
+SERVER_LOGIN_MAX_FAILURES = 5
+SERVER_LOGIN_LOCKOUT_SECONDS = 60
+
 # --- Authentication ---
 # Add your RFID card/fob UIDs here.
 # To find your UID, run the Arduino code and scan your card. The UID will
@@ -11,12 +134,36 @@ AUTHORIZED_UIDS = {
     "0496c72b": "Admin",
     # "29aeaed4": "User1" # Replace with your actual card UID
 }
+# More cards (thousands are fine) go in a CSV file of "uid,user" rows, added
+# to AUTHORIZED_UIDS. UIDs may be written in any case, with or without ':'.
+# The file is checked for changes every CREDENTIALS_RELOAD_SECONDS, so cards
+# can be added or revoked while the program runs. None disables it.
+CREDENTIALS_PATH = "credentials.csv"
+CREDENTIALS_RELOAD_SECONDS = 5
+# Push a hashed allowlist of the cards to the board before authentication, so
+# it grants or denies a scan at once; the host still checks every decision
+# and overrides the board when they disagree. The list holds up to 800 cards;
+# with more, or with False here, every decision is left to the host, a serial
+# round trip later.
+AUTH_ON_DEVICE = True
+# Seconds to wait for a card to be scanned.
+AUTH_SCAN_TIMEOUT = 60
 
 # --- Testing Toggles ---
 # Set to True to simulate Arduino connection for testing without hardware.
 # Set to False for normal operation with a connected Arduino.
 USE_MOCK_ARDUINO = False 
 
+# Mock mode runs the firmware emulator (src/emulator.py). MOCK_TIME_SCALE is
+# how much faster than real time it runs: 1 behaves like the hardware, 0 runs
+# every action instantly (for scripted tests).
+MOCK_TIME_SCALE = 1.0
+MOCK_RANDOM_SEED = 0 # SHAKE is random on the board, seeded here for repeatability
+# Card the emulator "scans" MOCK_RFID_SCAN_MS after authentication starts.
+# None uses the first entry of AUTHORIZED_UIDS.
+MOCK_RFID_UID = None
+MOCK_RFID_SCAN_MS = 2000
+
 # Set to True to bypass RFID authentication for testing purposes.
 # Set to False for normal operation with RFID authentication required.
 BYPASS_RFID_AUTH = False
@@ -24,7 +171,44 @@ BYPASS_RFID_AUTH = False
 # --- Hardware Settings (ignored if USE_MOCK_ARDUINO is True) ---
 SERIAL_PORT = 'COM3'
 SERIAL_BAUDRATE = 115200 # Make sure this matches Arduino
+# Seconds to wait for the Arduino to acknowledge a frame, and to finish an action.
+SERIAL_ACK_TIMEOUT = 0.5
+SERIAL_DONE_TIMEOUT = 30
+# Opening the port resets the Arduino. Startup waits up to this many seconds
+# for the firmware's "Arduino Ready" line, and continues without it (boards
+# that do not reset on open never send it).
+SERIAL_READY_TIMEOUT = 5
 MOTOR_MIN_ANGLE = 0
 MOTOR_MAX_ANGLE = 180
 MOTOR_DEFAULT_STEP = 15
-MOTOR_INITIAL_ANGLE = 90
\ No newline at end of file
+# Largest count (times / repetitions) a command may ask for. Larger ones are
+# clamped to it before they are sent.
+COMMAND_MAX_REPEATS = 10
+MOTOR_INITIAL_ANGLE = 90
+# Physical servo speed, used to predict GOTO travel time (SG90: ~0.1s per 60 deg)
+MOTOR_DEGREES_PER_SECOND = 600
+
+# --- Trajectory streaming ---
+# Plan motions on the host as smooth, velocity- and acceleration-limited
+# trajectories (src/trajectory.py, needs NumPy) and stream them to the board
+# as setpoints, instead of sending the command for the firmware to run as
+# jumps between positions.
+MOTION_STREAMING = False
+MOTION_PROFILE = "scurve" # "trapezoid" (limits acceleration) or "scurve" (also limits jerk)
+MOTION_MAX_VELOCITY = 300 # deg/s
+MOTION_MAX_ACCELERATION = 2000 # deg/s^2
+MOTION_MAX_JERK = 20000 # deg/s^3, S-curve only
+# Setpoints per frame (up to 80), and the share of the serial line a stream
+# may use. Frames grow when the configured size would exceed the share.
+STREAM_CHUNK_SETPOINTS = 32
+STREAM_BANDWIDTH_SHARE = 0.5
+
+# --- Fleet ---
+# Several boards, each on its own serial port: {"name": "port"}. Commands go to
+# the first board unless they name another ("nod on rig2"), a group from
+# BOARD_GROUPS or "all". Leave empty to run SERIAL_PORT as the only board.
+# In mock mode every board gets its own emulator.
+BOARDS = {}
+# e.g. {"rig1": "COM3", "rig2": "COM4", "rig3": "COM5"}
+BOARD_GROUPS = {}
+# e.g. {"left": ["rig1", "rig2"]}
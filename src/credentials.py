@@ -0,0 +1,152 @@
+import csv
+import os
+import re
+import threading
+import time
+import src.config as cfg
+
+# --- Credential store ---
+# The authorized RFID cards: AUTHORIZED_UIDS from config.py plus the rows of
+# a CSV file of "uid,user" (CREDENTIALS_PATH), indexed by normalized UID.
+# The file is re-read when it changes, so cards can be added or revoked
+# without a restart.
+#
+# The board gets a Bloom filter of the UIDs, which it keeps in EEPROM and
+# checks a scanned card against, so it can grant or deny at once. A filter
+# never misses a UID it holds but can match one it does not, so the host
+# checks every decision against the store and overrides the board when they
+# disagree (a false match, or a store changed since the filter was pushed).
+# It fills the Uno's 1 KB of EEPROM, with the hash count that is best for
+# ALLOWLIST_CAPACITY cards; up to that, fewer than 1% of unknown cards match.
+# Beyond it the board is given no filter and the host decides every scan.
+# Mirrors rfid_functions.h.
+ALLOWLIST_BYTES = 1024
+ALLOWLIST_HASHES = 7
+ALLOWLIST_CAPACITY = 800
+
+UID_BYTES = (4, 10) # MFRC522 UIDs are 4, 7 or 10 bytes long
+
+
+def normalize_uid(uid):
+    """'04:96:C7:2B' -> '0496c72b'. None if it is not a card UID."""
+    text = re.sub(r"[\s:-]", "", str(uid)).lower()
+    if not re.fullmatch(r"(?:[0-9a-f]{2})+", text) or not UID_BYTES[0] <= len(text) // 2 <= UID_BYTES[1]:
+        return None
+    return text
+
+def allowlist_bits(uid):
+    """
+    The filter bits a normalized UID sets: FNV-1a over its bytes, split into
+    two 16-bit halves for double hashing, computed as the firmware does.
+    """
+    digest = 2166136261
+    for byte in bytes.fromhex(uid):
+        digest = ((digest ^ byte) * 16777619) & 0xFFFFFFFF
+    first, step = digest & 0xFFFF, (digest >> 16) | 1
+    return [((first + i * step) & 0xFFFF) % (ALLOWLIST_BYTES * 8) for i in range(ALLOWLIST_HASHES)]
+
+
+class CredentialStore:
+    """
+    Authorized card UIDs and their users. Thread-safe: the HTTP server logs
+    clients in from several threads.
+    """
+    def __init__(self, uids=None, path=None, reload_seconds=5):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.static = {}
+        for uid, user in (uids or {}).items():
+            key = normalize_uid(uid)
+            if key is None:
+                print(f"Credentials: ignoring malformed UID {uid!r} in config.py.")
+            else:
+                self.static[key] = user
+        self.index = dict(self.static) # normalized UID -> user
+        self.version = 0 # Bumped on every load, so an outdated board filter can be spotted
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = time.monotonic()
+        self.load()
+
+    @classmethod
+    def from_config(cls):
+        return cls(cfg.AUTHORIZED_UIDS, cfg.CREDENTIALS_PATH, cfg.CREDENTIALS_RELOAD_SECONDS)
+
+    def __len__(self):
+        return len(self.index)
+
+    # --- Loading ---
+    def load(self):
+        """
+        Rebuilds the index from config.py and the file. A missing file leaves
+        just the config entries; an unreadable one keeps the previous index.
+        Rows whose UID is malformed are skipped. Returns True if it was rebuilt.
+        """
+        index = dict(self.static)
+        mtime = None
+        if self.path and os.path.exists(self.path):
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, newline="") as f:
+                    rows = list(csv.reader(f))
+            except OSError as e:
+                print(f"Credentials: could not read {self.path} ({e}), keeping the previous list.")
+                return False
+            skipped = 0
+            for row in rows:
+                if not row or row[0].lstrip().startswith("#") or row[0].strip().lower() == "uid":
+                    continue # Blank lines, comments and the header
+                uid = normalize_uid(row[0])
+                if uid is None:
+                    skipped += 1
+                    continue
+                index[uid] = row[1].strip() if len(row) > 1 and row[1].strip() else uid
+            print(f"Credentials: {len(index)} authorized cards from config.py and {self.path}"
+                  + (f" ({skipped} malformed rows skipped)" if skipped else ""))
+        with self._lock:
+            self.index = index
+            self._mtime = mtime
+            self.version += 1
+        return True
+
+    def refresh(self):
+        """Reloads the file if it changed, checking at most every reload_seconds."""
+        now = time.monotonic()
+        if not self.path or now - self._checked < self.reload_seconds:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.load()
+
+    # --- Lookup ---
+    def lookup(self, uid):
+        """The user of an authorized card UID (in any case or spelling), or None."""
+        self.refresh()
+        key = normalize_uid(uid)
+        with self._lock:
+            return self.index.get(key) if key else None
+
+    def allowlist(self):
+        """
+        The Bloom filter of every authorized UID, ALLOWLIST_BYTES long, for
+        the board. None when there are more than ALLOWLIST_CAPACITY cards,
+        which would make it match too many unknown ones.
+        """
+        with self._lock:
+            uids = list(self.index)
+        if len(uids) > ALLOWLIST_CAPACITY:
+            return None
+        bits = bytearray(ALLOWLIST_BYTES)
+        for uid in uids:
+            for bit in allowlist_bits(uid):
+                bits[bit // 8] |= 1 << (bit % 8)
+        return bytes(bits)
+
+    def false_match_rate(self):
+        """Estimated share of unknown cards the board's filter would grant."""
+        filled = 1 - (1 - 1 / (ALLOWLIST_BYTES * 8)) ** (ALLOWLIST_HASHES * len(self))
+        return filled ** ALLOWLIST_HASHES
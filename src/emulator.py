@@ -0,0 +1,814 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+from enum import Enum
+import src.config as cfg
+from src.arduino import (
+    ALLOWLIST_OPCODE, AUTH_DENIED_PREFIX, AUTH_GRANTED_PREFIX, AUTH_SCAN_PREFIX,
+    FRAME_START, REPLY_ACK, REPLY_DONE, REPLY_NAK, REPLY_START, SEQUENCE_OPCODE,
+    MAX_SEQUENCE_STEPS, STREAM_BUFFER_SIZE, STREAM_FIRST, STREAM_LAST, STREAM_OPCODE,
+    STREAM_PERIOD_MS, SYNC_OPCODE, decode_frame, decode_setpoints, encode_frame
+)
+from src.commands import motion_opcodes
+from src.credentials import ALLOWLIST_BYTES, allowlist_bits
+from src.kinematics import (
+    CENTER_ANGLE, DEFAULT_COUNTS, NOD_RANGE, NOD_SETTLE_MS, NOD_STEP_MS, SHAKE_MAX_MS, SHAKE_MIN_MS,
+    SHAKE_MOVES_PER_TIME, SHAKE_RANGE, SHAKE_SETTLE_MS, SPIN_STEP_MS, SWEEP_STEP_DEG, SWEEP_STEP_MS
+)
+
+# --- Python emulator of servo_lcd_display.ino ---
+# A port of the firmware's loop(): display state machine, LCD contents, motion
+# engine, RFID reader and framed serial protocol, driven by a virtual clock.
+# Keep it in step with the sketch; the constants below mirror config.h,
+# servo_actions.h and the .ino.
+
+INITIAL_ANGLE = 90
+MIN_ANGLE = 0
+MAX_ANGLE = 180
+MAX_QUEUED_STEPS = MAX_SEQUENCE_STEPS
+
+WELCOME_INTERVAL_MS = 3000
+ANIMATION_INTERVAL_MS = 350
+ACTION_DISPLAY_MS = 3000
+SHUTDOWN_DISPLAY_MS = 3000
+RFID_DISPLAY_MS = 4000
+AUTH_FAIL_DISPLAY_MS = 2500
+
+WELCOME_LINES = ("Hello, User", "I am Phi3:mini", "Welcome!", "Nice to meet you",
+                 "Ready for your", "command...")
+THINKING_TEXT = "AI Thinking"
+THINKING_FRAMES = (".  ", ".. ", "...")
+
+# Opcodes, as in serial_protocol.h
+OP_THINKING, OP_IDLE, OP_RESET, OP_SHUTDOWN = "T", "I", "R", "X"
+OP_AWAIT_AUTH, OP_AUTH_SUCCESS, OP_AUTH_FAIL, OP_STOP = "U", "S", "F", "Z"
+# Motion opcodes come from the command registry, as command_table.h does
+OP_GOTO, OP_SPIN, OP_SWEEP, OP_NOD, OP_SHAKE = (motion_opcodes()[name][0]
+                                                for name in ("GOTO", "SPIN", "SWEEP", "NOD", "SHAKE"))
+OP_SHAKE_SILENT = "k"
+OP_STREAM = STREAM_OPCODE
+OP_ALLOWLIST = ALLOWLIST_OPCODE
+OP_SYNC = SYNC_OPCODE
+CONTROL_OPS = "TIRXUSFZ"
+MOTION_OPS = "".join(op for op, _ in motion_opcodes().values())
+
+TEXT_COMMANDS = {
+    "AWAIT_AUTH_CMD": OP_AWAIT_AUTH, "AUTH_FAIL_CMD": OP_AUTH_FAIL,
+    "AUTH_SUCCESS_CMD": OP_AUTH_SUCCESS, "THINKING_START": OP_THINKING,
+    "IDLE_STATE": OP_IDLE, "RESET_STATE": OP_RESET, "SHUTDOWN_CMD": OP_SHUTDOWN,
+    "STOP_MOTION": OP_STOP,
+}
+JSON_COMMANDS = motion_opcodes()
+
+
+class DisplayState(Enum):
+    WELCOME_SEQUENCE = 0
+    AWAITING_AUTH = 1
+    AUTH_FAILURE = 2
+    IDLE = 3
+    THINKING = 4
+    EXECUTING_ACTION = 5
+    SHUTTING_DOWN = 6
+    RFID_DETECTED = 7
+
+
+def frame_payload(line):
+    """
+    The text after a valid frame's opcode. Stream and allowlist frames are
+    decoded from it, since decode_frame() would read an all-digit run of
+    deltas or hex bytes as a number.
+    """
+    return line.strip()[1:].rpartition("*")[0][3:]
+
+
+class VirtualClock:
+    """
+    The emulator's millis(). With a time_scale above 0, virtual time runs
+    that many times faster than real time. With 0 it only moves when the
+    emulator jumps it to the next pending event, so a session runs as fast as
+    the host can talk and every run sees exactly the same timings.
+    """
+    def __init__(self, time_scale):
+        self.time_scale = time_scale
+        self._real_start = time.monotonic()
+        self._virtual = 0.0
+
+    @property
+    def instant(self):
+        return self.time_scale <= 0
+
+    def millis(self):
+        if self.instant:
+            return int(self._virtual)
+        return int((time.monotonic() - self._real_start) * 1000 * self.time_scale)
+
+    def jump_to(self, ms):
+        if self.instant and ms > self._virtual:
+            self._virtual = ms
+
+    def real_seconds_until(self, ms):
+        return max(0.0, (ms - self.millis()) / 1000 / self.time_scale)
+
+
+class LcdBuffer:
+    """16x2 character LCD contents."""
+    COLUMNS = 16
+    ROWS = 2
+
+    def __init__(self):
+        self.clear()
+        self.backlight = True
+
+    def clear(self):
+        self.rows = [[" "] * self.COLUMNS for _ in range(self.ROWS)]
+        self.col, self.row = 0, 0
+
+    def set_cursor(self, col, row):
+        self.col, self.row = col, row
+
+    def print(self, text):
+        for char in str(text):
+            if self.col < self.COLUMNS:
+                self.rows[self.row][self.col] = char
+            self.col += 1
+
+    @property
+    def lines(self):
+        return tuple("".join(row).rstrip() for row in self.rows)
+
+
+class FirmwareEmulator:
+    """
+    The firmware's state machine on a background thread.
+
+    The host side talks to it through EmulatedSerial. present_card() puts an
+    RFID card on the reader. When auth_card is set, that card is presented
+    automatically auth_card_delay_ms after the board starts awaiting
+    authentication. SHAKE uses a seeded random generator, so runs with the
+    same inputs are identical.
+    """
+    def __init__(self, time_scale=1.0, seed=0, auth_card=None, auth_card_delay_ms=2000):
+        self.clock = VirtualClock(time_scale)
+        self.rng = random.Random(seed)
+        self.auth_card = auth_card
+        self.auth_card_delay_ms = auth_card_delay_ms
+        self.lcd = LcdBuffer()
+        self.servo_angle = INITIAL_ANGLE
+        self.servo_log = [] # (ms, angle) for every servo write
+        self.current_angle = INITIAL_ANGLE
+        self.state = DisplayState.WELCOME_SEQUENCE
+        self.halted = False
+
+        self._input = deque()
+        self._output = queue.Queue()
+        self._cond = threading.Condition()
+        self._card = None
+        self._auth_card_at = None
+        self._stopped = False
+        self._thread = None
+
+        # Timers and content state, as in the sketch's globals
+        self.last_welcome_time = 0
+        self.last_animation_time = 0
+        self.action_display_start = 0
+        self.shutdown_start = 0
+        self.rfid_display_start = 0
+        self.auth_fail_display_start = 0
+        self.welcome_index = 0
+        self.animation_frame = 0
+        self.last_frame_seq = 0
+
+        # Motion engine
+        self.step_queue = deque()
+        self.active = None
+        self.stream_buffer = deque()
+        self.stream_open = False
+        self.stream_underruns = 0
+
+        # Authorized-card filter (rfid_functions.cpp), in "EEPROM"
+        self.eeprom = bytearray(ALLOWLIST_BYTES)
+        self.allowlist_ready = False
+
+    # --- Host-facing API ---
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="firmware-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def receive(self, data):
+        """Bytes written by the host."""
+        with self._cond:
+            self._input.append(data)
+            self._cond.notify_all()
+
+    def read_line(self, timeout):
+        try:
+            return self._output.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def pending_output(self):
+        return self._output.qsize()
+
+    def present_card(self, uid):
+        """Puts a card on the reader; it stays there until the firmware reads it."""
+        with self._cond:
+            self._card = uid.lower()
+            self._cond.notify_all()
+
+    # --- Arduino primitives ---
+    def millis(self):
+        return self.clock.millis()
+
+    def serial_println(self, text=""):
+        self._output.put((str(text) + "\n").encode())
+
+    def servo_write(self, angle):
+        self.servo_angle = max(MIN_ANGLE, min(MAX_ANGLE, angle))
+        self.servo_log.append((self.millis(), self.servo_angle))
+
+    def send_reply(self, seq, kind, value=None):
+        self._output.put(encode_frame(seq, kind, () if value is None or value < 0 else (value,),
+                                      start=REPLY_START))
+
+    # --- Main thread loop ---
+    def _run(self):
+        self.setup()
+        serial_buffer = b""
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                data = b"".join(self._input)
+                self._input.clear()
+            serial_buffer += data
+            while b"\n" in serial_buffer and not self.halted:
+                line, serial_buffer = serial_buffer.split(b"\n", 1)
+                line = line.decode("ascii", errors="ignore").strip()
+                if line:
+                    self.handle_line(line)
+            if not self.halted:
+                self.loop()
+            self._wait_for_next_event()
+
+    def _wait_for_next_event(self):
+        due = None if self.halted else self.next_event_time()
+        with self._cond:
+            if self._input or self._stopped:
+                return
+            if self._card is not None and self._card_readable():
+                return
+            if self.clock.instant:
+                if due is not None:
+                    self.clock.jump_to(due)
+                else:
+                    # Nothing but host input or a card can change anything now
+                    self._cond.wait()
+                return
+            timeout = None if due is None else self.clock.real_seconds_until(due)
+            self._cond.wait(timeout if timeout is None else max(timeout, 0.0005))
+
+    def _card_readable(self):
+        return self.state in (DisplayState.IDLE, DisplayState.EXECUTING_ACTION, DisplayState.AWAITING_AUTH)
+
+    def next_event_time(self):
+        """Virtual time of the next timer the loop is waiting on, or None."""
+        times = []
+        if self.active is not None:
+            # A starved stream waits for host input; instant mode does not run its clock on
+            if not (self.clock.instant and self.stream_starved()):
+                times.append(self.active["next_at"])
+        elif self.step_queue:
+            times.append(self.millis())
+        if self._auth_card_at is not None:
+            times.append(self._auth_card_at)
+        state = self.state
+        if state == DisplayState.WELCOME_SEQUENCE:
+            times.append(self.last_welcome_time + WELCOME_INTERVAL_MS + 1)
+        elif state == DisplayState.AUTH_FAILURE:
+            times.append(self.auth_fail_display_start + AUTH_FAIL_DISPLAY_MS + 1)
+        elif state == DisplayState.EXECUTING_ACTION and self.active is None and not self.step_queue:
+            times.append(self.action_display_start + ACTION_DISPLAY_MS + 1)
+        elif state == DisplayState.RFID_DETECTED:
+            times.append(self.rfid_display_start + RFID_DISPLAY_MS + 1)
+        elif state == DisplayState.SHUTTING_DOWN:
+            times.append(self.shutdown_start + SHUTDOWN_DISPLAY_MS + 1)
+        elif state == DisplayState.THINKING and not self.clock.instant:
+            # The animation never ends, so instant mode does not chase it
+            times.append(self.last_animation_time + ANIMATION_INTERVAL_MS + 1)
+        return min(times) if times else None
+
+    # --- setup() / loop() ---
+    def setup(self):
+        self.servo_write(self.current_angle)
+        self.display_welcome_message()
+        self.serial_println("Arduino Ready. To find your card UID for config.py,")
+        self.serial_println("run main.py and scan your card now.")
+
+    def loop(self):
+        now = self.millis()
+        if self._auth_card_at is not None and now >= self._auth_card_at:
+            self._auth_card_at = None
+            if self.state == DisplayState.AWAITING_AUTH:
+                self.present_card(self.auth_card)
+
+        if self.state in (DisplayState.IDLE, DisplayState.EXECUTING_ACTION):
+            self.handle_rfid()
+
+        self.motion_tick(self.millis())
+
+        now = self.millis()
+        state = self.state
+        if state == DisplayState.AUTH_FAILURE:
+            if now - self.auth_fail_display_start > AUTH_FAIL_DISPLAY_MS:
+                self.display_awaiting_auth()
+                self.state = DisplayState.AWAITING_AUTH
+        elif state == DisplayState.AWAITING_AUTH:
+            decision = self.handle_authentication_scan()
+            if decision:
+                self.run_control(decision)
+        elif state == DisplayState.WELCOME_SEQUENCE:
+            if now - self.last_welcome_time > WELCOME_INTERVAL_MS:
+                self.welcome_index += 2
+                if self.welcome_index >= len(WELCOME_LINES):
+                    self.display_idle()
+                else:
+                    self.display_welcome_message()
+        elif state == DisplayState.THINKING:
+            if now - self.last_animation_time > ANIMATION_INTERVAL_MS:
+                self.display_thinking()
+        elif state == DisplayState.EXECUTING_ACTION:
+            if not self.motion_busy() and now - self.action_display_start > ACTION_DISPLAY_MS:
+                self.display_idle()
+        elif state == DisplayState.RFID_DETECTED:
+            if now - self.rfid_display_start > RFID_DISPLAY_MS:
+                self.display_idle()
+        elif state == DisplayState.SHUTTING_DOWN:
+            if now - self.shutdown_start > SHUTDOWN_DISPLAY_MS:
+                self.lcd.clear()
+                self.lcd.backlight = False
+                self.serial_println("Display off. Halting execution.")
+                self.halted = True
+
+    # --- Display functions ---
+    def display_welcome_message(self):
+        self.lcd.clear()
+        self.lcd.print(WELCOME_LINES[self.welcome_index])
+        if self.welcome_index + 1 < len(WELCOME_LINES):
+            self.lcd.set_cursor(0, 1)
+            self.lcd.print(WELCOME_LINES[self.welcome_index + 1])
+        self.last_welcome_time = self.millis()
+
+    def display_awaiting_auth(self):
+        self.lcd.clear()
+        self.lcd.print("Please Scan Card")
+        self.lcd.set_cursor(0, 1)
+        self.lcd.print("to Authenticate")
+        if self.auth_card:
+            self._auth_card_at = self.millis() + self.auth_card_delay_ms
+
+    def display_idle(self):
+        self.lcd.clear()
+        self.lcd.print(f"Angle: {self.current_angle} deg")
+        self.lcd.set_cursor(0, 1)
+        self.lcd.print("Status: Ready")
+        self.state = DisplayState.IDLE
+
+    def display_thinking(self):
+        self.lcd.set_cursor(0, 0)
+        self.lcd.print(THINKING_TEXT)
+        self.lcd.set_cursor(len(THINKING_TEXT), 0)
+        self.lcd.print(THINKING_FRAMES[self.animation_frame])
+        self.animation_frame = (self.animation_frame + 1) % len(THINKING_FRAMES)
+        self.last_animation_time = self.millis()
+
+    def display_action_status(self, line1, line2):
+        self.lcd.clear()
+        self.lcd.print(line1[:16])
+        self.lcd.set_cursor(0, 1)
+        self.lcd.print(line2[:16])
+        self.action_display_start = self.millis()
+        self.state = DisplayState.EXECUTING_ACTION
+
+    # --- RFID ---
+    def _take_card(self):
+        with self._cond:
+            uid, self._card = self._card, None
+        return uid
+
+    def handle_authentication_scan(self):
+        """Returns OP_AUTH_SUCCESS or OP_AUTH_FAIL when the allowlist decided, else None."""
+        uid = self._take_card()
+        if not uid:
+            return None
+        if not self.allowlist_ready:
+            self.serial_println(AUTH_SCAN_PREFIX + uid.upper())
+            return None
+        granted = self.allowlist_contains(uid)
+        self.serial_println((AUTH_GRANTED_PREFIX if granted else AUTH_DENIED_PREFIX) + uid.upper())
+        return OP_AUTH_SUCCESS if granted else OP_AUTH_FAIL
+
+    def load_allowlist(self, payload):
+        """Writes one allowlist frame, "<offset>,<hex bytes>"; False if malformed or out of range."""
+        offset, sep, text = payload.partition(",")
+        try:
+            offset, data = int(offset), bytes.fromhex(text)
+        except ValueError:
+            return False
+        if not sep or " " in text or offset < 0 or offset + len(data) > ALLOWLIST_BYTES:
+            return False
+        if offset == 0:
+            self.allowlist_ready = False # A new list replaces the old one
+        self.eeprom[offset:offset + len(data)] = data
+        if offset + len(data) == ALLOWLIST_BYTES:
+            self.allowlist_ready = True
+        return True
+
+    def allowlist_contains(self, uid):
+        try:
+            bits = allowlist_bits(uid.lower())
+        except ValueError:
+            return False
+        return all(self.eeprom[bit // 8] & (1 << (bit % 8)) for bit in bits)
+
+    def handle_rfid(self):
+        if self.state == DisplayState.RFID_DETECTED:
+            return
+        uid = self._take_card()
+        if not uid:
+            return
+        self.serial_println("Card detected! UID: " + uid)
+        self.state = DisplayState.RFID_DETECTED
+        self.rfid_display_start = self.millis()
+        self.lcd.clear()
+        self.lcd.print("Card Scanned!")
+        self.lcd.set_cursor(0, 1)
+        self.lcd.print("UID: " + uid.upper())
+        self.run_motion(OP_NOD, 1)
+
+    # --- Command handling ---
+    def handle_line(self, line):
+        if line[0] == FRAME_START:
+            self.handle_frame(line)
+        else:
+            self.handle_text_line(line)
+
+    def run_control(self, op):
+        if op == OP_AWAIT_AUTH:
+            self.state = DisplayState.AWAITING_AUTH
+            self.display_awaiting_auth()
+        elif op == OP_AUTH_FAIL:
+            self.state = DisplayState.AUTH_FAILURE
+            self.auth_fail_display_start = self.millis()
+            self.lcd.clear()
+            self.lcd.print("Access Denied!")
+            self.start_shake_silent(1)
+        elif op == OP_AUTH_SUCCESS:
+            self.lcd.clear()
+            self.lcd.print("Authenticated!")
+            self.current_angle = INITIAL_ANGLE
+            self.servo_write(self.current_angle)
+            # Shown like an action status, so the loop keeps running meanwhile
+            self.state = DisplayState.EXECUTING_ACTION
+            self.action_display_start = self.millis()
+        elif op == OP_THINKING:
+            self.state = DisplayState.THINKING
+            self.animation_frame = 0
+            self.last_animation_time = self.millis()
+            self.lcd.clear()
+        elif op == OP_IDLE:
+            self.display_idle()
+        elif op == OP_STOP:
+            self.abort_motion()
+        elif op == OP_RESET:
+            self.serial_println("System reset command received.")
+            self.abort_motion()
+            self.current_angle = INITIAL_ANGLE
+            self.servo_write(self.current_angle)
+            self.state = DisplayState.WELCOME_SEQUENCE
+            self.welcome_index = 0
+            self.display_welcome_message()
+        elif op == OP_SHUTDOWN:
+            self.serial_println("Shutdown command received.")
+            self.abort_motion()
+            self.servo_write(INITIAL_ANGLE)
+            self.state = DisplayState.SHUTTING_DOWN
+            self.shutdown_start = self.millis()
+            self.lcd.clear()
+            self.lcd.print("System")
+            self.lcd.set_cursor(0, 1)
+            self.lcd.print("Shutting Down...")
+
+    def queue_motion_frame(self, seq, op, args):
+        """Queues a motion frame's steps; False (queueing nothing) if malformed or no room."""
+        if op != SEQUENCE_OPCODE:
+            if (op == OP_GOTO and not args) or self.queue_space() == 0:
+                return False
+            # Non-numeric args read as 0, like atoi()
+            value = (args[0] if isinstance(args[0], int) else 0) if args else -1
+            return self.enqueue_step(op, value, seq, True)
+
+        steps = []
+        for step in args:
+            step = str(step)
+            has_value = len(step) > 1
+            if not step or step[0] not in MOTION_OPS or (step[0] == OP_GOTO and not has_value):
+                return False
+            try:
+                steps.append((step[0], int(step[1:]) if has_value else -1))
+            except ValueError:
+                return False
+        if not steps or len(steps) > self.queue_space():
+            return False
+        for i, (step_op, value) in enumerate(steps):
+            self.enqueue_step(step_op, value, seq, i == len(steps) - 1)
+        return True
+
+    def queue_stream_frame(self, seq, line):
+        """Buffers a stream frame; False if malformed or stream_setpoints() rejects it."""
+        chunk = decode_setpoints(frame_payload(line))
+        return chunk is not None and self.stream_setpoints(seq, *chunk)
+
+    def handle_frame(self, line):
+        frame = decode_frame(line)
+        if frame is None:
+            return # Dropped silently; the host re-sends
+        seq, op, args = frame
+        if op == OP_SYNC: # A new connection; forget the previous one's last seq
+            self.last_frame_seq = seq
+            self.send_reply(seq, REPLY_ACK)
+            return
+        if seq == self.last_frame_seq:
+            self.send_reply(seq, REPLY_ACK)
+            return
+        if op in CONTROL_OPS:
+            self.last_frame_seq = seq
+            self.send_reply(seq, REPLY_ACK)
+            self.run_control(op)
+            self.send_reply(seq, REPLY_DONE, self.current_angle)
+        elif (op in MOTION_OPS or op == SEQUENCE_OPCODE) and self.queue_motion_frame(seq, op, args):
+            self.last_frame_seq = seq
+            self.send_reply(seq, REPLY_ACK)
+        elif op == OP_ALLOWLIST and self.load_allowlist(frame_payload(line)):
+            self.last_frame_seq = seq
+            self.send_reply(seq, REPLY_ACK)
+            self.send_reply(seq, REPLY_DONE, self.current_angle)
+        elif op == OP_STREAM and self.queue_stream_frame(seq, line):
+            self.last_frame_seq = seq
+            self.send_reply(seq, REPLY_ACK)
+        else:
+            self.send_reply(seq, REPLY_NAK)
+
+    def handle_text_line(self, line):
+        for name, op in TEXT_COMMANDS.items():
+            if line.upper() == name:
+                self.run_control(op)
+                return
+        try:
+            doc = json.loads(line)
+        except json.JSONDecodeError:
+            self.serial_println("JSON Parse Error: InvalidInput")
+            self.display_action_status("JSON Parse Err!", line)
+            return
+        command = doc.get("command", "") if isinstance(doc, dict) else ""
+        if command in JSON_COMMANDS:
+            op, param = JSON_COMMANDS[command]
+            value = doc.get(param)
+            self.run_motion(op, value if isinstance(value, int) else -1)
+            return
+        self.serial_println(f"Unknown JSON command: {command}")
+        self.display_action_status("Unknown Command", str(command))
+
+    # --- Motion engine (servo_actions.cpp) ---
+    def execute_goto(self, angle):
+        angle = max(MIN_ANGLE, min(MAX_ANGLE, angle))
+        self.display_action_status("Moving to Angle", f"{angle} deg")
+        self.current_angle = angle
+        self.servo_write(angle)
+        self.serial_println(f"Motor moved to: {angle}")
+
+    def start_shake_silent(self, times):
+        self.abort_motion()
+        self.enqueue_step(OP_SHAKE_SILENT, times, 0, True)
+
+    def run_motion(self, op, value):
+        if not self.enqueue_step(op, value, 0, True):
+            self.serial_println("Motion queue full, command dropped.")
+
+    def queue_space(self):
+        return MAX_QUEUED_STEPS - len(self.step_queue)
+
+    def enqueue_step(self, op, value, seq, last):
+        if len(self.step_queue) >= MAX_QUEUED_STEPS:
+            return False
+        self.step_queue.append({"op": op, "value": value, "seq": seq, "last": last})
+        return True
+
+    def clear_queue(self):
+        while self.step_queue:
+            step = self.step_queue.popleft()
+            if step["last"] and step["seq"]:
+                self.send_reply(step["seq"], REPLY_DONE, self.current_angle)
+
+    def motion_busy(self):
+        return self.active is not None or bool(self.step_queue)
+
+    def begin_motion(self, step, now):
+        op, value = step["op"], step["value"]
+        active = {"op": op, "seq": step["seq"], "last": step["last"], "step": 0,
+                  "start_angle": self.servo_angle, "next_at": now}
+        if op == OP_SPIN:
+            active["count"] = DEFAULT_COUNTS["SPIN"] if value < 0 else value
+            active["total"] = active["count"] * 2
+            self.display_action_status("Action: Spin", f"Times: {active['count']}")
+            self.serial_println("Executing spin sequence...")
+        elif op == OP_SWEEP:
+            active["count"] = DEFAULT_COUNTS["SWEEP"] if value < 0 else value
+            positions = (MAX_ANGLE - MIN_ANGLE) // SWEEP_STEP_DEG + 1
+            active["total"] = active["count"] * 2 * positions
+            self.display_action_status("Action: Sweep", f"Reps: {active['count']}")
+            self.serial_println("Executing sweep sequence...")
+        elif op == OP_NOD:
+            active["count"] = DEFAULT_COUNTS["NOD"] if value < 0 else value
+            active["total"] = 1 + active["count"] * 2
+            self.display_action_status("Action: Nod", f"Times: {active['count']}")
+            self.serial_println("Executing nod sequence...")
+        elif op in (OP_SHAKE, OP_SHAKE_SILENT):
+            active["count"] = DEFAULT_COUNTS["SHAKE"] if value < 0 else value
+            active["total"] = 1 + active["count"] * SHAKE_MOVES_PER_TIME
+            if op == OP_SHAKE:
+                self.display_action_status("Action: Shake", f"Times: {active['count']}")
+                self.serial_println("Executing chaotic shake sequence...")
+        elif op == OP_STREAM:
+            active["count"] = 0
+            active["total"] = 0 # Runs until the stream is closed and played
+            self.display_action_status("Action: Stream", "Smooth motion")
+            self.serial_println("Executing streamed motion...")
+        else: # OP_GOTO
+            active["count"] = value
+            active["total"] = 0
+        self.active = active
+
+    def advance_motion(self):
+        """Runs the current step. Returns the delay until the next one in ms."""
+        active = self.active
+        index = active["step"]
+        active["step"] += 1
+        op = active["op"]
+        if op == OP_SPIN:
+            self.servo_write(MIN_ANGLE if index % 2 == 0 else MAX_ANGLE)
+            return SPIN_STEP_MS
+        if op == OP_SWEEP:
+            positions = (MAX_ANGLE - MIN_ANGLE) // SWEEP_STEP_DEG + 1
+            offset = index % (positions * 2)
+            if offset < positions:
+                self.servo_write(MIN_ANGLE + offset * SWEEP_STEP_DEG)
+            else:
+                self.servo_write(MAX_ANGLE - (offset - positions) * SWEEP_STEP_DEG)
+            return SWEEP_STEP_MS
+        if op == OP_NOD:
+            if index == 0:
+                self.servo_write(CENTER_ANGLE)
+                return NOD_SETTLE_MS
+            self.servo_write(CENTER_ANGLE - NOD_RANGE if index % 2 == 1 else CENTER_ANGLE + NOD_RANGE)
+            return NOD_STEP_MS
+        if op == OP_STREAM:
+            if self.stream_buffer:
+                self.servo_write(self.stream_buffer.popleft())
+            else:
+                self.stream_underruns += 1 # Hold position until more setpoints arrive
+            return STREAM_PERIOD_MS
+        # OP_SHAKE, OP_SHAKE_SILENT
+        if index == 0:
+            self.servo_write(CENTER_ANGLE)
+            return SHAKE_SETTLE_MS
+        self.servo_write(self.rng.randrange(CENTER_ANGLE - SHAKE_RANGE, CENTER_ANGLE + SHAKE_RANGE + 1))
+        return self.rng.randrange(SHAKE_MIN_MS, SHAKE_MAX_MS)
+
+    def finish_motion(self):
+        active, self.active = self.active, None
+        op = active["op"]
+        if op == OP_GOTO:
+            self.execute_goto(active["count"])
+        elif op in (OP_SPIN, OP_SWEEP):
+            self.servo_write(active["start_angle"])
+            self.current_angle = active["start_angle"]
+            self.serial_println("Spin sequence complete." if op == OP_SPIN else "Sweep sequence complete.")
+        elif op in (OP_NOD, OP_SHAKE):
+            self.servo_write(CENTER_ANGLE)
+            self.current_angle = CENTER_ANGLE
+            self.serial_println("Nod sequence complete." if op == OP_NOD else "Shake sequence complete.")
+        elif op == OP_SHAKE_SILENT:
+            self.servo_write(CENTER_ANGLE)
+        elif op == OP_STREAM:
+            self.current_angle = self.servo_angle
+            self.serial_println(f"Stream complete, underruns: {self.stream_underruns}")
+        if active["last"] and active["seq"]:
+            self.send_reply(active["seq"], REPLY_DONE, self.current_angle)
+
+    def motion_done(self):
+        if self.active["op"] == OP_STREAM:
+            return not self.stream_open and not self.stream_buffer
+        return self.active["step"] >= self.active["total"]
+
+    def motion_tick(self, now):
+        """Runs every step that is due, scheduling each from the previous one's due time."""
+        while True:
+            if self.active is None:
+                if not self.step_queue:
+                    return
+                self.begin_motion(self.step_queue.popleft(), now)
+            if now < self.active["next_at"]:
+                return
+            if self.motion_done():
+                self.finish_motion()
+            else:
+                self.active["next_at"] += self.advance_motion()
+
+    def abort_motion(self):
+        if self.active is not None:
+            active, self.active = self.active, None
+            if active["op"] != OP_SHAKE_SILENT:
+                self.current_angle = self.servo_angle
+            if active["last"] and active["seq"]:
+                self.send_reply(active["seq"], REPLY_DONE, self.current_angle)
+            self.serial_println("Motion preempted.")
+        self.clear_queue()
+        # Later frames of an interrupted stream are rejected
+        self.stream_open = False
+        self.stream_buffer.clear()
+
+    # --- Setpoint streaming ---
+    def stream_starved(self):
+        """True while a running stream waits for setpoints."""
+        return (self.active is not None and self.active["op"] == OP_STREAM
+                and self.stream_open and not self.stream_buffer)
+
+    def stream_setpoints(self, seq, setpoints, flags):
+        """
+        Buffers one stream frame's setpoints. The first frame starts the
+        stream motion (only when nothing else is running or queued); later
+        ones extend it. False, buffering nothing, if a setpoint is out of
+        range, the frame is out of turn or there is no room for all of it.
+        """
+        starting = bool(flags & STREAM_FIRST)
+        if (self.motion_busy() if starting else not self.stream_open):
+            return False
+        if len(setpoints) > STREAM_BUFFER_SIZE - (0 if starting else len(self.stream_buffer)):
+            return False
+        if any(not MIN_ANGLE <= angle <= MAX_ANGLE for angle in setpoints):
+            return False
+        if starting:
+            self.stream_buffer.clear()
+            self.stream_underruns = 0
+            self.stream_open = True
+            self.enqueue_step(OP_STREAM, -1, 0, False)
+        self.stream_buffer.extend(setpoints)
+        if flags & STREAM_LAST:
+            # The stream motion now ends with this frame, which gets its DONE
+            self.stream_open = False
+            owner = self.active if self.active is not None else self.step_queue[0]
+            owner["seq"], owner["last"] = seq, True
+        return True
+
+
+class EmulatedSerial:
+    """The subset of serial.Serial that ArduinoController uses, backed by a FirmwareEmulator."""
+    def __init__(self, emulator, timeout=1):
+        self.emulator = emulator
+        self.timeout = timeout
+        self.is_open = True
+
+    def write(self, data):
+        self.emulator.receive(data)
+        return len(data)
+
+    def readline(self):
+        return self.emulator.read_line(self.timeout) or b""
+
+    @property
+    def in_waiting(self):
+        return self.emulator.pending_output()
+
+    def close(self):
+        self.is_open = False
+        self.emulator.stop()
+
+
+def create_emulator():
+    """Builds an emulator from the MOCK_* settings in config.py."""
+    auth_card = cfg.MOCK_RFID_UID
+    if auth_card is None and cfg.AUTHORIZED_UIDS:
+        auth_card = next(iter(cfg.AUTHORIZED_UIDS))
+    return FirmwareEmulator(
+        time_scale=cfg.MOCK_TIME_SCALE, seed=cfg.MOCK_RANDOM_SEED,
+        auth_card=auth_card, auth_card_delay_ms=cfg.MOCK_RFID_SCAN_MS
+    )
@@ -0,0 +1,216 @@
+import contextvars
+import queue
+import re
+import threading
+from concurrent.futures import Future
+import src.config as cfg
+from src.arduino import ArduinoController
+from src.kinematics import ServoTwin
+
+# Targets that address every board.
+ALL_TARGETS = ("all", "every", "everyone", "everywhere", "allrigs", "allboards", "everyrig", "everyboard", "*")
+
+# "... on rig 2", "... for the left group", "... at all rigs"
+SELECTOR_PATTERN = re.compile(r"\b(?:on|for|at)\s+(?:the\s+)?", re.IGNORECASE)
+
+
+def normalize_name(name):
+    """'Rig 2', 'rig-2' and 'RIG2' all become 'rig2'."""
+    return re.sub(r"[^a-z0-9*]", "", str(name).lower())
+
+
+class Board:
+    """
+    One rig: its serial controller, its own twin (angle state) and an I/O
+    worker thread. Work for a board runs on its worker in submission order,
+    so a long motion on one board never holds up another.
+    """
+    def __init__(self, name, port, baudrate):
+        self.name = name
+        self.arduino = ArduinoController(port, baudrate)
+        self.twin = ServoTwin(
+            cfg.MOTOR_INITIAL_ANGLE, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE,
+            cfg.MOTOR_DEGREES_PER_SECOND
+        )
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"board-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, func):
+        """
+        Queues func() on this board's worker. Returns a Future with its result.
+        func runs in a copy of the caller's context, so it keeps the trace id.
+        """
+        future = Future()
+        self._queue.put((future, contextvars.copy_context(), func))
+        return future
+
+    @property
+    def pending(self):
+        """Work items queued on this board and not started yet."""
+        return self._queue.qsize()
+
+    def clear_pending(self):
+        """Drops work that has not started yet. Returns how many items were dropped."""
+        dropped = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return dropped
+            if item is None:
+                # Keep the stop marker
+                self._queue.put(None)
+                return dropped
+            item[0].cancel()
+            dropped += 1
+
+    def stop(self):
+        """Lets queued work finish, then stops the worker."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, context, func = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(context.run(func))
+            except Exception as e:
+                print(f"[{self.name}] Error: {e}")
+                future.set_exception(e)
+
+
+class Fleet:
+    """
+    Registry of named boards. The first board is the default target and the
+    one that handles RFID authentication.
+    """
+    def __init__(self, boards, groups=None):
+        self.boards = {board.name: board for board in boards}
+        self.default = boards[0]
+        self.group_names = list(groups or {})
+        self.groups = {normalize_name(name): members for name, members in (groups or {}).items()}
+
+    @classmethod
+    def from_config(cls):
+        """Builds the fleet from cfg.BOARDS, or a single board on cfg.SERIAL_PORT."""
+        ports = cfg.BOARDS or {"main": cfg.SERIAL_PORT}
+        boards = [Board(name, port, cfg.SERIAL_BAUDRATE) for name, port in ports.items()]
+        return cls(boards, cfg.BOARD_GROUPS)
+
+    def __iter__(self):
+        return iter(self.boards.values())
+
+    def __len__(self):
+        return len(self.boards)
+
+    @property
+    def names(self):
+        return list(self.boards)
+
+    def target_names(self):
+        """Everything a command may name as its device: boards, groups and 'all'."""
+        return self.names + self.group_names + ["all"]
+
+    def select(self, target):
+        """
+        Returns the boards a device selector refers to: None means the default
+        board, then a board name, a group, 'all', or a board's number ('2'
+        for 'rig2'). Returns an empty list for an unknown target.
+        """
+        if target is None or target == "":
+            return [self.default]
+        key = normalize_name(target)
+        if key in ALL_TARGETS:
+            return list(self)
+        if key in self.groups:
+            return [board for name in self.groups[key] for board in self.select(name)]
+
+        by_name = {normalize_name(name): board for name, board in self.boards.items()}
+        if key in by_name:
+            return [by_name[key]]
+        # "rig 2" with boards named "rig2"... or just "2"
+        number = re.search(r"(\d+)$", key)
+        if number:
+            matches = [board for name, board in by_name.items()
+                       if re.search(rf"(?<!\d){number.group(1)}$", name)]
+            if len(matches) == 1:
+                return matches
+        return []
+
+    def split_target(self, user_input):
+        """
+        Separates a trailing device selector from a request:
+        'nod twice on rig 2' -> ('nod twice', 'rig 2'). Only selectors that
+        name a known board, group or 'all' are split off.
+        Returns (text, target), with target None when there is none.
+        """
+        text = user_input.strip().rstrip(".!?")
+        if text.lower().endswith(" everywhere"):
+            return text[:-len(" everywhere")].rstrip(" ,"), "all"
+        # The last "on ..." is the shortest candidate, so try that first
+        for match in reversed(list(SELECTOR_PATTERN.finditer(text))):
+            target = re.sub(r"\s+group$", "", text[match.end():].strip(), flags=re.IGNORECASE)
+            if target and self.select(target):
+                return text[:match.start()].rstrip(" ,"), target
+        return user_input, None
+
+    def connect(self):
+        """Connects every board in parallel and starts its worker. Returns True if all connected."""
+        results = {}
+        def connect_one(board):
+            results[board.name] = board.arduino.connect()
+        threads = [threading.Thread(target=connect_one, args=(board,)) for board in self]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for board in self:
+            if results[board.name]:
+                board.start()
+            else:
+                print(f"Board '{board.name}' failed to connect on {board.arduino.port}.")
+        return all(results.values())
+
+    def run(self, boards, func, wait=True):
+        """
+        Runs func(board) on each board's worker. With wait, blocks until all
+        have finished and returns their results; otherwise returns the futures.
+        """
+        futures = [board.submit(lambda board=board: func(board)) for board in boards]
+        if not wait:
+            return futures
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception:
+                results.append(False)
+        return results
+
+    def broadcast(self, func, wait=True):
+        return self.run(list(self), func, wait)
+
+    def pending(self):
+        return sum(board.pending for board in self)
+
+    def clear_pending(self, boards=None):
+        """Drops work queued on the given boards (every board by default). Returns the number of items dropped."""
+        return sum(board.clear_pending() for board in (self if boards is None else boards))
+
+    def disconnect(self):
+        for board in self:
+            board.stop()
+            board.arduino.disconnect()
@@ -0,0 +1,134 @@
+import time
+from collections import namedtuple
+from src.commands import count_params
+
+# Action timing, mirrored from servo_actions.h. Keep the two in sync.
+SPIN_STEP_MS = 400
+SWEEP_STEP_MS = 15
+SWEEP_STEP_DEG = 2
+NOD_SETTLE_MS = 200
+NOD_STEP_MS = 300
+SHAKE_SETTLE_MS = 200
+SHAKE_MOVES_PER_TIME = 6
+SHAKE_MIN_MS = 70
+SHAKE_MAX_MS = 150 # Exclusive, as in Arduino's random()
+CENTER_ANGLE = 90
+NOD_RANGE = 30
+SHAKE_RANGE = 45
+
+# Firmware defaults applied when a count is missing, from the command registry.
+DEFAULT_COUNTS = {name: default for name, (_, default) in count_params().items()}
+COUNT_PARAMS = {name: param for name, (param, _) in count_params().items()}
+
+# seconds is the expected duration, max_seconds the worst case (SHAKE uses
+# random step delays).
+MotionPrediction = namedtuple("MotionPrediction", ["end_angle", "seconds", "max_seconds"])
+
+
+class ServoTwin:
+    """
+    Host-side model of the servo and the firmware motion engine.
+
+    Predicts the end angle and duration of each command from the same
+    timings the firmware uses, tracks when the device will be free, and
+    reports drift when the Arduino's DONE disagrees with the prediction.
+    """
+    def __init__(self, angle, min_angle, max_angle, degrees_per_second):
+        self.angle = angle
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        # Physical servo speed, used for the travel time of a GOTO
+        self.degrees_per_second = degrees_per_second
+        self.busy_until = 0.0
+        self.drift_events = 0
+
+    def _count(self, command_dict):
+        cmd = command_dict["command"]
+        value = command_dict.get(COUNT_PARAMS[cmd])
+        return DEFAULT_COUNTS[cmd] if value is None else int(value)
+
+    def _travel(self, start_angle, end_angle):
+        return abs(end_angle - start_angle) / self.degrees_per_second
+
+    def predict(self, command_dict, start_angle):
+        """
+        Predicts the end angle and duration of a resolved command (ADJUST must
+        already be turned into GOTO) starting from start_angle.
+        """
+        cmd = command_dict.get("command")
+
+        if cmd == "GOTO":
+            end = max(self.min_angle, min(self.max_angle, int(command_dict.get("angle", 0))))
+            seconds = self._travel(start_angle, end)
+            return MotionPrediction(end, seconds, seconds)
+
+        if cmd == "SPIN":
+            ms = self._count(command_dict) * 2 * SPIN_STEP_MS
+            seconds = ms / 1000 + self._travel(self.max_angle, start_angle)
+            return MotionPrediction(start_angle, seconds, seconds)
+
+        if cmd == "SWEEP":
+            positions = (self.max_angle - self.min_angle) // SWEEP_STEP_DEG + 1
+            ms = self._count(command_dict) * 2 * positions * SWEEP_STEP_MS
+            seconds = ms / 1000 + self._travel(self.min_angle, start_angle)
+            return MotionPrediction(start_angle, seconds, seconds)
+
+        if cmd == "NOD":
+            ms = NOD_SETTLE_MS + self._count(command_dict) * 2 * NOD_STEP_MS
+            return MotionPrediction(CENTER_ANGLE, ms / 1000, ms / 1000)
+
+        if cmd == "SHAKE":
+            moves = self._count(command_dict) * SHAKE_MOVES_PER_TIME
+            expected = SHAKE_SETTLE_MS + moves * (SHAKE_MIN_MS + SHAKE_MAX_MS - 1) / 2
+            worst = SHAKE_SETTLE_MS + moves * (SHAKE_MAX_MS - 1)
+            return MotionPrediction(CENTER_ANGLE, expected / 1000, worst / 1000)
+
+        if cmd == "SEQUENCE":
+            angle, seconds, max_seconds = start_angle, 0.0, 0.0
+            for step in command_dict.get("steps", []):
+                step_prediction = self.predict(step, angle)
+                angle = step_prediction.end_angle
+                seconds += step_prediction.seconds
+                max_seconds += step_prediction.max_seconds
+            return MotionPrediction(angle, seconds, max_seconds)
+
+        raise ValueError(f"Cannot predict unknown command: {cmd}")
+
+    def commit(self, command_dict, prediction=None):
+        """
+        Records that a command was sent. The firmware queues motions, so it
+        starts when the previous one ends. prediction replaces the model's,
+        for a streamed trajectory whose timing the planner already knows.
+        Returns the prediction.
+        """
+        prediction = prediction or self.predict(command_dict, self.angle)
+        start = max(time.monotonic(), self.busy_until)
+        self.busy_until = start + prediction.seconds
+        self.angle = prediction.end_angle
+        return prediction
+
+    def seconds_until_free(self):
+        return max(0.0, self.busy_until - time.monotonic())
+
+    def is_busy(self):
+        return self.seconds_until_free() > 0
+
+    def observe(self, reported_angle, prediction):
+        """
+        Compares a DONE angle report with the prediction. On disagreement the
+        report wins, since it is what the firmware actually did.
+        Returns the drift in degrees.
+        """
+        drift = reported_angle - prediction.end_angle
+        if drift:
+            self.drift_events += 1
+            print(f"Twin drift: predicted end angle {prediction.end_angle}, "
+                  f"Arduino reported {reported_angle} ({drift:+d} deg).")
+            self.angle = reported_angle
+        # DONE means the firmware is idle, whatever the model expected
+        self.busy_until = time.monotonic()
+        return drift
+
+    def reset(self, angle):
+        self.angle = angle
+        self.busy_until = 0.0
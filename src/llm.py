@@ -1,42 +1,563 @@
 import requests
 import re
 import json
+import threading
+import time
+from requests.adapters import HTTPAdapter
+import src.config as cfg
+import src.metrics as metrics
+from src.commands import (
+    count_params, format_example, num_predict_budget, prompt_command_section, select_examples,
+    validate_command
+)
+
+class OllamaClient:
+    """
+    Pooled HTTP client for the Ollama API.
+    Keeps connections open between requests, preloads the model and can
+    re-warm it in the background after idle periods.
+    """
+    def __init__(self, api_url, model, keep_alive):
+        self.api_url = api_url
+        self.base_url = api_url.split("/api/")[0]
+        self.model = model
+        self.keep_alive = keep_alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.last_used = time.monotonic()
+        self._stop_event = threading.Event()
+        self._rewarm_thread = None
+
+    def get(self, path, **kwargs):
+        return self.session.get(f"{self.base_url}{path}", **kwargs)
+
+    def post(self, url, payload, **kwargs):
+        """Posts to a full URL, adding the keep_alive setting to the payload."""
+        payload.setdefault("keep_alive", self.keep_alive)
+        self.last_used = time.monotonic()
+        return self.session.post(url, json=payload, **kwargs)
+
+    def check_availability(self):
+        """Check if Ollama is running and accessible."""
+        try:
+            # Try to ping the Ollama API
+            response = self.get("/api/tags", timeout=5)
+            response.raise_for_status()
+            print("Ollama is running and accessible")
+            return True
+        except requests.exceptions.ConnectionError:
+            print(f"Error: Ollama is not running or not accessible at {self.base_url}")
+            print("Please start Ollama and try again.")
+            return False
+        except requests.exceptions.RequestException as e:
+            print(f"Error checking Ollama availability: {e}")
+            return False
+
+    def preload(self):
+        """
+        Loads the model into memory without generating anything, so the first
+        real command does not pay the load time. Returns True on success.
+        """
+        start_time = time.perf_counter()
+        try:
+            # An empty prompt makes Ollama load the model and return immediately
+            response = self.post(self.api_url, {"model": self.model, "prompt": ""}, timeout=120)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Error preloading model {self.model}: {e}")
+            return False
+        print(f"Model {self.model} loaded in {time.perf_counter() - start_time:.1f}s "
+              f"(keep_alive={self.keep_alive})")
+        return True
+
+    def start_rewarm(self, idle_seconds):
+        """Starts a daemon thread that re-warms the model after idle_seconds without use."""
+        if self._rewarm_thread or idle_seconds <= 0:
+            return
+        def rewarm_loop():
+            while not self._stop_event.wait(min(idle_seconds, 30)):
+                if time.monotonic() - self.last_used >= idle_seconds:
+                    self.preload()
+        self._rewarm_thread = threading.Thread(target=rewarm_loop, name="ollama-rewarm", daemon=True)
+        self._rewarm_thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        self.session.close()
+
+
+class OllamaBackend:
+    """One Ollama server behind the gateway: its client, health and recent latency."""
+    def __init__(self, client):
+        self.client = client
+        self.name = client.base_url
+        self.healthy = True
+        self.failures = 0 # Consecutive
+        self.open_until = 0.0 # Circuit breaker: skipped until then
+        self.latency = None # Weighted towards recent requests
+        self.in_flight = 0
+
+    def available(self, now):
+        return self.healthy and now >= self.open_until
+
+    def score(self):
+        """Expected wait: recent latency times the requests it is already serving."""
+        return (self.latency or 0.0) * (self.in_flight + 1)
+
+
+class _Flight:
+    """An upstream request that identical callers wait on."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class OllamaGateway:
+    """
+    Routes Ollama requests over one or more servers (cfg.OLLAMA_BACKENDS).
+
+    Each request goes to the available backend with the lowest expected wait
+    (recent latency x requests in flight) and fails over to the next one on
+    a connection error, timeout or 5xx. A backend that fails
+    OLLAMA_BREAKER_FAILURES times in a row is skipped for
+    OLLAMA_BREAKER_COOLDOWN seconds, then tried again; one that fails the
+    periodic /api/tags health check is skipped until it passes. Identical
+    requests in flight at the same time share one upstream generation.
+
+    Offers the same interface as OllamaClient, so with a single backend it
+    behaves like one.
+    """
+    def __init__(self, api_url, backends, model, keep_alive):
+        self.api_url = api_url
+        self.model = model
+        self.keep_alive = keep_alive
+        self.path = "/api/" + api_url.split("/api/", 1)[1]
+        urls = backends or [api_url.split("/api/")[0]]
+        self.backends = [OllamaBackend(OllamaClient(f"{url.rstrip('/')}{self.path}", model, keep_alive))
+                         for url in urls]
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stop_event = threading.Event()
+        self._health_thread = None
+
+    @property
+    def last_used(self):
+        return max(backend.client.last_used for backend in self.backends)
+
+    def ranked(self):
+        """Backends to try, best first. When none is available, all are tried, longest-closed first."""
+        now = time.monotonic()
+        with self._lock:
+            usable = [backend for backend in self.backends if backend.available(now)]
+            if usable:
+                return sorted(usable, key=OllamaBackend.score)
+            return sorted(self.backends, key=lambda backend: backend.open_until)
+
+    def get(self, path, **kwargs):
+        return self.ranked()[0].client.get(path, **kwargs)
+
+    def post(self, url, payload, **kwargs):
+        """
+        Posts to the best backend, keeping url's path and replacing its host.
+        Fails over to the next backend on an error. Raises the last error
+        when every backend failed.
+        """
+        path = "/api/" + url.split("/api/", 1)[1]
+        candidates = self.ranked()
+        error = None
+        for backend in candidates:
+            with self._lock:
+                backend.in_flight += 1
+            start = time.perf_counter()
+            try:
+                response = backend.client.post(f"{backend.name}{path}", dict(payload), **kwargs)
+                if response.status_code >= 500:
+                    response.close()
+                    raise requests.exceptions.HTTPError(
+                        f"{response.status_code} Server Error from {backend.name}", response=response)
+            except requests.exceptions.RequestException as e:
+                error = e
+                self._record_failure(backend)
+                if backend is not candidates[-1]:
+                    print(f"Ollama at {backend.name} failed ({e}), trying the next backend.")
+                    metrics.inc("ollama_failovers_total")
+                continue
+            finally:
+                with self._lock:
+                    backend.in_flight -= 1
+            self._record_success(backend, time.perf_counter() - start)
+            response.ollama_backend = backend
+            return response
+        raise error
+
+    def report_failure(self, response):
+        """Counts an error found after post() returned (a stalled stream, a bad body)."""
+        backend = getattr(response, "ollama_backend", None)
+        if backend is not None:
+            self._record_failure(backend)
+
+    def _record_success(self, backend, seconds):
+        with self._lock:
+            backend.failures = 0
+            backend.open_until = 0.0
+            backend.latency = seconds if backend.latency is None else 0.7 * backend.latency + 0.3 * seconds
+        metrics.observe("ollama_backend_seconds", seconds, backend=backend.name)
+
+    def _record_failure(self, backend):
+        metrics.inc("ollama_backend_failures_total", backend=backend.name)
+        with self._lock:
+            backend.failures += 1
+            if backend.failures < cfg.OLLAMA_BREAKER_FAILURES:
+                return
+            backend.open_until = time.monotonic() + cfg.OLLAMA_BREAKER_COOLDOWN
+        print(f"Ollama at {backend.name} failed {backend.failures} times in a row; "
+              f"skipping it for {cfg.OLLAMA_BREAKER_COOLDOWN}s.")
+
+    def single_flight(self, key, func):
+        """
+        Runs func() once for concurrent callers with the same key: the first
+        caller runs it and the others wait for its result (or error).
+        Returns (result, coalesced), coalesced being True for the waiters.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            metrics.inc("ollama_coalesced_total")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = func()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _ping(self, backend):
+        try:
+            backend.client.get("/api/tags", timeout=5).raise_for_status()
+            healthy = True
+        except requests.exceptions.RequestException:
+            healthy = False
+        if healthy != backend.healthy:
+            print(f"Ollama at {backend.name} is {'back up' if healthy else 'not responding'}.")
+        backend.healthy = healthy
+        return healthy
+
+    def check_availability(self):
+        """Checks every backend. True if at least one is running."""
+        if len(self.backends) == 1:
+            backend = self.backends[0]
+            backend.healthy = backend.client.check_availability()
+            return backend.healthy
+        for backend in self.backends:
+            print(f"Ollama at {backend.name}: {'OK' if self._ping(backend) else 'not responding'}")
+        if not any(backend.healthy for backend in self.backends):
+            print("Error: none of the Ollama backends is running. Please start Ollama and try again.")
+            return False
+        return True
+
+    def start_health_checks(self, interval):
+        """Starts a daemon thread re-checking every backend each interval seconds."""
+        if self._health_thread or interval <= 0 or len(self.backends) == 1:
+            return
+        def health_loop():
+            while not self._stop_event.wait(interval):
+                for backend in self.backends:
+                    self._ping(backend)
+        self._health_thread = threading.Thread(target=health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def preload(self):
+        """Loads the model on every healthy backend in parallel. True if any loaded."""
+        results = []
+        def preload_one(backend):
+            results.append(backend.client.preload())
+        threads = [threading.Thread(target=preload_one, args=(backend,))
+                   for backend in self.backends if backend.healthy]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return any(results)
+
+    def start_rewarm(self, idle_seconds):
+        for backend in self.backends:
+            backend.client.start_rewarm(idle_seconds)
+
+    def close(self):
+        self._stop_event.set()
+        for backend in self.backends:
+            backend.client.close()
+
+_client = None
+
+def get_ollama_client():
+    """Returns the shared OllamaGateway, creating it from config on first use."""
+    global _client
+    if _client is None:
+        _client = OllamaGateway(cfg.OLLAMA_API_URL, cfg.OLLAMA_BACKENDS, cfg.OLLAMA_MODEL,
+                                cfg.OLLAMA_KEEP_ALIVE)
+    return _client
 
 def check_ollama_availability():
     """Check if Ollama is running and accessible."""
-    try:
-        # Try to ping the Ollama API
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        response.raise_for_status()
-        print("Ollama is running and accessible")
-        return True
-    except requests.exceptions.ConnectionError:
-        print("Error: Ollama is not running or not accessible at localhost:11434")
-        print("Please start Ollama and try again.")
-        return False
-    except requests.exceptions.RequestException as e:
-        print(f"Error checking Ollama availability: {e}")
-        return False
+    return get_ollama_client().check_availability()
 
-def send_to_ollama(prompt_text, api_url, model):
+class PromptEvalStats:
+    """
+    Collects Ollama's prompt evaluation telemetry, grouped by prompt layout,
+    so the split system prompt can be compared against the inlined one.
+    Thread-safe: the HTTP server runs several LLM workers.
+    """
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, layout, response_data):
+        """Records the prompt_eval_* fields from a finished Ollama response."""
+        if "prompt_eval_count" not in response_data:
+            return
+        with self._lock:
+            entry = self.samples.setdefault(layout, {"requests": 0, "tokens": 0, "nanoseconds": 0})
+            entry["requests"] += 1
+            entry["tokens"] += response_data.get("prompt_eval_count", 0)
+            entry["nanoseconds"] += response_data.get("prompt_eval_duration", 0)
+
+    def report(self):
+        with self._lock:
+            samples = {layout: dict(entry) for layout, entry in self.samples.items()}
+        if not samples:
+            return "Prompt eval: no completed generations recorded yet"
+        lines = []
+        for layout, entry in samples.items():
+            n = entry["requests"]
+            lines.append(f"Prompt eval ({layout}): {n} requests, avg {entry['tokens'] / n:.0f} tokens, "
+                         f"avg {entry['nanoseconds'] / n / 1e6:.0f} ms")
+        return "\n".join(lines)
+
+prompt_eval_stats = PromptEvalStats()
+
+def _prompt_layout(system_prompt):
+    return "split" if system_prompt else "inline"
+
+def _generate_payload(prompt_text, model, stream, system_prompt, schema, options=None):
+    """
+    With a schema (see src/commands.py) Ollama can only generate JSON that
+    matches it, and num_predict is cut to the longest answer it allows.
+    Without one it falls back to free-form JSON mode. cfg.OLLAMA_OPTIONS and
+    then options override the defaults.
+    """
     payload = {
         "model": model,
         "prompt": prompt_text,
-        "stream": False,
-        "format": "json", # Instruct Ollama to output JSON directly
+        "stream": stream,
+        "format": schema or "json", # Instruct Ollama to output JSON directly
         "options": {
             "temperature": 0.2,
-            "num_predict": 100
+            "num_predict": num_predict_budget(schema) if schema else 160,
+            **cfg.OLLAMA_OPTIONS,
+            **(options or {})
         }
     }
+    if system_prompt:
+        payload["system"] = system_prompt
+    return payload
+
+def send_to_ollama(prompt_text, api_url, model, system_prompt=None, schema=None, options=None):
+    payload = _generate_payload(prompt_text, model, False, system_prompt, schema, options)
     try:
-        response = requests.post(api_url, json=payload, timeout=30)
-        response.raise_for_status()
-        response_data = response.json()
-        return response_data.get("response", "").strip()
+        response_data, coalesced = get_ollama_client().single_flight(
+            _flight_key(payload), lambda: _generate(api_url, payload))
     except requests.exceptions.RequestException as e:
         print(f"Error communicating with Ollama: {e}")
         return None
+    if not coalesced:
+        prompt_eval_stats.record(_prompt_layout(system_prompt), response_data)
+        metrics.record_ollama(response_data, _prompt_layout(system_prompt))
+    return response_data.get("response", "").strip()
+
+def _flight_key(payload):
+    return json.dumps(payload, sort_keys=True)
+
+def _generate(api_url, payload):
+    """Runs one non-streamed generation and returns Ollama's response data."""
+    client = get_ollama_client()
+    response = client.post(api_url, payload, timeout=cfg.OLLAMA_REQUEST_TIMEOUT)
+    try:
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException:
+        client.report_failure(response)
+        raise
+
+class IncrementalJsonParser:
+    """
+    Tracks brace depth across streamed chunks and returns the first
+    top-level JSON object as soon as its closing brace arrives.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.depth = 0
+        self.start = None
+        self.in_string = False
+        self.escaped = False
+        self._scanned = 0
+
+    def feed(self, chunk):
+        """Adds a chunk of text. Returns the parsed object once complete, else None."""
+        self.buffer += chunk
+        for i in range(self._scanned, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                if self.depth == 0:
+                    self.start = i
+                self.depth += 1
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    self._scanned = i + 1
+                    try:
+                        return json.loads(self.buffer[self.start:i + 1])
+                    except json.JSONDecodeError:
+                        self.start = None
+        self._scanned = len(self.buffer)
+        return None
+
+def valid_command(command_obj):
+    """
+    Returns the validated command (see src/commands.py), or None if it must
+    not be run. What was clamped or why it was rejected is printed.
+    """
+    command, notes = validate_command(command_obj)
+    if notes:
+        print(f"Command {'adjusted' if command else 'rejected'}: {'; '.join(notes)}")
+    return command
+
+def _drain_for_telemetry(response, lines, layout):
+    """Reads the rest of a stream on a daemon thread to record its final chunk."""
+    def drain():
+        try:
+            for line in lines:
+                if line:
+                    chunk = json.loads(line)
+                    if chunk.get("done"):
+                        prompt_eval_stats.record(layout, chunk)
+                        metrics.record_ollama(chunk, layout)
+                        break
+        except (requests.exceptions.RequestException, json.JSONDecodeError):
+            pass
+        finally:
+            response.close()
+    threading.Thread(target=drain, name="ollama-drain", daemon=True).start()
+
+def stream_from_ollama(prompt_text, api_url, model, on_command=None, system_prompt=None, schema=None,
+                       options=None):
+    """
+    Streams a generation from Ollama and parses the JSON as tokens arrive.
+
+    As soon as a complete, valid command object has been generated it is
+    passed to on_command and the rest of the generation is cancelled by
+    closing the connection. Returns (response_text, timing) where timing holds
+    seconds to first token, to dispatch and in total. response_text is None
+    on a communication error. Prompt eval telemetry is only recorded when the
+    generation runs to completion, since Ollama sends it in the final chunk.
+
+    A call made while an identical request is already streaming waits for
+    that one instead of starting its own, then dispatches the same command.
+    """
+    payload = _generate_payload(prompt_text, model, True, system_prompt, schema, options)
+    start_time = time.perf_counter()
+    (text, timing), coalesced = get_ollama_client().single_flight(
+        _flight_key(payload), lambda: _stream(api_url, payload, on_command, system_prompt))
+    if not coalesced:
+        return text, timing
+    timing = dict(timing, first_token=None, total=time.perf_counter() - start_time, coalesced=True)
+    command_obj = IncrementalJsonParser().feed(text or "")
+    command_obj = valid_command(command_obj) if command_obj is not None else None
+    if command_obj is not None:
+        timing["dispatch"] = timing["total"]
+        if on_command:
+            on_command(command_obj)
+    return text, timing
+
+def _stream(api_url, payload, on_command, system_prompt):
+    """Runs one streamed generation for stream_from_ollama."""
+    timing = {"first_token": None, "dispatch": None, "total": None, "cancelled_early": False}
+    parser = IncrementalJsonParser()
+    start_time = time.perf_counter()
+    client = get_ollama_client()
+    response = None
+    try:
+        response = client.post(api_url, payload, timeout=cfg.OLLAMA_REQUEST_TIMEOUT, stream=True)
+        response.raise_for_status()
+        lines = response.iter_lines()
+        for line in lines:
+            if not line:
+                continue
+            chunk = json.loads(line)
+            token = chunk.get("response", "")
+            if token and timing["first_token"] is None:
+                timing["first_token"] = time.perf_counter() - start_time
+            command_obj = parser.feed(token)
+            if command_obj is not None:
+                command_obj = valid_command(command_obj)
+            if command_obj is not None:
+                if on_command:
+                    on_command(command_obj)
+                timing["dispatch"] = time.perf_counter() - start_time
+                timing["cancelled_early"] = not chunk.get("done", False)
+                if timing["cancelled_early"]:
+                    metrics.inc("ollama_generations_cancelled_total")
+                    if metrics.sample_ollama():
+                        _drain_for_telemetry(response, lines, _prompt_layout(system_prompt))
+                        response = None # Closed by the drain thread
+                break
+            if chunk.get("done"):
+                prompt_eval_stats.record(_prompt_layout(system_prompt), chunk)
+                metrics.record_ollama(chunk, _prompt_layout(system_prompt))
+                break
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        print(f"Error communicating with Ollama: {e}")
+        client.report_failure(response)
+        return None, timing
+    finally:
+        if response is not None:
+            response.close()
+    timing["total"] = time.perf_counter() - start_time
+    return parser.buffer.strip(), timing
+
+def format_timing(timing):
+    """Formats a stream_from_ollama timing dict for display."""
+    parts = []
+    for key, label in (("first_token", "first token"), ("dispatch", "dispatch"), ("total", "total")):
+        if timing.get(key) is not None:
+            parts.append(f"{label} {timing[key] * 1000:.0f} ms")
+    if timing.get("cancelled_early"):
+        parts.append("rest of generation cancelled")
+    if timing.get("coalesced"):
+        parts.append("shared with an identical request")
+    return ", ".join(parts)
 
 def parse_llm_response_to_json(llm_text):
     """
@@ -48,88 +569,251 @@ def parse_llm_response_to_json(llm_text):
         return None
 
     try:
-        # The 'format: "json"' parameter in send_to_ollama should ensure valid JSON.
+        # The 'format' parameter in send_to_ollama should ensure valid JSON.
         # This is a robust way to parse it.
-        command_obj = json.loads(llm_text)
-        if "command" in command_obj:
+        command_obj = valid_command(json.loads(llm_text))
+        if command_obj:
             print(f"LLM suggests command: {command_obj}")
             return command_obj
         else:
-            print("LLM JSON is missing 'command' key.")
+            print("LLM JSON does not hold a command the motor can run.")
             return None
     except json.JSONDecodeError:
         print("LLM response was not valid JSON.")
         return None
 
+# --- Rule-based fast path ---
+# Word numbers the fast-path parser understands. Multiplicative words like
+# "twice" map straight to a count so "nod twice" needs no digits.
+WORD_NUMBERS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60,
+    "seventy": 70, "eighty": 80, "ninety": 90,
+    "once": 1, "twice": 2, "thrice": 3, "a couple": 2, "a few": 3,
+}
+
+# Keyword -> command. Checked in order, so longer phrases go first.
+COMMAND_KEYWORDS = [
+    (r"\b(?:spin|twirl|rotate fully)\w*", "SPIN"),
+    (r"\b(?:sweep|scan|look around|radar)\w*", "SWEEP"),
+    (r"\b(?:nod|say yes)\w*", "NOD"),
+    (r"\b(?:shake|say no)\w*", "SHAKE"),
+    (r"\b(?:go|goto|move|set|turn|rotate|point|position)\w*\s+(?:it\s+|yourself\s+)?to\b", "GOTO"),
+    (r"\b(?:open|close|middle|center|centre|home)\w*", "GOTO"),
+    (r"\b(?:turn|move|rotate|adjust|nudge|shift)\w*", "ADJUST"),
+]
+
+# Command -> (count parameter, firmware default), from the command registry.
+COMMAND_COUNT_PARAMS = count_params()
+
+RIGHT_WORDS = ("right", "clockwise", "up", "more", "open")
+LEFT_WORDS = ("left", "counterclockwise", "counter-clockwise", "anticlockwise", "down", "less", "close")
+SMALL_WORDS = ("a little", "a bit", "slightly", "a tad", "a touch", "bit")
+FILLER_WORDS = {
+    "please", "the", "motor", "servo", "it", "can", "you", "could", "would",
+    "now", "to", "by", "degrees", "degree", "deg", "times", "time", "reps",
+    "repetitions", "your", "head", "a", "and", "around", "back", "forth",
+    "all", "way", "fully", "angle", "of", "position", "just", "for", "me",
+    "yes", "no", "bit", "little", "slightly", "side", "again",
+    "go", "goto", "set", "move", "turn", "rotate", "point", "look", "do",
+    "say", "tad", "touch", "quickly", "slowly",
+}
+# Anything that suggests the request is more than one simple command.
+COMPOUND_PATTERN = re.compile(r"\b(?:then|after|before|while|unless|if|don'?t|do not|never|stop)\b")
+
+
+def _replace_word_numbers(text):
+    """Rewrites word numbers ("forty five", "twice") as digits."""
+    for phrase in ("a couple", "a few"):
+        text = re.sub(rf"\b{phrase}(?: of)?\b", str(WORD_NUMBERS[phrase]), text)
+
+    def compose(match):
+        total = 0
+        for word in match.group(0).replace("-", " ").split():
+            if word == "hundred":
+                total = max(total, 1) * 100
+            elif word != "and":
+                total += WORD_NUMBERS[word]
+        return str(total)
+
+    words = "|".join(w for w in WORD_NUMBERS if " " not in w)
+    pattern = rf"\b(?:{words}|hundred)(?:[\s-]+(?:and\s+)?(?:{words}|hundred))*\b"
+    return re.sub(pattern, compose, text)
+
+
 def parse_command_with_keywords(user_input_raw, current_angle, min_angle, max_angle, default_step):
     """
-    DEPRECATED in favor of the LLM's JSON output but kept for reference.
-    This function will no longer be called in the main loop.
-    """
-    user_input_lower = user_input_raw.lower()
-    
-    # Check for specific degree commands first
-    match_set_angle = re.search(r'(?:set to|move to)\s*(\d{1,3})(?:\s*degrees)?', user_input_lower)
-    if match_set_angle:
-        angle_val = int(match_set_angle.group(1))
-        if min_angle <= angle_val <= max_angle:
-            return angle_val
-
-    # Check for relative or absolute commands
-    if "open" in user_input_lower:
-        if "bit" in user_input_lower or "slightly" in user_input_lower:
-            return min(max_angle, current_angle + default_step)
-        # "open", "open fully", "open all the way" all map to max_angle
-        return max_angle
-
-    if "close" in user_input_lower:
-        if "bit" in user_input_lower or "slightly" in user_input_lower:
-            return max(min_angle, current_angle - default_step)
-        # "close", "close fully", "close all the way" all map to min_angle
-        return min_angle
-    
-    # If no keywords matched
-    return None
-
-def build_llm_prompt(user_input, current_angle, min_angle, max_angle):
+    Rule-based parser for the simple commands that do not need the LLM.
+
+    Returns a (command_dict, confidence) tuple. The command dict uses the same
+    schema the LLM produces, so ADJUST stays relative and is resolved later
+    against the current angle. Confidence is in [0, 1]; callers should only
+    trust the result above cfg.FAST_PATH_MIN_CONFIDENCE.
+    """
+    text = user_input_raw.lower().strip().rstrip(".!?")
+    if not text or COMPOUND_PATTERN.search(text):
+        return None, 0.0
+    text = _replace_word_numbers(text)
+
+    matches = []
+    for pattern, command in COMMAND_KEYWORDS:
+        if re.search(pattern, text) and command not in matches:
+            matches.append(command)
+    # ADJUST's verbs are generic ("turn", "rotate"), so a more specific match
+    # wins: "turn to 90" is a GOTO, "rotate fully" a SPIN.
+    if "ADJUST" in matches and len(matches) > 1:
+        matches.remove("ADJUST")
+    if len(matches) != 1:
+        return None, 0.0
+    command = matches[0]
+
+    numbers = [int(n) for n in re.findall(r"-?\d+", text)]
+    if len(numbers) > 1:
+        return None, 0.0
+    number = numbers[0] if numbers else None
+    confidence = 0.9 if number is not None else 0.8
+
+    if command in COMMAND_COUNT_PARAMS:
+        param, default = COMMAND_COUNT_PARAMS[command]
+        # Larger counts are clamped by the validator; leave them to the LLM
+        if number is not None and not 1 <= number <= cfg.COMMAND_MAX_REPEATS:
+            return None, 0.0
+        command_dict = {"command": command, param: number if number is not None else default}
+
+    elif command == "GOTO":
+        if number is None:
+            if re.search(r"\bopen", text):
+                number = max_angle
+            elif re.search(r"\bclose", text):
+                number = min_angle
+            elif re.search(r"\b(?:middle|center|centre|home)", text):
+                number = (min_angle + max_angle) // 2
+            else:
+                return None, 0.0
+            # "open a bit" is a relative nudge, not a full-range move.
+            if any(word in text for word in SMALL_WORDS):
+                sign = 1 if number == max_angle else -1 if number == min_angle else 0
+                if sign == 0:
+                    return None, 0.0
+                command_dict = {"command": "ADJUST", "degrees": sign * default_step}
+                return command_dict, _score(text, confidence)
+        if not min_angle <= number <= max_angle:
+            return None, 0.0
+        command_dict = {"command": "GOTO", "angle": number}
+
+    else:  # ADJUST
+        right = any(re.search(rf"\b{w}\b", text) for w in RIGHT_WORDS)
+        left = any(re.search(rf"\b{w}\b", text) for w in LEFT_WORDS)
+        if right == left:
+            return None, 0.0
+        amount = abs(number) if number is not None else default_step
+        if amount > max_angle - min_angle:
+            return None, 0.0
+        command_dict = {"command": "ADJUST", "degrees": amount if right else -amount}
+
+    return command_dict, _score(text, confidence)
+
+
+def _score(text, confidence):
+    """Lowers confidence for every word the rules did not account for."""
+    known = set(FILLER_WORDS) | set(RIGHT_WORDS) | set(LEFT_WORDS)
+    unknown = 0
+    for word in re.findall(r"[a-z'-]+", text):
+        if word in known or any(re.match(p, word) for p, _ in COMMAND_KEYWORDS):
+            continue
+        unknown += 1
+    return round(max(0.0, confidence - 0.15 * unknown), 2)
+
+
+class FastPathStats:
+    """
+    Counts how often the rule-based parser saved an LLM round-trip.
+    Thread-safe, like PromptEvalStats.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.fast_path_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_hit(self, elapsed):
+        with self._lock:
+            self.hits += 1
+            self.fast_path_seconds += elapsed
+
+    def record_llm(self, elapsed):
+        with self._lock:
+            self.misses += 1
+            self.llm_calls += 1
+            self.llm_seconds += elapsed
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def latency_saved(self):
+        """Estimated seconds saved, using the average observed LLM latency."""
+        if not self.llm_calls:
+            return 0.0
+        avg_llm = self.llm_seconds / self.llm_calls
+        return max(0.0, self.hits * avg_llm - self.fast_path_seconds)
+
+    def report(self):
+        total = self.hits + self.misses
+        return (f"Fast path: {self.hits}/{total} commands ({self.hit_rate:.0%}), "
+                f"~{self.latency_saved:.1f}s of LLM time saved")
+
+def build_system_prompt(min_angle, max_angle, devices=None):
+    """
+    The fixed instruction block. It never changes between requests, so it is
+    sent as Ollama's `system` field and the model can reuse its cached prefix.
+    The command list comes from the registry in src/commands.py; examples are
+    picked per request by build_llm_prompt().
+    devices lists the board/group names when several boards are connected;
+    the "device" selector is only described then.
+    """
+    device_section = ""
+    if devices:
+        names = ", ".join(f'"{name}"' for name in devices)
+        device_section = f"""
+Several motors are connected. If the user names one, add a "device" field with its name ({names}).
+"all" means every motor. Leave "device" out when the user does not name one.
+    - Example: "nod twice on rig 2" -> {{"command": "NOD", "times": 2, "device": "rig2"}}
+"""
     # This prompt is the core of the system. It defines the "API" for the LLM.
     return f"""
 You are an expert AI assistant that translates natural language commands into a structured JSON format for controlling a servo motor.
-The motor's range is {min_angle} to {max_angle} degrees. The current motor angle is {current_angle} degrees.
+The motor's range is {min_angle} to {max_angle} degrees. The current motor angle is given with each request, along with examples of similar requests.
 
 Analyze the user's request and create a JSON object with a "command" and its required "parameters".
 
 Available commands are:
-1.  "GOTO": Move to a specific angle.
-    - Parameters: "angle" (integer, {min_angle}-{max_angle}).
-    - Example: "move to 90 degrees" -> {{"command": "GOTO", "angle": 90}}
-    - Note: "open" means {max_angle}, "close" means {min_angle}, "middle" means 90.
-
-2.  "ADJUST": Move by a relative amount of degrees.
-    - Parameters: "degrees" (integer). Positive is clockwise (towards {max_angle}), negative is counter-clockwise (towards {min_angle}).
-    - Example: "turn a little to the right" -> {{"command": "ADJUST", "degrees": 20}}
-    - Example: "move 30 degrees left" -> {{"command": "ADJUST", "degrees": -30}}
-
-3.  "SPIN": Perform full rotations back and forth.
-    - Parameters: "times" (integer, number of full spins).
-    - Note: This action ends at the starting angle.
-    - Example: "spin 3 times" -> {{"command": "SPIN", "times": 3}}
-
-4.  "SWEEP": Move back and forth continuously like a radar.
-    - Parameters: "repetitions" (integer, number of back-and-forth sweeps).
-    - Note: This action ends at the starting angle.
-    - Example: "sweep back and forth 5 times" -> {{"command": "SWEEP", "repetitions": 5}}
-    
-5.  "NOD": Perform a "yes" motion.
-    - Parameters: "times" (integer).
-    - Example: "nod yes" -> {{"command": "NOD", "times": 2}}
-
-6.  "SHAKE": Perform a "no" motion.
-    - Parameters: "times" (integer).
-    - Example: "shake your head" -> {{"command": "SHAKE", "times": 2}}
+{prompt_command_section(min_angle, max_angle)}
+{device_section}
+Respond ONLY with the JSON object. Do not add any other text, explanation, or markdown formatting.
+"""
 
+def build_llm_prompt(user_input, current_angle, min_angle, max_angle, split=True, devices=None):
+    """
+    Builds the per-request prompt: the few-shot examples most relevant to the
+    request (at most OLLAMA_PROMPT_EXAMPLES), the current angle and the
+    request. With split=True only this suffix is returned and
+    build_system_prompt() must be sent as the system prompt. With
+    split=False the full instruction block is inlined (the old layout).
+    """
+    selected = select_examples(user_input, cfg.OLLAMA_PROMPT_EXAMPLES)
+    example_lines = "".join(f"- {format_example(utterance, command)}\n" for utterance, command in selected)
+    suffix = f"""Examples:
+{example_lines}Current Angle: {current_angle}
 User Request: "{user_input}"
-Current Angle: {current_angle}
-
-Respond ONLY with the JSON object. Do not add any other text, explanation, or markdown formatting.
-"""
\ No newline at end of file
+"""
+    if split:
+        return suffix
+    return build_system_prompt(min_angle, max_angle, devices) + "\n" + suffix
@@ -0,0 +1,302 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import src.config as cfg
+
+# --- Per-stage tracing and metrics ---
+# Spans time the stages of a command (fast path, prompt build, LLM, parse,
+# serial write, ACK/DONE round trips). Counters and histograms collect
+# Ollama's own timing fields and serial traffic. Everything is kept in memory
+# and exported as a rolling JSONL file of spans plus a Prometheus text file
+# and/or HTTP endpoint.
+#
+# When METRICS_ENABLED is False every entry point returns after one check, so
+# the instrumentation can stay in the hot path.
+
+# Histogram buckets in seconds, from serial round trips to slow LLM calls.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = False
+_lock = threading.Lock()
+_counters = {}   # (name, labels) -> value
+_histograms = {} # (name, labels) -> [bucket counts..., sum, count]
+_help = {}
+_pending_spans = []
+_trace = contextvars.ContextVar("trace", default=None)
+_trace_ids = itertools.count(1)
+_ollama_streams = itertools.count(1)
+_flush_stop = threading.Event()
+_flush_thread = None
+_http_server = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def describe(name, text):
+    """Sets the # HELP text for a metric."""
+    _help[name] = text
+
+def inc(name, value=1, **labels):
+    """Adds value to a counter."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    """Records one observation in a histogram."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry[i] += 1
+        entry[-2] += seconds
+        entry[-1] += 1
+
+
+# --- Spans ---
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Times a block, records it in servo_stage_seconds and queues it for the JSONL log."""
+    __slots__ = ("name", "attrs", "start", "trace")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.trace = _trace.get()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        observe("servo_stage_seconds", seconds, stage=self.name)
+        record = {"ts": round(time.time(), 3), "trace": self.trace, "span": self.name,
+                  "ms": round(seconds * 1000, 3)}
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self.attrs:
+            record.update(self.attrs)
+        with _lock:
+            _pending_spans.append(record)
+        return False
+
+
+def span(name, **attrs):
+    """Context manager timing one stage. A no-op when metrics are disabled."""
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+def new_trace(label=None):
+    """
+    Starts a trace for one user command. Spans opened in this context (and in
+    threads started with asyncio.to_thread from it) carry its id.
+    Returns the id, or None when disabled.
+    """
+    if not _enabled:
+        return None
+    trace_id = next(_trace_ids)
+    _trace.set(trace_id)
+    if label is not None:
+        with _lock:
+            _pending_spans.append({"ts": round(time.time(), 3), "trace": trace_id, "input": label})
+    return trace_id
+
+def current_trace():
+    return _trace.get()
+
+def in_trace(trace_id, func):
+    """Wraps func so it runs with trace_id as the current trace (for work handed to another task)."""
+    if trace_id is None:
+        return func
+    def run(*args, **kwargs):
+        token = _trace.set(trace_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _trace.reset(token)
+    return run
+
+
+# --- Ollama and serial helpers ---
+OLLAMA_DURATION_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+OLLAMA_COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+
+def record_ollama(response_data, layout=None):
+    """Records the timing fields from Ollama's final response chunk."""
+    if not _enabled:
+        return
+    labels = {"layout": layout} if layout else {}
+    for field in OLLAMA_DURATION_FIELDS:
+        if field in response_data:
+            observe(f"ollama_{field}_seconds", response_data[field] / 1e9, **labels)
+    for field in OLLAMA_COUNT_FIELDS:
+        if field in response_data:
+            inc(f"ollama_{field}_tokens_total", response_data[field], **labels)
+    inc("ollama_generations_total", **labels)
+
+def sample_ollama():
+    """
+    True for every METRICS_OLLAMA_SAMPLE_EVERY-th streamed generation. Those
+    are allowed to finish in the background after the command is dispatched,
+    since Ollama only reports its timing fields in the final chunk.
+    """
+    if not _enabled or not cfg.METRICS_OLLAMA_SAMPLE_EVERY:
+        return False
+    return next(_ollama_streams) % cfg.METRICS_OLLAMA_SAMPLE_EVERY == 0
+
+
+# --- Export ---
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def prometheus_text():
+    """Renders every metric in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, list(v)) for k, v in _histograms.items())
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), entry in histograms:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+        for bound, count in zip(BUCKETS, entry):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {entry[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {entry[-2]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {entry[-1]}")
+    return "\n".join(lines) + "\n"
+
+def _rotate(path):
+    """Keeps METRICS_JSONL_BACKUPS old files: path.1 is the newest."""
+    for i in range(cfg.METRICS_JSONL_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    if cfg.METRICS_JSONL_BACKUPS > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+def flush():
+    """Writes queued spans to the JSONL file and refreshes the Prometheus file."""
+    if not _enabled:
+        return
+    with _lock:
+        spans = _pending_spans[:]
+        del _pending_spans[:]
+
+    path = cfg.METRICS_JSONL_PATH
+    if path and spans:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) >= cfg.METRICS_JSONL_MAX_BYTES:
+            _rotate(path)
+        with open(path, "a") as f:
+            for record in spans:
+                f.write(json.dumps(record) + "\n")
+
+    prom_path = cfg.METRICS_PROMETHEUS_FILE
+    if prom_path:
+        os.makedirs(os.path.dirname(prom_path) or ".", exist_ok=True)
+        # Written to a temp file and renamed, as the node_exporter textfile collector expects
+        with open(prom_path + ".tmp", "w") as f:
+            f.write(prometheus_text())
+        os.replace(prom_path + ".tmp", prom_path)
+
+def _serve_prometheus(port):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start():
+    """Enables metrics if configured and starts the exporters. Safe to call twice."""
+    global _enabled, _flush_thread, _http_server
+    if not cfg.METRICS_ENABLED or _enabled:
+        return
+    _enabled = True
+    describe("servo_stage_seconds", "Duration of each stage of the command path.")
+    describe("serial_bytes_sent_total", "Bytes written to the Arduino.")
+    describe("serial_bytes_received_total", "Bytes read from the Arduino.")
+    describe("serial_roundtrip_seconds", "Time from writing a frame to its ACK or DONE.")
+
+    def flush_loop():
+        while not _flush_stop.wait(cfg.METRICS_FLUSH_SECONDS):
+            flush()
+    _flush_thread = threading.Thread(target=flush_loop, name="metrics-flush", daemon=True)
+    _flush_thread.start()
+
+    if cfg.METRICS_PROMETHEUS_PORT:
+        try:
+            _http_server = _serve_prometheus(cfg.METRICS_PROMETHEUS_PORT)
+            print(f"Metrics: Prometheus endpoint on http://localhost:{cfg.METRICS_PROMETHEUS_PORT}/metrics")
+        except OSError as e:
+            print(f"Metrics: could not start the Prometheus endpoint: {e}")
+    print(f"Metrics: writing spans to {cfg.METRICS_JSONL_PATH}")
+
+def stop():
+    """Stops the exporters after a final flush."""
+    global _enabled
+    if not _enabled:
+        return
+    _flush_stop.set()
+    flush()
+    if _http_server is not None:
+        _http_server.shutdown()
+    _enabled = False
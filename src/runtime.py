@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+import src.config as cfg
+import src.metrics as metrics
+from src.voice import ContinuousListener, get_voice_session, listen_for_voice_command
+
+# Lines the Arduino sends without being asked, routed to dedicated handlers.
+RFID_SCAN_PREFIX = "Card detected! UID:"
+
+# Inputs that cancel everything still waiting in the pipeline.
+FLUSH_KEYWORDS = ("reset", "exit")
+
+
+class ServoRuntime:
+    """
+    Event-driven, pipelined runtime for LlmServoControl.
+
+    Three stages run concurrently and talk through queues:
+    - input:     stdin, one-shot voice ('speech') and hands-free voice
+                 ('listen') -> input_queue
+    - inference: input_queue -> fast path / LLM -> device_queue
+    - device:    device_queue -> each board's I/O worker (src/fleet.py)
+    The next input is inferred while the servo is still executing the
+    previous command, so a scripted session costs roughly max(LLM time,
+    motion time) per command instead of their sum. The device stage hands
+    commands to the board workers in order, and each board runs its own in
+    order, resolving ADJUST against its twin's predicted post-motion angle.
+    A slow motion on one board does not hold up commands for another.
+
+    Every queued item carries the epoch it was submitted in. 'reset' and
+    'exit' start a new epoch as soon as they are typed, so anything queued
+    before them (including work waiting on a board) is discarded instead of
+    executed.
+
+    Hands-free voice commands carry their capture time. A new one is dropped
+    while VOICE_MAX_PENDING_COMMANDS commands are already waiting for
+    inference or execution, and any that waited longer than VOICE_MAX_UTTERANCE_AGE are
+    discarded when their turn comes, since the operator has moved on.
+
+    A serial reader task per board routes every line from its Arduino as it
+    arrives, so unsolicited messages are handled while the LLM is still thinking.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.arduino = app.arduino
+        self.fleet = app.fleet
+        self.input_queue = asyncio.Queue()
+        self.device_queue = asyncio.Queue()
+        self.stopping = None
+        self.loop = None
+        self.epoch = 0
+        self.listener = None
+        self.pending_voice = 0
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+
+        self.arduino.add_line_handler(RFID_SCAN_PREFIX, self.on_rfid_scan)
+        for board in self.fleet:
+            board.arduino.external_reader = True
+
+        self._start_stdin_thread()
+        tasks = [
+            asyncio.create_task(self.serial_reader(board), name=f"serial-reader-{board.name}")
+            for board in self.fleet
+        ] + [
+            asyncio.create_task(self.inference_worker(), name="inference"),
+            asyncio.create_task(self.device_worker(), name="device"),
+        ]
+        try:
+            await self.stopping.wait()
+        finally:
+            if self.listener:
+                self.listener.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for board in self.fleet:
+                board.arduino.external_reader = False
+
+    # --- Input ---
+    def submit(self, text, flush=True, captured_at=None):
+        """
+        Queues one input. Must be called on the event loop thread.
+        flush=False queues a reset/exit behind the pending work instead of
+        cancelling it (used for end of input, so piped scripts run to the end).
+        captured_at marks a hands-free voice command.
+        """
+        if flush and text.lower() in FLUSH_KEYWORDS:
+            self.epoch += 1
+            dropped = self.fleet.clear_pending()
+            if dropped:
+                print(f"Discarded {dropped} command(s) waiting on the boards.")
+        self.input_queue.put_nowait((self.epoch, text, captured_at))
+
+    def _start_stdin_thread(self):
+        """
+        Reads stdin on a daemon thread. input() cannot be cancelled, so a
+        plain daemon thread (not the executor) keeps it from blocking exit.
+        """
+        def read_stdin():
+            while not self.stopping.is_set():
+                flush = True
+                try:
+                    text = input("You: ").strip()
+                except EOFError:
+                    text, flush = "exit", False
+                self.loop.call_soon_threadsafe(self.submit, text, flush)
+                if text.lower() == "exit":
+                    return
+        threading.Thread(target=read_stdin, name="stdin", daemon=True).start()
+
+    async def listen_for_voice(self):
+        """Runs one voice capture off the event loop and queues the result."""
+        text = await asyncio.to_thread(listen_for_voice_command)
+        if text:
+            self.submit(text)
+        else:
+            print("No valid command received. Please try again.")
+
+    def toggle_listening(self):
+        if self.listener and self.listener.running:
+            self.listener.stop()
+            return
+        try:
+            if self.listener is None:
+                self.listener = ContinuousListener(get_voice_session(), self.on_voice_text)
+            self.listener.start()
+        except Exception as e:
+            print(f"Could not start hands-free listening: {e}")
+
+    def on_voice_text(self, text, captured_at):
+        """ContinuousListener callback, called from its recognition thread."""
+        self.loop.call_soon_threadsafe(self.submit_voice, text, captured_at)
+
+    def submit_voice(self, text, captured_at):
+        # Commands already inferred but not yet run count as back-pressure too
+        backlog = self.pending_voice + self.device_queue.qsize() + self.fleet.pending()
+        if backlog >= cfg.VOICE_MAX_PENDING_COMMANDS and text.lower() not in FLUSH_KEYWORDS:
+            print(f"Voice: dropped '{text}', {backlog} commands still waiting.")
+            return
+        self.pending_voice += 1
+        self.submit(text, captured_at=captured_at)
+
+    # --- Serial ---
+    async def serial_reader(self, board):
+        """Reads a board's lines as they arrive and routes them to handlers."""
+        source = "Arduino" if len(self.fleet) == 1 else f"Arduino [{board.name}]"
+        arduino = board.arduino
+        while not self.stopping.is_set():
+            line = await asyncio.to_thread(arduino.read_line)
+            if line and not arduino.route_line(line):
+                print(f"{source}: {line}")
+
+    def on_rfid_scan(self, line):
+        uid = line[len(RFID_SCAN_PREFIX):].strip()
+        print(f"\nRFID card scanned on the reader (UID: {uid}).")
+
+    # --- Inference ---
+    async def inference_worker(self):
+        while True:
+            epoch, user_input, captured_at = await self.input_queue.get()
+            keyword = user_input.lower()
+
+            if captured_at is not None:
+                self.pending_voice -= 1
+                age = time.monotonic() - captured_at
+                if age > cfg.VOICE_MAX_UTTERANCE_AGE:
+                    print(f"Discarded stale voice command '{user_input}' ({age:.1f}s old).")
+                    continue
+
+            if epoch != self.epoch:
+                print(f"Discarded '{user_input}' (cancelled by a later reset/exit).")
+                continue
+
+            if keyword == 'speech':
+                if self.listener and self.listener.running:
+                    print("Hands-free listening is on; just say the command.")
+                else:
+                    asyncio.create_task(self.listen_for_voice())
+                continue
+
+            if keyword == 'listen':
+                await asyncio.to_thread(self.toggle_listening)
+                continue
+
+            if not user_input:
+                print("No valid command received. Please try again.")
+                continue
+
+            if keyword == 'exit':
+                await self.device_queue.put((epoch, self.app.shutdown_device))
+                await self.device_queue.put((epoch, None))
+                return
+
+            if keyword == 'reset':
+                await self.device_queue.put((epoch, self.app.reset))
+                continue
+
+            if keyword == 'help':
+                self.app.display_command_help()
+                continue
+
+            if keyword == 'stats':
+                self.app.print_stats()
+                continue
+
+            metrics.new_trace(user_input)
+            command_dict = await asyncio.to_thread(
+                self.app.get_llm_command, user_input,
+                on_command=lambda command: self.queue_command(epoch, command)
+            )
+            if not command_dict or "command" not in command_dict:
+                print("AI could not determine a valid action. Please try rephrasing.")
+                await self.device_queue.put((epoch, self.app.idle))
+
+    def queue_command(self, epoch, command_dict):
+        """on_command callback; may be called from the LLM worker thread."""
+        action = metrics.in_trace(metrics.current_trace(),
+                                  lambda: self.app.execute_command(command_dict, wait=False))
+        self.loop.call_soon_threadsafe(self.device_queue.put_nowait, (epoch, action))
+
+    # --- Device ---
+    async def device_worker(self):
+        """
+        Hands device actions to the boards one at a time, in the order they
+        were queued. Commands return once queued on their boards; reset and
+        shutdown wait for every board.
+        """
+        while True:
+            epoch, action = await self.device_queue.get()
+            if action is None:
+                self.stopping.set()
+                return
+            if epoch != self.epoch:
+                print("Discarded a queued command (cancelled by a later reset/exit).")
+                continue
+            await asyncio.to_thread(action)
@@ -0,0 +1,584 @@
+import itertools
+import json
+import logging
+import math
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import partial, wraps
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+import src.config as cfg
+import src.metrics as metrics
+from src.arduino import CMD_AWAIT_AUTH, CMD_IDLE_STATE
+from src.commands import validate_command
+
+# Lines the Arduino sends without being asked, published as events.
+RFID_SCAN_PREFIX = "Card detected! UID:"
+
+# Job states. A job is finished once it reaches one of FINISHED_STATES.
+QUEUED = "queued"
+INFERRING = "inferring"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# Seconds between keep-alive comments on an idle event stream.
+EVENT_KEEPALIVE_SECONDS = 15
+
+
+class Saturated(Exception):
+    """Raised when a command cannot be queued. Carries the suggested Retry-After."""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """One submitted command and its progress, as reported to clients."""
+    def __init__(self, job_id, user, text=None, command=None):
+        self.id = job_id
+        self.user = user
+        self.text = text
+        self.command = command
+        self.status = QUEUED
+        self.error = None
+        self.epoch = 0
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        return {
+            "id": self.id, "user": self.user, "text": self.text, "command": self.command,
+            "status": self.status, "error": self.error,
+            "submitted_at": round(self.submitted_at, 3),
+            "finished_at": round(self.finished_at, 3) if self.finished_at else None,
+        }
+
+
+class EventStream:
+    """A client's bounded event buffer. Events beyond the limit are counted and dropped."""
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.missed = 0
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.missed += 1
+
+
+class ServoServer:
+    """
+    HTTP front end for LlmServoControl (python main.py --serve).
+
+    Requests flow through the same stages as the CLI runtime:
+    - POST /api/commands -> bounded LLM queue (SERVER_QUEUE_SIZE)
+    - SERVER_LLM_WORKERS threads -> fast path / LLM -> dispatch
+    - dispatch -> each board's I/O worker (src/fleet.py), which stays the
+      only thread writing to its serial port
+    JSON commands skip the LLM queue and are dispatched straight away.
+    When the LLM queue is full, or SERVER_MAX_DEVICE_BACKLOG commands are
+    already waiting on the boards, new commands get 429 with a Retry-After
+    instead of piling up behind the servo.
+
+    Clients log in by scanning an authorized card on the default board's
+    reader (or with a UID and SERVER_SECRET) and send the token as
+    "Authorization: Bearer <token>"; /api/events also takes ?token= for
+    EventSource. Failed logins are limited per client address.
+    POST /api/reset discards every queued command, like 'reset' in the CLI.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.fleet = app.fleet
+        self.flask = self._create_flask_app()
+        self.http = None
+        self.epoch = 0
+        self.llm_queue = queue.Queue(maxsize=cfg.SERVER_QUEUE_SIZE)
+        self.sessions = {} # token -> (user, expires_at)
+        self.login_failures = {} # address -> (failures, first_failure_at)
+        self.jobs = OrderedDict()
+        self.streams = set()
+        self.inference_seconds = 0.0 # Running average, for Retry-After
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._dispatch_lock = threading.Lock()
+        self._scan_lock = threading.Lock() # One login waits for the reader at a time
+        self._stopping = threading.Event()
+        self._threads = []
+
+    # --- Lifecycle ---
+    def start(self):
+        """Starts the serial readers and LLM workers and binds the HTTP port."""
+        self.app.arduino.add_line_handler(RFID_SCAN_PREFIX, self.on_rfid_scan)
+        for board in self.fleet:
+            board.arduino.external_reader = True
+            self._start_thread(self.serial_reader, board, name=f"serial-reader-{board.name}")
+        for i in range(cfg.SERVER_LLM_WORKERS):
+            self._start_thread(self.inference_worker, name=f"llm-worker-{i + 1}")
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.http = make_server(cfg.SERVER_HOST, cfg.SERVER_PORT, self.flask, threaded=True)
+        print(f"Serving on http://{cfg.SERVER_HOST}:{cfg.SERVER_PORT} "
+              f"({cfg.SERVER_LLM_WORKERS} LLM workers, queue of {cfg.SERVER_QUEUE_SIZE})")
+        return self
+
+    def _start_thread(self, target, *args, name):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def serve_forever(self):
+        """Serves until interrupted, then runs the boards' shutdown sequence."""
+        if self.http is None:
+            self.start()
+        try:
+            self.http.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Cancels queued work, lets the LLM workers finish and shuts the boards down."""
+        if self._stopping.is_set():
+            return
+        self.cancel_pending()
+        for _ in range(cfg.SERVER_LLM_WORKERS):
+            while True: # Never blocks; jobs queued since the cancel are cancelled too
+                try:
+                    self.llm_queue.put_nowait(None)
+                    break
+                except queue.Full:
+                    self.cancel_pending()
+        for thread in self._threads:
+            if thread.name.startswith("llm-worker"):
+                thread.join()
+        # The serial readers keep running until the boards have acknowledged it
+        self.app.shutdown_device()
+        self._stopping.set()
+        for board in self.fleet:
+            board.arduino.external_reader = False
+
+    # --- Sessions ---
+    def login(self, address, uid=None, secret=None):
+        """
+        Returns (token, user), or None if the login failed. Without a secret
+        the user is whoever scans an authorized card on the default board
+        within SERVER_LOGIN_SCAN_TIMEOUT; with one, uid is looked up if the
+        secret matches SERVER_SECRET. Raises Saturated while address is
+        locked out after failed logins, or while another login waits for a scan.
+        """
+        retry_after = self._login_retry_after(address)
+        if retry_after:
+            metrics.inc("server_logins_total", result="locked")
+            raise Saturated("Too many failed logins", retry_after)
+        if secret is not None:
+            matches = bool(cfg.SERVER_SECRET) and secrets.compare_digest(str(secret), cfg.SERVER_SECRET)
+            user = self.app.credentials.lookup(uid or "") if matches else None
+        else:
+            user = self._login_by_scan()
+        self._record_login(address, user is not None)
+        if user is None:
+            metrics.inc("server_logins_total", result="denied")
+            return None
+        token = secrets.token_urlsafe(24)
+        now = time.monotonic()
+        with self._lock:
+            # Expired sessions are dropped on every login
+            self.sessions = {t: s for t, s in self.sessions.items() if s[1] > now}
+            self.sessions[token] = (user, now + cfg.SERVER_SESSION_TTL)
+        metrics.inc("server_logins_total", result="ok")
+        print(f"Server: {user} logged in.")
+        return token, user
+
+    def _login_by_scan(self):
+        """Prompts for a card on the default board and returns its user, or None."""
+        if not self._scan_lock.acquire(blocking=False):
+            raise Saturated("Another login is waiting for a card scan", cfg.SERVER_LOGIN_SCAN_TIMEOUT)
+        try:
+            # On the board's worker, so it stays the only thread writing to the port
+            future = self.fleet.default.submit(self._scan_card)
+            try:
+                return future.result()
+            except Exception: # Cancelled by a reset, or the board failed
+                return None
+        finally:
+            self._scan_lock.release()
+
+    def _scan_card(self):
+        board = self.fleet.default
+        print("Server: login requested, please scan a card on the reader.")
+        board.arduino.send_command(CMD_AWAIT_AUTH)
+        scan = board.arduino.wait_for_auth_scan(cfg.SERVER_LOGIN_SCAN_TIMEOUT)
+        user = self.app.decide_scan(scan) if scan else None
+        if user is not None:
+            # A granted scan recentres the servo on the board
+            board.twin.angle = cfg.MOTOR_INITIAL_ANGLE
+            return user
+        print("Server: no authorized card scanned for the login.")
+        # Otherwise the board would keep prompting for a card
+        board.arduino.send_command(CMD_IDLE_STATE)
+        return None
+
+    def _login_retry_after(self, address):
+        """Seconds until address may try again, or 0 if it is not locked out."""
+        with self._lock:
+            failures, since = self.login_failures.get(address, (0, 0.0))
+        remaining = since + cfg.SERVER_LOGIN_LOCKOUT_SECONDS - time.monotonic()
+        if failures < cfg.SERVER_LOGIN_MAX_FAILURES or remaining <= 0:
+            return 0
+        return math.ceil(remaining)
+
+    def _record_login(self, address, ok):
+        now = time.monotonic()
+        with self._lock:
+            if ok:
+                self.login_failures.pop(address, None)
+                return
+            failures, since = self.login_failures.get(address, (0, now))
+            if now - since >= cfg.SERVER_LOGIN_LOCKOUT_SECONDS:
+                failures, since = 0, now # The window passed; count afresh
+            self.login_failures[address] = (failures + 1, since)
+
+    def user_for(self, token):
+        with self._lock:
+            session = self.sessions.get(token)
+        if session is None or session[1] <= time.monotonic():
+            return None
+        return session[0]
+
+    def logout(self, token):
+        with self._lock:
+            self.sessions.pop(token, None)
+
+    # --- Jobs ---
+    def _new_job(self, user, text=None, command=None):
+        job = Job(next(self._job_ids), user, text, command)
+        with self._lock:
+            job.epoch = self.epoch
+            self.jobs[job.id] = job
+            # Keep the newest SERVER_JOB_HISTORY finished jobs
+            finished = [j.id for j in self.jobs.values() if j.finished]
+            for job_id in finished[:max(0, len(finished) - cfg.SERVER_JOB_HISTORY)]:
+                del self.jobs[job_id]
+        return job
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _update(self, job, status, error=None, **fields):
+        """Moves a job to a new state and publishes it. Finished jobs stay finished."""
+        with self._lock:
+            if job.finished:
+                return
+            job.status = status
+            job.error = error
+            for key, value in fields.items():
+                setattr(job, key, value)
+            if job.finished:
+                job.finished_at = time.time()
+        if job.finished:
+            metrics.inc("server_jobs_total", status=status)
+        self.publish("job", job.to_dict())
+
+    def _device_retry_after(self):
+        """Seconds until the busiest board has worked through what it was sent."""
+        return max(1, math.ceil(max(board.twin.seconds_until_free() for board in self.fleet)))
+
+    def _check_device_backlog(self):
+        backlog = self.fleet.pending()
+        if backlog >= cfg.SERVER_MAX_DEVICE_BACKLOG:
+            metrics.inc("server_rejected_total", reason="device_backlog")
+            raise Saturated(f"{backlog} commands are already waiting on the boards",
+                            self._device_retry_after())
+
+    def submit_text(self, user, text):
+        """Queues a natural-language command for the LLM workers. Raises Saturated when full."""
+        self._check_device_backlog()
+        job = self._new_job(user, text=text)
+        try:
+            self.llm_queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self.jobs[job.id]
+            metrics.inc("server_rejected_total", reason="llm_queue")
+            waiting = self.llm_queue.qsize() / max(1, cfg.SERVER_LLM_WORKERS)
+            raise Saturated("The command queue is full",
+                            max(1, math.ceil(waiting * (self.inference_seconds or 1.0))))
+        self.publish("job", job.to_dict())
+        return job
+
+    def submit_command(self, user, command_dict):
+        """Dispatches a JSON command straight to the boards. Raises Saturated when they are backed up."""
+        self._check_device_backlog()
+        job = self._new_job(user, command=command_dict)
+        self.publish("job", job.to_dict())
+        self.dispatch(job, command_dict)
+        return job
+
+    def cancel(self, job):
+        """Cancels a job that is still waiting for an LLM worker. Returns True if it was."""
+        if job.status != QUEUED or job.command is not None:
+            return False
+        self._update(job, CANCELLED, "Cancelled by the client")
+        return True
+
+    def cancel_pending(self):
+        """
+        Starts a new epoch: jobs waiting for the LLM and commands waiting on a
+        board are discarded, and commands still being inferred are not run.
+        """
+        with self._lock:
+            self.epoch += 1
+        while True:
+            try:
+                job = self.llm_queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                self._update(job, CANCELLED, "Cancelled by a reset")
+        dropped = self.fleet.clear_pending()
+        if dropped:
+            print(f"Server: discarded {dropped} command(s) waiting on the boards.")
+
+    def reset(self):
+        self.cancel_pending()
+        self.app.reset()
+
+    # --- Inference ---
+    def inference_worker(self):
+        while True:
+            job = self.llm_queue.get()
+            if job is None:
+                return
+            if job.finished:
+                continue
+            if job.epoch != self.epoch:
+                self._update(job, CANCELLED, "Cancelled by a reset")
+                continue
+
+            self._update(job, INFERRING)
+            metrics.new_trace(job.text)
+            start = time.perf_counter()
+            try:
+                command_dict = self.app.get_llm_command(
+                    job.text, on_command=lambda command, job=job: self.dispatch(job, command)
+                )
+            except Exception as e:
+                print(f"Server: inference failed for job {job.id}: {e}")
+                command_dict = None
+            elapsed = time.perf_counter() - start
+            # Weighted towards recent requests, as the model may have been unloaded
+            with self._lock:
+                self.inference_seconds = elapsed if not self.inference_seconds else \
+                    0.8 * self.inference_seconds + 0.2 * elapsed
+
+            if not command_dict or "command" not in command_dict:
+                self._update(job, FAILED, "AI could not determine a valid action")
+                self.app.idle()
+
+    def dispatch(self, job, command_dict):
+        """
+        Hands a command to its boards' workers. Called once per job, from an
+        LLM worker (possibly mid-stream) or a request thread. The job
+        finishes when every board has run the command.
+        """
+        with self._dispatch_lock:
+            if job.status == RUNNING or job.finished:
+                return
+            if job.epoch != self.epoch:
+                self._update(job, CANCELLED, "Cancelled by a reset")
+                return
+            futures = self.app.execute_command(command_dict, wait=False)
+        if futures is False:
+            self._update(job, FAILED, "Not a command the selected boards can run", command=command_dict)
+            return
+        self._update(job, RUNNING, command=command_dict)
+
+        remaining = [len(futures)]
+        def on_board_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if any(future.cancelled() for future in futures):
+                self._update(job, CANCELLED, "Cancelled by a reset")
+            elif all(not future.exception() and future.result() for future in futures):
+                self._update(job, DONE)
+            else:
+                self._update(job, FAILED, "The board did not complete the command")
+        for future in futures:
+            future.add_done_callback(on_board_done)
+
+    # --- Serial and events ---
+    def serial_reader(self, board):
+        """Reads a board's lines as they arrive and routes them to handlers."""
+        arduino = board.arduino
+        while not self._stopping.is_set():
+            line = arduino.read_line()
+            if line and not arduino.route_line(line):
+                print(f"Arduino [{board.name}]: {line}")
+
+    def on_rfid_scan(self, line):
+        uid = line[len(RFID_SCAN_PREFIX):].strip()
+        print(f"RFID card scanned on the reader (UID: {uid}).")
+        self.publish("rfid", {"board": self.fleet.default.name, "uid": uid})
+
+    def publish(self, kind, data):
+        event = f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            streams = list(self.streams)
+        for stream in streams:
+            stream.put(event)
+
+    def status(self):
+        return {
+            "epoch": self.epoch,
+            "startup_seconds": self.app.startup_seconds,
+            "llm_queue": self.llm_queue.qsize(),
+            "llm_workers": cfg.SERVER_LLM_WORKERS,
+            "device_backlog": self.fleet.pending(),
+            "boards": {
+                board.name: {
+                    "angle": board.twin.angle,
+                    "busy_seconds": round(board.twin.seconds_until_free(), 2),
+                    "pending": board.pending,
+                }
+                for board in self.fleet
+            },
+        }
+
+    def event_stream(self):
+        """Generator for one /api/events client."""
+        stream = EventStream(cfg.SERVER_EVENT_QUEUE_SIZE)
+        with self._lock:
+            self.streams.add(stream)
+        try:
+            yield f"event: status\ndata: {json.dumps(self.status())}\n\n"
+            while not self._stopping.is_set():
+                if stream.missed:
+                    yield f"event: missed\ndata: {json.dumps({'count': stream.missed})}\n\n"
+                    stream.missed = 0
+                try:
+                    yield stream.queue.get(timeout=EVENT_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self.streams.discard(stream)
+
+    # --- HTTP ---
+    def _create_flask_app(self):
+        flask_app = Flask(__name__)
+
+        def error(status, message, **headers):
+            response = jsonify({"error": message})
+            response.status_code = status
+            response.headers.update(headers)
+            return response
+
+        def token_from_request(allow_query=False):
+            header = request.headers.get("Authorization", "")
+            if header.startswith("Bearer "):
+                return header[len("Bearer "):].strip()
+            # Only for EventSource, which cannot set headers; URLs end up in logs
+            return request.args.get("token") if allow_query else None
+
+        def authorized(view, allow_query=False):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                user = self.user_for(token_from_request(allow_query))
+                if user is None:
+                    return error(401, "Log in with an authorized card first")
+                return view(user, *args, **kwargs)
+            return wrapper
+
+        @flask_app.post("/api/login")
+        def login():
+            body = request.get_json(silent=True) or {}
+            try:
+                result = self.login(request.remote_addr, body.get("uid"), body.get("secret"))
+            except Saturated as e:
+                return error(429, str(e), **{"Retry-After": str(e.retry_after)})
+            if result is None:
+                return error(401, "Unauthorized card")
+            token, user = result
+            return jsonify({"token": token, "user": user, "expires_in": cfg.SERVER_SESSION_TTL})
+
+        @flask_app.post("/api/logout")
+        @authorized
+        def logout(user):
+            self.logout(token_from_request())
+            return "", 204
+
+        @flask_app.post("/api/commands")
+        @authorized
+        def submit(user):
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                return error(400, "Expected a JSON object")
+            try:
+                if "text" in body:
+                    text = str(body["text"]).strip()
+                    if not text:
+                        return error(400, "Empty command")
+                    job = self.submit_text(user, text)
+                else:
+                    command, notes = validate_command(body)
+                    if command is None:
+                        return error(400, f"Not a valid command: {'; '.join(notes)}")
+                    if not self.fleet.select(command.get("device")):
+                        return error(400, f"Unknown device '{command['device']}'")
+                    job = self.submit_command(user, command)
+            except Saturated as e:
+                return error(429, str(e), **{"Retry-After": str(e.retry_after)})
+            response = jsonify(job.to_dict())
+            response.status_code = 202
+            response.headers["Location"] = f"/api/commands/{job.id}"
+            return response
+
+        @flask_app.get("/api/commands/<int:job_id>")
+        @authorized
+        def job_status(user, job_id):
+            job = self.get_job(job_id)
+            if job is None:
+                return error(404, "No such command")
+            return jsonify(job.to_dict())
+
+        @flask_app.delete("/api/commands/<int:job_id>")
+        @authorized
+        def cancel(user, job_id):
+            job = self.get_job(job_id)
+            if job is None:
+                return error(404, "No such command")
+            if not self.cancel(job):
+                return error(409, f"Command is already {job.status}")
+            return jsonify(job.to_dict())
+
+        @flask_app.post("/api/reset")
+        @authorized
+        def reset(user):
+            print(f"Server: reset requested by {user}.")
+            self.reset()
+            return jsonify(self.status())
+
+        @flask_app.get("/api/status")
+        @authorized
+        def status(user):
+            return jsonify(self.status())
+
+        @flask_app.get("/api/events")
+        @partial(authorized, allow_query=True)
+        def events(user):
+            return Response(self.event_stream(), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache"})
+
+        return flask_app
@@ -0,0 +1,182 @@
+import numpy as np
+import src.config as cfg
+from src.arduino import STREAM_MAX_DELTA, STREAM_PERIOD_MS
+from src.kinematics import (
+    CENTER_ANGLE, COUNT_PARAMS, DEFAULT_COUNTS, NOD_RANGE, SHAKE_MOVES_PER_TIME, SHAKE_RANGE,
+    SWEEP_STEP_DEG, SWEEP_STEP_MS, MotionPrediction
+)
+
+# --- Trajectory planner ---
+# Plans each motion command as rest-to-rest moves between waypoints (the
+# positions the firmware would jump between) and samples the result at the
+# stream rate, one setpoint every STREAM_PERIOD_MS. Moves are computed at
+# FINE_MS resolution first:
+# - trapezoid: velocity ramps at the acceleration limit, cruises at the
+#              velocity limit and ramps down (a triangle for short moves)
+# - scurve:    the trapezoid's velocity smoothed by a moving average as long
+#              as it takes to reach full acceleration at the jerk limit,
+#              which limits jerk without raising velocity or acceleration
+# Only needed with cfg.MOTION_STREAMING; the firmware's own actions do not use it.
+
+FINE_MS = 1
+PROFILES = ("trapezoid", "scurve")
+
+
+class Trajectory:
+    """Setpoints (whole degrees) to be played back one every period seconds."""
+    def __init__(self, setpoints, period):
+        self.setpoints = setpoints
+        self.period = period
+
+    def __len__(self):
+        return len(self.setpoints)
+
+    @property
+    def seconds(self):
+        """Playback time. The board finishes one period after the last setpoint."""
+        return len(self.setpoints) * self.period
+
+    @property
+    def end_angle(self):
+        return int(self.setpoints[-1])
+
+    def prediction(self):
+        """The playback as a twin prediction; unlike a firmware action it has no random timing."""
+        return MotionPrediction(self.end_angle, self.seconds, self.seconds)
+
+
+class TrajectoryPlanner:
+    """
+    Builds velocity- and acceleration-limited (and for S-curves jerk-limited)
+    trajectories for resolved motion commands. SHAKE targets come from a
+    seeded generator, so plans are repeatable.
+    """
+    def __init__(self, max_velocity, max_acceleration, max_jerk=None, profile="scurve",
+                 min_angle=0, max_angle=180, seed=None):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown motion profile {profile!r}, expected one of {PROFILES}")
+        self.period = STREAM_PERIOD_MS / 1000
+        # One setpoint may move at most STREAM_MAX_DELTA, and rounding to whole
+        # degrees can add one to a step
+        limit = (STREAM_MAX_DELTA - 1) / self.period
+        if max_velocity > limit:
+            print(f"Trajectory: {max_velocity} deg/s is more than a stream can carry, using {limit:.0f} deg/s.")
+            max_velocity = limit
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.max_jerk = max_jerk
+        self.profile = profile if max_jerk else "trapezoid"
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_config(cls):
+        return cls(cfg.MOTION_MAX_VELOCITY, cfg.MOTION_MAX_ACCELERATION, cfg.MOTION_MAX_JERK,
+                   cfg.MOTION_PROFILE, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE, cfg.MOCK_RANDOM_SEED)
+
+    # --- Profiles ---
+    def velocity_profile(self, distance, max_velocity):
+        """
+        Speed (deg/s) every FINE_MS of a rest-to-rest move over distance
+        degrees. Empty for a distance of 0.
+        """
+        if distance <= 0:
+            return np.zeros(0)
+        accel = self.max_acceleration
+        # Short moves never reach the cruise speed and peak where the ramps meet
+        peak = min(max_velocity, np.sqrt(distance * accel))
+        ramp = peak / accel
+        total = distance / peak + ramp
+        dt = FINE_MS / 1000
+        t = (np.arange(int(np.ceil(total / dt))) + 0.5) * dt
+        velocity = np.minimum(np.minimum(accel * t, peak), accel * (total - t))
+        if self.profile == "scurve":
+            width = max(1, int(round(accel / self.max_jerk / dt)))
+            velocity = np.convolve(velocity, np.full(width, 1 / width))
+        # Sampling leaves the area a little off; scale it to cover the distance exactly
+        return velocity * (distance / (velocity.sum() * dt))
+
+    # --- Commands ---
+    def _count(self, command_dict):
+        value = command_dict.get(COUNT_PARAMS[command_dict["command"]])
+        return DEFAULT_COUNTS[command_dict["command"]] if value is None else int(value)
+
+    def _clamp(self, angle):
+        return max(self.min_angle, min(self.max_angle, int(angle)))
+
+    def waypoints(self, command_dict, start_angle):
+        """
+        (angle, max_velocity) targets a resolved command (ADJUST already
+        turned into GOTO) moves through, in order, following the firmware's
+        actions: the same positions, end angles and sweep speed.
+        """
+        cmd = command_dict.get("command")
+        fast = self.max_velocity
+        if cmd == "GOTO":
+            return [(self._clamp(command_dict.get("angle", 0)), fast)]
+        if cmd == "SEQUENCE":
+            points, angle = [], start_angle
+            for step in command_dict.get("steps", []):
+                step_points = self.waypoints(step, angle)
+                points += step_points
+                angle = step_points[-1][0] if step_points else angle
+            return points
+
+        count = self._count(command_dict)
+        if cmd == "SPIN":
+            return [(self.min_angle, fast), (self.max_angle, fast)] * count + [(start_angle, fast)]
+        if cmd == "SWEEP":
+            scan = min(fast, SWEEP_STEP_DEG * 1000 / SWEEP_STEP_MS)
+            return ([(self.min_angle, fast)] + [(self.max_angle, scan), (self.min_angle, scan)] * count
+                    + [(start_angle, fast)])
+        if cmd == "NOD":
+            return ([(CENTER_ANGLE, fast)] + [(CENTER_ANGLE - NOD_RANGE, fast), (CENTER_ANGLE + NOD_RANGE, fast)] * count
+                    + [(CENTER_ANGLE, fast)])
+        if cmd == "SHAKE":
+            targets = self.rng.integers(CENTER_ANGLE - SHAKE_RANGE, CENTER_ANGLE + SHAKE_RANGE + 1,
+                                        count * SHAKE_MOVES_PER_TIME)
+            return [(CENTER_ANGLE, fast)] + [(int(a), fast) for a in targets] + [(CENTER_ANGLE, fast)]
+        raise ValueError(f"Cannot plan unknown command: {cmd}")
+
+    def plan(self, command_dict, start_angle):
+        """Plans a resolved command starting from start_angle. Returns a Trajectory."""
+        dt = FINE_MS / 1000
+        angle, moves = start_angle, []
+        for target, max_velocity in self.waypoints(command_dict, start_angle):
+            velocity = self.velocity_profile(abs(target - angle), max_velocity)
+            moves.append(angle + np.sign(target - angle) * np.cumsum(velocity) * dt)
+            angle = target
+        path = np.concatenate(moves) if moves else np.zeros(0)
+        if not len(path):
+            path = np.array([float(start_angle)]) # Already there: a single setpoint
+
+        # Sample at the stream rate, always ending on the final position
+        step = STREAM_PERIOD_MS // FINE_MS
+        samples = path[step - 1::step]
+        if len(path) % step:
+            samples = np.append(samples, path[-1])
+        setpoints = np.clip(np.rint(samples), self.min_angle, self.max_angle).astype(int)
+        return Trajectory(setpoints, self.period)
+
+
+def compare(trajectory, writes):
+    """
+    Checks a played trajectory against the servo writes an emulated board
+    made while playing it, as (ms, angle) (a slice of
+    FirmwareEmulator.servo_log). Returns the planned and executed seconds,
+    the largest angle error and how late the latest setpoint was against its
+    slot in ms, or None if setpoints are missing.
+    """
+    writes = writes[:len(trajectory)]
+    if len(writes) < len(trajectory):
+        return None
+    times = np.array([ms for ms, _ in writes], dtype=float)
+    angles = np.array([angle for _, angle in writes])
+    slots = times[0] + np.arange(len(writes)) * STREAM_PERIOD_MS
+    return {
+        "planned_seconds": trajectory.seconds,
+        "executed_seconds": (times[-1] - times[0]) / 1000 + trajectory.period,
+        "max_angle_error": int(np.max(np.abs(angles - trajectory.setpoints))),
+        "max_late_ms": float(np.max(times - slots)),
+    }
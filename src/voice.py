@@ -1,29 +1,357 @@
-import speech_recognition as sr
+import argparse
+import importlib
+import json
+import os
+import queue
+import threading
+import time
+import src.config as cfg
 
-def listen_for_voice_command_google():
+
+class _LazyModule:
+    """Imports a module on first attribute access."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# speech_recognition (and the PyAudio it opens the microphone with) is only
+# imported once voice is used, so startup does not pay for it.
+sr = _LazyModule("speech_recognition")
+
+# Sample rate the microphone is opened at. The offline models are trained on
+# 16 kHz audio, so capturing at that rate avoids a resample per utterance.
+CAPTURE_SAMPLE_RATE = 16000
+
+
+# --- Recognizer backends ---
+class RecognizerBackend:
     """
-    Listens for a command from the microphone and uses Google's Web Speech API.
+    Turns one captured utterance (sr.AudioData) into text.
+    recognize() returns the text, or None when nothing intelligible was said.
+    It raises sr.RequestError when the backend itself is unavailable.
     """
-    recognizer = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("\nListening for your command...")
-        recognizer.adjust_for_ambient_noise(source, duration=0.5)
+    name = "base"
+
+    def recognize(self, recognizer, audio_data):
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognizerBackend):
+    """Google's free Web Speech API. Needs internet access."""
+    name = "google"
+
+    def recognize(self, recognizer, audio_data):
+        try:
+            return recognizer.recognize_google(audio_data)
+        except sr.UnknownValueError:
+            return None
+
+
+class VoskBackend(RecognizerBackend):
+    """
+    Offline Kaldi recognizer. The model is loaded once and reused, which is
+    what makes it fast enough for short commands on a CPU.
+    Download a model from https://alphacephei.com/vosk/models and point
+    VOSK_MODEL_PATH at the unpacked folder.
+    """
+    name = "vosk"
+
+    def __init__(self, model_path):
+        try:
+            import vosk
+        except ImportError:
+            raise sr.RequestError("Vosk backend selected but the 'vosk' package is not installed (pip install vosk).")
+        if not os.path.isdir(model_path):
+            raise sr.RequestError(f"Vosk model not found at '{model_path}' (see VOSK_MODEL_PATH in config.py).")
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def recognize(self, recognizer, audio_data):
+        kaldi = self.vosk.KaldiRecognizer(self.model, CAPTURE_SAMPLE_RATE)
+        kaldi.AcceptWaveform(audio_data.get_raw_data(convert_rate=CAPTURE_SAMPLE_RATE, convert_width=2))
+        text = json.loads(kaldi.FinalResult()).get("text", "").strip()
+        return text or None
+
+
+class WhisperBackend(RecognizerBackend):
+    """Offline OpenAI Whisper (pip install openai-whisper). The model is cached after the first call."""
+    name = "whisper"
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def recognize(self, recognizer, audio_data):
+        try:
+            text = recognizer.recognize_whisper(audio_data, model=self.model_name, language="english")
+        except sr.UnknownValueError:
+            return None
+        return text.strip() or None
+
+
+class SphinxBackend(RecognizerBackend):
+    """Offline CMU PocketSphinx (pip install pocketsphinx). Lowest accuracy, no model download."""
+    name = "sphinx"
+
+    def recognize(self, recognizer, audio_data):
+        try:
+            return recognizer.recognize_sphinx(audio_data)
+        except sr.UnknownValueError:
+            return None
+
+
+def create_backend(name=None):
+    """Builds the recognizer backend named in the config."""
+    name = (name or cfg.VOICE_BACKEND).lower()
+    if name == "google":
+        return GoogleBackend()
+    if name == "vosk":
+        return VoskBackend(cfg.VOSK_MODEL_PATH)
+    if name == "whisper":
+        return WhisperBackend(cfg.WHISPER_MODEL)
+    if name == "sphinx":
+        return SphinxBackend()
+    raise ValueError(f"Unknown voice backend: {name}")
+
+
+# --- Latency stats ---
+class UtteranceStats:
+    """Recognition latency per utterance, measured from end of speech to text."""
+    def __init__(self):
+        self.latencies = []
+        self.unrecognized = 0
+
+    def record(self, seconds, recognized):
+        self.latencies.append(seconds)
+        if not recognized:
+            self.unrecognized += 1
+
+    def report(self):
+        if not self.latencies:
+            return "Voice: no utterances recognized yet"
+        ordered = sorted(self.latencies)
+        mean = sum(ordered) / len(ordered)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return (f"Voice: {len(ordered)} utterances, recognition mean {mean:.2f}s, "
+                f"p95 {p95:.2f}s, {self.unrecognized} not understood")
+
+
+# --- Capture session ---
+class VoiceSession:
+    """
+    Long-lived microphone session.
+
+    The audio stream is opened once and the ambient noise level is measured
+    once; after that the recognizer's dynamic energy threshold keeps adapting
+    as it listens. Utterances are endpointed by speech_recognition's energy
+    VAD: capture starts when the level rises above the threshold and ends
+    after VOICE_PAUSE_THRESHOLD seconds of silence.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+        self.recognizer = sr.Recognizer()
+        self.recognizer.pause_threshold = cfg.VOICE_PAUSE_THRESHOLD
+        self.recognizer.non_speaking_duration = min(cfg.VOICE_PAUSE_THRESHOLD, self.recognizer.non_speaking_duration)
+        self.recognizer.dynamic_energy_threshold = True
+        self.microphone = None
+        self.source = None
+        self.stats = UtteranceStats()
+
+    def open(self):
+        if self.source is not None:
+            return
+        self.microphone = sr.Microphone(sample_rate=CAPTURE_SAMPLE_RATE)
+        self.source = self.microphone.__enter__()
+        print("Calibrating microphone for ambient noise...")
+        self.recognizer.adjust_for_ambient_noise(self.source, duration=cfg.VOICE_CALIBRATION_SECONDS)
+        print(f"Microphone ready (energy threshold {self.recognizer.energy_threshold:.0f}, "
+              f"backend: {self.backend.name}).")
+
+    def close(self):
+        if self.source is not None:
+            self.microphone.__exit__(None, None, None)
+            self.source = None
+            self.microphone = None
+
+    def capture(self, timeout=None):
+        """Waits for one utterance. Returns sr.AudioData, or None on timeout."""
+        self.open()
         try:
-            audio_data = recognizer.listen(source, timeout=5)
-            print("Recognizing...")
-            
-            # Use Google's free web API for recognition
-            text = recognizer.recognize_google(audio_data)
-            print(f"You said: '{text}'")
-            return text
-            
+            return self.recognizer.listen(
+                self.source,
+                timeout=cfg.VOICE_LISTEN_TIMEOUT if timeout is None else timeout,
+                phrase_time_limit=cfg.VOICE_PHRASE_TIME_LIMIT
+            )
         except sr.WaitTimeoutError:
+            return None
+
+    def recognize(self, audio_data):
+        """Returns (text or None, seconds spent recognizing)."""
+        start = time.perf_counter()
+        text = self.backend.recognize(self.recognizer, audio_data)
+        elapsed = time.perf_counter() - start
+        self.stats.record(elapsed, text is not None)
+        return text, elapsed
+
+    def listen_once(self):
+        """Captures and recognizes a single command. Returns the text or None."""
+        print("\nListening for your command...")
+        audio_data = self.capture()
+        if audio_data is None:
             print("Listening timed out. No command detected.")
             return None
-        except sr.UnknownValueError:
-            print("Google Speech Recognition could not understand audio.")
+
+        print("Recognizing...")
+        try:
+            text, elapsed = self.recognize(audio_data)
+        except sr.RequestError as e:
+            print(f"Speech recognition backend '{self.backend.name}' is unavailable: {e}")
+            return None
+
+        if text is None:
+            print(f"Could not understand audio ({elapsed:.2f}s).")
             return None
-        except sr.RequestError:
-            print("Error connecting to Google Speech Recognition service.")
-            print("Please check your internet connection and try again.")
-            return None
\ No newline at end of file
+        print(f"You said: '{text}' (recognized in {elapsed:.2f}s)")
+        return text
+
+    def transcribe_file(self, path):
+        """Recognizes a WAV/AIFF/FLAC file. Returns (text or None, seconds)."""
+        with sr.AudioFile(path) as source:
+            audio_data = self.recognizer.record(source)
+        return self.recognize(audio_data)
+
+
+class ContinuousListener:
+    """
+    Hands-free listening on two daemon threads.
+
+    The capture thread keeps segmenting speech from the session's open
+    microphone and hands each utterance to the recognition thread, so the
+    next command is captured while the previous one is being recognized.
+    Between the two sits a small bounded queue: when recognition falls
+    behind, the oldest waiting utterance is dropped, and utterances older
+    than VOICE_MAX_UTTERANCE_AGE are skipped without being recognized.
+
+    on_text(text, captured_at) is called from the recognition thread;
+    captured_at is a time.monotonic() timestamp of the end of speech.
+    """
+    def __init__(self, session, on_text):
+        self.session = session
+        self.on_text = on_text
+        self.audio_queue = queue.Queue(maxsize=cfg.VOICE_AUDIO_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.dropped = 0
+
+    def start(self):
+        self.session.open()
+        self.stop_event.clear()
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="voice-capture", daemon=True),
+            threading.Thread(target=self._recognize_loop, name="voice-recognize", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        print("Hands-free listening on. Say a command at any time.")
+
+    def stop(self):
+        if not self.threads:
+            return
+        self.stop_event.set()
+        for thread in self.threads:
+            # Capture returns within one listen timeout; recognition may be
+            # busy with a slow backend, so don't wait forever for it.
+            thread.join(timeout=cfg.VOICE_PHRASE_TIME_LIMIT)
+        self.threads = []
+        print(f"Hands-free listening off ({self.dropped} utterances dropped).")
+
+    @property
+    def running(self):
+        return bool(self.threads)
+
+    def _capture_loop(self):
+        while not self.stop_event.is_set():
+            # A short timeout so stop() is noticed between utterances
+            audio_data = self.session.capture(timeout=1)
+            if audio_data is None:
+                continue
+            item = (audio_data, time.monotonic())
+            try:
+                self.audio_queue.put_nowait(item)
+            except queue.Full:
+                try:
+                    self.audio_queue.get_nowait()
+                    self.dropped += 1
+                    print("Voice: recognition is behind, dropped the oldest utterance.")
+                except queue.Empty:
+                    pass
+                self.audio_queue.put_nowait(item)
+
+    def _recognize_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                audio_data, captured_at = self.audio_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if time.monotonic() - captured_at > cfg.VOICE_MAX_UTTERANCE_AGE:
+                self.dropped += 1
+                print("Voice: dropped a stale utterance.")
+                continue
+            try:
+                text, elapsed = self.session.recognize(audio_data)
+            except sr.RequestError as e:
+                print(f"Speech recognition backend '{self.session.backend.name}' is unavailable: {e}")
+                continue
+            if text:
+                print(f"\nHeard: '{text}' (recognized in {elapsed:.2f}s)")
+                self.on_text(text, captured_at)
+
+
+_session = None
+
+def get_voice_session():
+    """Returns the shared voice session, created on first use."""
+    global _session
+    if _session is None:
+        _session = VoiceSession()
+    return _session
+
+def close_voice_session():
+    if _session is not None:
+        _session.close()
+
+def voice_stats_report():
+    """Latency report for the shared session, or None if voice was never used."""
+    return _session.stats.report() if _session is not None else None
+
+def listen_for_voice_command():
+    """Listens for one command on the shared session."""
+    try:
+        return get_voice_session().listen_once()
+    except ImportError as e:
+        print(f"Voice commands need the SpeechRecognition and PyAudio packages ({e}).")
+    except sr.RequestError as e:
+        print(f"Voice backend unavailable: {e}")
+    except OSError as e:
+        print(f"Could not open the microphone: {e}")
+    return None
+
+
+# --- WAV test harness ---
+# python -m src.voice --backend vosk clips/*.wav
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe audio files with a voice backend and report latency.")
+    parser.add_argument("files", nargs="+", help="WAV, AIFF or FLAC files")
+    parser.add_argument("--backend", default=None, help="google, vosk, whisper or sphinx (default: config)")
+    args = parser.parse_args()
+
+    session = VoiceSession(create_backend(args.backend))
+    for path in args.files:
+        text, elapsed = session.transcribe_file(path)
+        print(f"{path}: {text!r} ({elapsed:.2f}s)")
+    print(session.stats.report())
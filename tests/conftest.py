@@ -0,0 +1,23 @@
+import pytest
+import src.config as cfg
+from src.arduino import ArduinoController
+
+
+@pytest.fixture
+def mock_config(monkeypatch):
+    """Mock mode on an instant virtual clock, with nothing written to disk."""
+    monkeypatch.setattr(cfg, "USE_MOCK_ARDUINO", True)
+    monkeypatch.setattr(cfg, "MOCK_TIME_SCALE", 0)
+    monkeypatch.setattr(cfg, "CACHE_ENABLED", False)
+    monkeypatch.setattr(cfg, "METRICS_ENABLED", False)
+    monkeypatch.setattr(cfg, "CREDENTIALS_PATH", None)
+    return cfg
+
+
+@pytest.fixture
+def emulated_arduino(mock_config):
+    """An ArduinoController connected to the firmware emulator."""
+    arduino = ArduinoController(cfg.SERIAL_PORT, cfg.SERIAL_BAUDRATE)
+    assert arduino.connect()
+    yield arduino
+    arduino.disconnect()
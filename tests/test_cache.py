@@ -0,0 +1,88 @@
+import json
+import time
+import pytest
+import src.config as cfg
+from src.cache import IntentCache
+
+NOD = {"command": "NOD", "times": 1}
+
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(cfg, "METRICS_ENABLED", False)
+
+
+def saved_keys(path):
+    with open(path) as f:
+        return [key for key, _ in json.load(f)["entries"]]
+
+
+def count_saves(cache, monkeypatch):
+    saves = []
+    save = cache.save
+    def counted():
+        saves.append(time.perf_counter())
+        save()
+    monkeypatch.setattr(cache, "save", counted)
+    return saves
+
+
+def test_without_a_delay_every_answer_is_written(tmp_path):
+    path = str(tmp_path / "intents.json")
+    cache = IntentCache(path, model="m")
+    assert cache.store("nod", NOD, 90)
+    assert saved_keys(path) == ["nod"]
+    cache.close()
+
+
+def test_answers_are_written_together_after_the_delay(tmp_path, monkeypatch):
+    path = str(tmp_path / "intents.json")
+    cache = IntentCache(path, model="m", save_delay=0.2)
+    saves = count_saves(cache, monkeypatch)
+
+    start = time.perf_counter()
+    for text in ("nod", "nod twice", "shake"):
+        cache.store(text, NOD, 90)
+    assert time.perf_counter() - start < 0.1 # Nothing waited on the disk
+    assert not (tmp_path / "intents.json").exists()
+
+    deadline = time.monotonic() + 2
+    while not saves and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert len(saves) == 1
+    assert saves[0] - start >= 0.2
+    assert saved_keys(path) == ["nod", "nod 2", "shake"]
+    cache.close()
+    assert len(saves) == 1 # Nothing left to write
+
+
+def test_close_writes_unsaved_answers(tmp_path, monkeypatch):
+    path = str(tmp_path / "intents.json")
+    cache = IntentCache(path, model="m", save_delay=60)
+    saves = count_saves(cache, monkeypatch)
+    cache.store("nod", NOD, 90)
+    start = time.perf_counter()
+    cache.close()
+    assert time.perf_counter() - start < 1 # Not the whole delay
+    assert len(saves) == 1
+    assert saved_keys(path) == ["nod"]
+
+    # After close, changes are written straight away
+    cache.store("shake", NOD, 90)
+    assert saved_keys(path) == ["nod", "shake"]
+
+
+def test_close_without_changes_writes_nothing(tmp_path):
+    cache = IntentCache(str(tmp_path / "intents.json"), model="m", save_delay=60)
+    cache.close()
+    assert not (tmp_path / "intents.json").exists()
+
+
+def test_saved_answers_load_after_a_restart(tmp_path):
+    path = str(tmp_path / "intents.json")
+    cache = IntentCache(path, model="m", save_delay=60)
+    cache.store("nod", NOD, 90)
+    cache.close()
+    command, tier, _ = IntentCache(path, model="m").lookup("please nod")
+    assert (command, tier) == (NOD, "exact")
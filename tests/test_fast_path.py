@@ -0,0 +1,33 @@
+import pytest
+import src.config as cfg
+from src.commands import validate_command
+from src.llm import parse_command_with_keywords
+
+
+def parse(text, angle=90):
+    return parse_command_with_keywords(text, angle, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE,
+                                       cfg.MOTOR_DEFAULT_STEP)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("rotate fully", {"command": "SPIN", "times": 1}),
+    ("rotate fully 3 times", {"command": "SPIN", "times": 3}),
+    ("turn to 90", {"command": "GOTO", "angle": 90}),
+    ("turn left 20", {"command": "ADJUST", "degrees": -20}),
+    ("open a bit", {"command": "ADJUST", "degrees": cfg.MOTOR_DEFAULT_STEP}),
+    ("nod twice", {"command": "NOD", "times": 2}),
+])
+def test_parses_simple_commands(text, expected):
+    command, confidence = parse(text)
+    assert command == expected
+    assert confidence >= cfg.FAST_PATH_MIN_CONFIDENCE
+
+
+def test_counts_the_validator_would_clamp_go_to_the_llm():
+    command, confidence = parse(f"nod {cfg.COMMAND_MAX_REPEATS} times")
+    assert validate_command(command) == (command, [])
+    assert parse(f"nod {cfg.COMMAND_MAX_REPEATS + 1} times") == (None, 0.0)
+
+
+def test_compound_requests_go_to_the_llm():
+    assert parse("nod and then shake") == (None, 0.0)
@@ -0,0 +1,148 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip("termios") # FakeSerialDevice needs a pty (Linux/macOS)
+
+import src.config as cfg
+from benchmark.fake_serial import FakeSerialDevice
+from src.fleet import Board, Fleet
+
+GROUPS = {"left": ["rig1", "rig2"], "right": ["rig3"]}
+NOD = {"command": "NOD", "times": 1}
+
+
+@pytest.fixture
+def fleet(monkeypatch):
+    """Three connected boards, each on its own pty device."""
+    monkeypatch.setattr(cfg, "USE_MOCK_ARDUINO", False)
+    monkeypatch.setattr(cfg, "METRICS_ENABLED", False)
+    # The ready line has to come after the port opens, as after a real reset
+    devices = [FakeSerialDevice(motion_scale=0.5, reset_time=0.1).start() for _ in range(3)]
+    boards = [Board(f"rig{i + 1}", device.port, cfg.SERIAL_BAUDRATE) for i, device in enumerate(devices)]
+    fleet = Fleet(boards, GROUPS)
+    assert fleet.connect()
+    yield fleet
+    fleet.disconnect()
+    for device in devices:
+        device.stop()
+
+
+def names(boards):
+    return [board.name for board in boards]
+
+
+def test_boards_run_concurrently(fleet):
+    board = fleet.default
+    start = time.perf_counter()
+    assert board.submit(lambda: board.arduino.send_json_command(NOD)).result(timeout=10)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = fleet.broadcast(lambda board: board.arduino.send_json_command(NOD))
+    wall = time.perf_counter() - start
+
+    assert results == [True, True, True]
+    # Three 0.4s motions side by side take about as long as one, not the sum
+    assert wall < 1.5 * single + 0.1
+    assert wall < 0.7 * 3 * single
+
+
+def test_each_board_keeps_its_own_order(fleet):
+    gates = {board.name: threading.Event() for board in fleet}
+    order = []
+    lock = threading.Lock()
+
+    def step(board, label):
+        gates[board.name].wait(5)
+        with lock:
+            order.append((board.name, label))
+
+    futures = [board.submit(lambda board=board, label=label: step(board, label))
+               for label in ("a", "b") for board in fleet]
+    # Releasing rig3 first runs its work while rig1 and rig2 are still held
+    for name in ("rig3", "rig1", "rig2"):
+        gates[name].set()
+        time.sleep(0.05)
+    for future in futures:
+        future.result(timeout=5)
+    assert order[:2] == [("rig3", "a"), ("rig3", "b")]
+    for name in fleet.names:
+        assert [label for board, label in order if board == name] == ["a", "b"]
+
+
+@pytest.mark.parametrize("target, expected", [
+    (None, ["rig1"]),
+    ("", ["rig1"]),
+    ("all", ["rig1", "rig2", "rig3"]),
+    ("everyone", ["rig1", "rig2", "rig3"]),
+    ("left", ["rig1", "rig2"]),
+    ("Right", ["rig3"]),
+    ("rig2", ["rig2"]),
+    ("Rig 2", ["rig2"]),
+    ("RIG-3", ["rig3"]),
+    ("3", ["rig3"]),
+    ("rig9", []),
+    ("middle", []),
+])
+def test_select(fleet, target, expected):
+    assert names(fleet.select(target)) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("nod twice on rig 2", ("nod twice", "rig 2")),
+    ("spin for the left group", ("spin", "left")),
+    ("shake at all rigs", ("shake", "all rigs")),
+    ("sweep everywhere.", ("sweep", "all")),
+    ("turn right on rig3!", ("turn right", "rig3")),
+    ("nod on the table", ("nod on the table", None)),
+    ("turn right", ("turn right", None)),
+])
+def test_split_target(fleet, text, expected):
+    assert fleet.split_target(text) == expected
+    if expected[1] is not None:
+        assert fleet.select(expected[1])
+
+
+def test_target_names(fleet):
+    assert fleet.target_names() == ["rig1", "rig2", "rig3", "left", "right", "all"]
+
+
+def hold_workers(fleet, release):
+    """Keeps every board's worker busy until release is set, so later work stays queued."""
+    started = threading.Barrier(len(fleet) + 1)
+    def hold(board):
+        started.wait(5)
+        return release.wait(5)
+    busy = fleet.broadcast(hold, wait=False)
+    started.wait(5)
+    return busy
+
+
+def test_clear_pending_only_on_targeted_boards(fleet):
+    release = threading.Event()
+    busy = hold_workers(fleet, release)
+    queued = [fleet.broadcast(lambda board: board.name, wait=False) for _ in range(2)]
+    assert fleet.pending() == 6
+
+    assert fleet.clear_pending(fleet.select("left")) == 4
+    assert [board.pending for board in fleet] == [0, 0, 2]
+
+    release.set()
+    assert [future.result(timeout=5) for future in busy] == [True, True, True]
+    for futures in queued:
+        rig1, rig2, rig3 = futures
+        assert rig1.cancelled() and rig2.cancelled()
+        assert rig3.result(timeout=5) == "rig3"
+
+
+def test_clear_pending_defaults_to_every_board(fleet):
+    release = threading.Event()
+    busy = hold_workers(fleet, release)
+    queued = fleet.broadcast(lambda board: board.name, wait=False)
+    assert fleet.clear_pending() == 3
+    assert fleet.pending() == 0
+    release.set()
+    for future in busy:
+        future.result(timeout=5)
+    assert all(future.cancelled() for future in queued)
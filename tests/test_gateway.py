@@ -0,0 +1,202 @@
+import threading
+import time
+import pytest
+import requests
+import src.config as cfg
+import src.llm as llm
+from benchmark.fake_ollama import FakeOllamaServer
+from src.llm import OllamaGateway, send_to_ollama, stream_from_ollama
+
+RESPONSES = {"nod": {"command": "NOD", "times": 1}, "spin": {"command": "SPIN"}}
+PROMPT = "User Request: nod"
+
+
+@pytest.fixture
+def servers():
+    servers = [FakeOllamaServer(RESPONSES, token_rate=2000, load_time=0, prompt_rate=1e6,
+                                tail_tokens=0).start() for _ in range(3)]
+    yield servers
+    # Each stop waits out a poll of its serve loop, so stop them together
+    stopping = [threading.Thread(target=server.stop) for server in servers]
+    for thread in stopping:
+        thread.start()
+    for thread in stopping:
+        thread.join()
+
+
+@pytest.fixture
+def gateway(servers, monkeypatch):
+    monkeypatch.setattr(cfg, "METRICS_ENABLED", False)
+    monkeypatch.setattr(cfg, "OLLAMA_REQUEST_TIMEOUT", 5)
+    gateway = OllamaGateway(servers[0].api_url, [server.api_url.split("/api/")[0] for server in servers],
+                            "fake", "5m")
+    # send_to_ollama goes through the shared client
+    monkeypatch.setattr(llm, "_client", gateway)
+    yield gateway
+    gateway.close()
+
+
+def generate(gateway, prompt=PROMPT, timeout=5):
+    payload = {"model": "fake", "prompt": prompt, "stream": False}
+    return gateway.post(gateway.api_url, payload, timeout=timeout)
+
+
+def test_fails_over_from_a_server_error(servers, gateway):
+    servers[0].error_status = 500
+    response = generate(gateway)
+    assert response.ok
+    assert response.ollama_backend is gateway.backends[1]
+    assert servers[0].requests == 1
+    assert gateway.backends[0].failures == 1
+
+
+def test_fails_over_from_a_stalled_server(servers, gateway):
+    servers[0].stall = 2.0
+    start = time.perf_counter()
+    response = generate(gateway, timeout=0.3)
+    assert response.ok
+    assert response.ollama_backend is gateway.backends[1]
+    assert time.perf_counter() - start < 1.5
+
+
+def test_raises_when_every_server_fails(servers, gateway):
+    for server in servers:
+        server.error_status = 503
+    with pytest.raises(requests.exceptions.HTTPError):
+        generate(gateway)
+    assert [server.requests for server in servers] == [1, 1, 1]
+
+
+def test_breaker_opens_after_repeated_failures_and_closes_after_cooldown(servers, gateway, monkeypatch):
+    monkeypatch.setattr(cfg, "OLLAMA_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(cfg, "OLLAMA_BREAKER_COOLDOWN", 0.5)
+    failing = gateway.backends[0]
+    servers[0].error_status = 500
+
+    generate(gateway)
+    assert failing in gateway.ranked() # One failure is not enough
+    generate(gateway)
+    assert failing.open_until > time.monotonic()
+    assert failing not in gateway.ranked()
+
+    # While open the server gets no requests
+    generate(gateway)
+    assert servers[0].requests == 2
+
+    servers[0].error_status = None
+    time.sleep(0.6)
+    assert failing in gateway.ranked()
+    # Untried since it failed, so it scores best and gets the next request
+    assert generate(gateway).ollama_backend is failing
+    assert servers[0].requests == 3
+    assert failing.failures == 0 and failing.open_until == 0.0
+
+
+def test_unhealthy_server_is_left_out_until_it_recovers(servers, gateway):
+    servers[1].healthy = False
+    assert gateway.check_availability()
+    assert [backend.healthy for backend in gateway.backends] == [True, False, True]
+    assert gateway.backends[1] not in gateway.ranked()
+
+    servers[0].error_status = 500
+    assert generate(gateway).ollama_backend is gateway.backends[2]
+    assert servers[1].requests == 0
+
+    servers[1].healthy = True
+    gateway.start_health_checks(0.05)
+    deadline = time.monotonic() + 2
+    while not gateway.backends[1].healthy and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert gateway.backends[1].healthy
+    assert gateway.backends[1] in gateway.ranked()
+
+
+def test_no_server_healthy(servers, gateway):
+    for server in servers:
+        server.healthy = False
+    assert not gateway.check_availability()
+
+
+def test_identical_requests_share_one_generation(servers, gateway):
+    for server in servers:
+        server.token_rate = 40 # Slow enough for the requests to overlap
+    callers = 5
+    barrier = threading.Barrier(callers)
+    results = []
+
+    def ask():
+        barrier.wait()
+        results.append(send_to_ollama(PROMPT, gateway.api_url, "fake"))
+
+    threads = [threading.Thread(target=ask) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(server.requests for server in servers) == 1
+    assert len(results) == callers
+    assert len(set(results)) == 1
+    assert '"NOD"' in results[0]
+
+
+def test_identical_streams_share_one_generation(servers, gateway):
+    for server in servers:
+        server.token_rate = 40
+    callers = 3
+    barrier = threading.Barrier(callers)
+    commands, timings = [], []
+
+    def ask():
+        barrier.wait()
+        _, timing = stream_from_ollama(PROMPT, gateway.api_url, "fake", on_command=commands.append)
+        timings.append(timing)
+
+    threads = [threading.Thread(target=ask) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(server.requests for server in servers) == 1
+    # Every caller still dispatches the command
+    assert commands == [{"command": "NOD", "times": 1}] * callers
+    assert sum(bool(timing.get("coalesced")) for timing in timings) == callers - 1
+
+
+def test_different_requests_are_not_coalesced(servers, gateway):
+    for server in servers:
+        server.token_rate = 40
+    threads = [threading.Thread(target=send_to_ollama, args=(f"User Request: {text}", gateway.api_url, "fake"))
+               for text in ("nod", "spin")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(server.requests for server in servers) == 2
+
+
+def test_single_flight_passes_the_error_to_every_caller(gateway):
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        release.wait(2)
+        raise requests.exceptions.ConnectionError("down")
+
+    def call():
+        try:
+            gateway.single_flight("key", fail)
+        except requests.exceptions.ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert len({id(e) for e in errors}) == 1
+    assert gateway._flights == {}
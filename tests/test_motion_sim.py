@@ -0,0 +1,82 @@
+import os
+import re
+import shutil
+import subprocess
+import pytest
+from src.arduino import SEQUENCE_OPCODE
+from src.kinematics import (
+    CENTER_ANGLE, NOD_RANGE, NOD_SETTLE_MS, NOD_STEP_MS, SHAKE_MAX_MS, SHAKE_MIN_MS,
+    SHAKE_MOVES_PER_TIME, SHAKE_RANGE, SHAKE_SETTLE_MS, SPIN_STEP_MS, SWEEP_STEP_DEG, SWEEP_STEP_MS
+)
+
+SIM_DIR = os.path.join(os.path.dirname(__file__), "..", "arduino", "motion_sim")
+MIN_ANGLE, MAX_ANGLE = 0, 180 # config.h
+
+
+@pytest.fixture(scope="module")
+def motion_sim():
+    """Builds the host build of the firmware motion engine; skipped without a C++ toolchain."""
+    if not shutil.which("make") or not (shutil.which("c++") or shutil.which("g++")):
+        pytest.skip("needs make and a C++ compiler")
+    subprocess.run(["make", "-C", SIM_DIR], check=True, capture_output=True)
+    binary = os.path.join(SIM_DIR, "motion_sim")
+
+    def run(*steps, start=None):
+        """Returns the servo writes after the initial one, as (ms, angle), and the finish ms."""
+        args = [binary] + (["-a", str(start)] if start is not None else []) + list(steps)
+        result = subprocess.run(args, check=True, capture_output=True, text=True)
+        writes = [tuple(int(x) for x in line.split(",")) for line in result.stdout.split()]
+        finished = re.search(r"Finished at (\d+) ms, angle (\d+)", result.stderr)
+        return writes[1:], int(finished.group(1)), int(finished.group(2))
+    return run
+
+
+def test_no_steps_finish_at_zero(motion_sim):
+    assert motion_sim() == ([], 0, 90)
+
+def test_nod_timeline(motion_sim):
+    writes, finished, angle = motion_sim("N1", start=45)
+    assert writes == [
+        (0, CENTER_ANGLE),
+        (NOD_SETTLE_MS, CENTER_ANGLE - NOD_RANGE),
+        (NOD_SETTLE_MS + NOD_STEP_MS, CENTER_ANGLE + NOD_RANGE),
+        (NOD_SETTLE_MS + 2 * NOD_STEP_MS, CENTER_ANGLE),
+    ]
+    assert (finished, angle) == (NOD_SETTLE_MS + 2 * NOD_STEP_MS, CENTER_ANGLE)
+
+def test_spin_returns_to_the_start(motion_sim):
+    writes, finished, angle = motion_sim("P2", start=45)
+    assert writes == [(i * SPIN_STEP_MS, (MIN_ANGLE, MAX_ANGLE)[i % 2]) for i in range(4)] + [(4 * SPIN_STEP_MS, 45)]
+    assert (finished, angle) == (2 * 2 * SPIN_STEP_MS, 45)
+
+def test_sweep_steps_through_every_position(motion_sim):
+    writes, finished, angle = motion_sim("W1", start=45)
+    positions = (MAX_ANGLE - MIN_ANGLE) // SWEEP_STEP_DEG + 1
+    assert [a for _, a in writes[:positions]] == list(range(MIN_ANGLE, MAX_ANGLE + 1, SWEEP_STEP_DEG))
+    assert all(later - earlier == SWEEP_STEP_MS for (earlier, _), (later, _) in zip(writes, writes[1:]))
+    assert (finished, angle) == (2 * positions * SWEEP_STEP_MS, 45)
+
+def test_shake_stays_in_range_and_ends_centred(motion_sim):
+    writes, finished, angle = motion_sim("K2", start=45)
+    moves = 2 * SHAKE_MOVES_PER_TIME
+    assert all(abs(a - CENTER_ANGLE) <= SHAKE_RANGE for _, a in writes)
+    assert SHAKE_SETTLE_MS + moves * SHAKE_MIN_MS <= finished <= SHAKE_SETTLE_MS + moves * (SHAKE_MAX_MS - 1)
+    assert angle == CENTER_ANGLE
+
+def test_goto_is_immediate(motion_sim):
+    assert motion_sim("G120", start=45) == ([(0, 120)], 0, 120)
+
+
+@pytest.mark.parametrize("steps", [["N1", "G120"], ["P1"], ["W1"], ["N2", "W1", "G120"], ["G10", "P1", "N1"]])
+def test_matches_the_python_emulator(motion_sim, emulated_arduino, steps):
+    """The emulator mirrors the firmware: the same writes at the same times."""
+    emulator = emulated_arduino.emulator
+    assert emulated_arduino.send_json_command({"command": "GOTO", "angle": 45})
+    start = len(emulator.servo_log)
+    assert emulated_arduino._transact(SEQUENCE_OPCODE, tuple(steps), True)
+    played = emulator.servo_log[start:]
+    played = [(ms - played[0][0], angle) for ms, angle in played]
+
+    writes, _, angle = motion_sim(*steps, start=45)
+    assert played == writes
+    assert emulated_arduino.last_reported_angle == angle
@@ -0,0 +1,138 @@
+import pytest
+from src.arduino import (
+    ALLOWLIST_OPCODE, CONTROL_OPCODES, FRAME_START, MOTION_OPCODES, REPLY_ACK, REPLY_DONE,
+    REPLY_NAK, REPLY_START, SEQUENCE_OPCODE, STREAM_DELTA_ZERO, STREAM_FIRST, STREAM_LAST,
+    STREAM_MAX_CHUNK, STREAM_MAX_DELTA, STREAM_OPCODE, SYNC_OPCODE, command_to_frame,
+    decode_frame, decode_setpoints, encode_frame, encode_setpoints
+)
+from src.commands import MAX_SEQUENCE_STEPS
+from src.emulator import frame_payload
+
+SERIAL_LINE_MAX = 96 # serial_protocol.h, including the terminator
+
+
+# --- Frames ---
+@pytest.mark.parametrize("op, args", [
+    *[(op, ()) for op in CONTROL_OPCODES.values()],
+    *[(op, (45,)) for op, _ in MOTION_OPCODES.values()],
+    (SEQUENCE_OPCODE, ("N2", "W", "G45")),
+    (STREAM_OPCODE, (90, "OPPN", STREAM_FIRST)),
+    (ALLOWLIST_OPCODE, (32, "00ff")),
+    (SYNC_OPCODE, ()),
+])
+def test_every_op_round_trips(op, args):
+    for seq in (1, 0x7F, 0xFF):
+        line = encode_frame(seq, op, args).decode()
+        assert line.startswith(FRAME_START) and line.endswith("\n")
+        assert decode_frame(line) == (seq, op, args)
+
+@pytest.mark.parametrize("kind", [REPLY_ACK, REPLY_DONE, REPLY_NAK])
+def test_replies_round_trip(kind):
+    args = (120,) if kind == REPLY_DONE else ()
+    assert decode_frame(encode_frame(9, kind, args, start=REPLY_START).decode()) == (9, kind, args)
+
+def test_negative_args_decode_as_ints():
+    assert decode_frame(encode_frame(3, "G", (-15,)).decode()).args == (-15,)
+
+def test_rejects_a_bad_checksum():
+    line = encode_frame(5, "G", (45,)).decode().strip()
+    body, checksum = line.rsplit("*", 1)
+    wrong = f"{int(checksum, 16) ^ 0x01:02X}"
+    assert decode_frame(f"{body}*{wrong}") is None
+    # A corrupted body no longer matches its checksum
+    assert decode_frame(line.replace("45", "46")) is None
+
+@pytest.mark.parametrize("line", [
+    "", "hello", "!05G45", "05G45*00", "#05G45*4A", "!*00", "!05*00", "!ZZG45*00", "!05G45*ZZ",
+])
+def test_rejects_bad_framing(line):
+    assert decode_frame(line) is None
+
+
+# --- Commands ---
+def test_motion_commands_map_to_their_opcodes():
+    assert command_to_frame({"command": "GOTO", "angle": 45}) == (MOTION_OPCODES["GOTO"][0], (45,))
+    assert command_to_frame({"command": "NOD"}) == (MOTION_OPCODES["NOD"][0], ())
+    with pytest.raises(ValueError):
+        command_to_frame({"command": "GOTO"})
+    with pytest.raises(ValueError):
+        command_to_frame({"command": "DANCE"})
+
+def test_sequence_steps_are_encoded_in_order():
+    op, args = command_to_frame({"command": "SEQUENCE", "steps": [
+        {"command": "NOD", "times": 2}, {"command": "SWEEP"}, {"command": "GOTO", "angle": 45},
+    ]})
+    assert op == SEQUENCE_OPCODE
+    assert args == (f"{MOTION_OPCODES['NOD'][0]}2", MOTION_OPCODES["SWEEP"][0], f"{MOTION_OPCODES['GOTO'][0]}45")
+    assert decode_frame(encode_frame(1, op, args).decode()).args == args
+
+def test_sequences_cannot_be_nested():
+    inner = {"command": "SEQUENCE", "steps": [{"command": "NOD"}]}
+    with pytest.raises(ValueError, match="nested"):
+        command_to_frame({"command": "SEQUENCE", "steps": [inner]})
+
+@pytest.mark.parametrize("count", [0, MAX_SEQUENCE_STEPS + 1])
+def test_sequence_length_is_limited(count):
+    with pytest.raises(ValueError):
+        command_to_frame({"command": "SEQUENCE", "steps": [{"command": "NOD"}] * count})
+
+def test_longest_sequence_fits_a_line():
+    steps = [{"command": "GOTO", "angle": 180}] * MAX_SEQUENCE_STEPS
+    assert len(encode_frame(0xFF, *command_to_frame({"command": "SEQUENCE", "steps": steps}))) <= SERIAL_LINE_MAX
+
+
+# --- Setpoint streams ---
+def stream_payload(setpoints, flags):
+    return frame_payload(encode_frame(1, STREAM_OPCODE, encode_setpoints(setpoints, flags)).decode())
+
+def test_setpoints_round_trip():
+    setpoints = [90, 90, 91, 93, 93 + STREAM_MAX_DELTA, 93]
+    assert decode_setpoints(stream_payload(setpoints, STREAM_FIRST | STREAM_LAST)) == \
+        (setpoints, STREAM_FIRST | STREAM_LAST)
+
+def test_setpoint_deltas_are_limited():
+    with pytest.raises(ValueError):
+        encode_setpoints([0, STREAM_MAX_DELTA + 1], 0)
+    too_far = chr(ord(STREAM_DELTA_ZERO) + STREAM_MAX_DELTA + 1)
+    assert decode_setpoints(f"90,{too_far},0") is None
+
+@pytest.mark.parametrize("payload", ["90,OO", "x,OO,0", "90,OO,x", "90"])
+def test_rejects_malformed_setpoints(payload):
+    assert decode_setpoints(payload) is None
+
+def test_largest_stream_frame_fits_a_line():
+    # The widest frame: a 3-digit first setpoint, the highest seq and every flag
+    setpoints = [180] * STREAM_MAX_CHUNK
+    frame = encode_frame(0xFF, STREAM_OPCODE, encode_setpoints(setpoints, STREAM_FIRST | STREAM_LAST))
+    assert len(frame) <= SERIAL_LINE_MAX
+
+
+# --- Sequence numbers ---
+def test_seq_wraps_past_ff_and_skips_00(emulated_arduino):
+    emulated_arduino._seq = 0xFE
+    assert [emulated_arduino._next_seq() for _ in range(3)] == [0xFF, 1, 2]
+
+def test_frames_keep_running_across_the_wrap(emulated_arduino):
+    emulated_arduino._seq = 0xFE
+    for angle in (30, 60, 90):
+        assert emulated_arduino.send_json_command({"command": "GOTO", "angle": angle})
+        assert emulated_arduino.emulator.current_angle == angle
+
+def test_repeated_seq_is_acked_but_not_run(emulated_arduino):
+    emulator = emulated_arduino.emulator
+    assert emulated_arduino.send_json_command({"command": "GOTO", "angle": 40})
+    emulated_arduino._seq -= 1 # The same seq again, as after a lost ACK
+    assert emulated_arduino.send_json_command({"command": "GOTO", "angle": 140}, wait_done=False)
+    assert emulator.current_angle == 40
+
+def test_sync_frame_lets_a_new_connection_reuse_seqs(emulated_arduino):
+    emulator = emulated_arduino.emulator
+    assert emulated_arduino.send_json_command({"command": "GOTO", "angle": 40})
+    last_seq = emulator.last_frame_seq
+
+    # A reconnect to a board that did not reset: numbering restarts, and the
+    # first frame reuses the seq the board saw last
+    assert emulated_arduino._sync_seq()
+    emulated_arduino._seq = last_seq - 1
+    assert emulated_arduino.send_json_command({"command": "GOTO", "angle": 140})
+    assert emulator.current_angle == 140
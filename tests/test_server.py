@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("flask")
+
+import main
+import src.config as cfg
+from src.server import ServoServer
+
+CARD = "0496c72b"
+SECRET = "open sesame"
+
+
+@pytest.fixture
+def server(mock_config, monkeypatch):
+    """A ServoServer on an emulated board, driven through Flask's test client."""
+    monkeypatch.setattr(cfg, "SERVER_PORT", 0)
+    monkeypatch.setattr(cfg, "SERVER_SECRET", SECRET)
+    monkeypatch.setattr(cfg, "SERVER_LOGIN_SCAN_TIMEOUT", 2)
+    monkeypatch.setattr(cfg, "SERVER_LOGIN_MAX_FAILURES", 3)
+    monkeypatch.setattr(cfg, "AUTHORIZED_UIDS", {CARD: "Admin"})
+    monkeypatch.setattr(cfg, "BOARDS", {})
+    app = main.LlmServoControl()
+    assert app.fleet.connect()
+    server = ServoServer(app).start()
+    yield server
+    server.stop()
+    server.http.server_close()
+    app.fleet.disconnect()
+
+
+def login(client, address="10.0.0.1", **body):
+    return client.post("/api/login", json=body, environ_base={"REMOTE_ADDR": address})
+
+
+def test_login_needs_the_card_scanned(server):
+    client = server.flask.test_client()
+    # The emulator presents MOCK_RFID_UID once the board prompts for a card
+    response = login(client)
+    assert response.status_code == 200
+    assert response.get_json()["user"] == "Admin"
+    emulator = server.app.arduino.emulator
+    assert emulator.servo_angle == cfg.MOTOR_INITIAL_ANGLE
+
+
+def test_unknown_card_scan_is_refused(server):
+    server.app.arduino.emulator.auth_card = "deadbeef"
+    client = server.flask.test_client()
+    assert login(client).status_code == 401
+    assert server.sessions == {}
+
+
+def test_known_uid_without_a_scan_or_secret_is_refused(server):
+    server.app.arduino.emulator.auth_card = None # Nobody at the reader
+    client = server.flask.test_client()
+    assert login(client, uid=CARD).status_code == 401
+
+
+def test_secret_login(server):
+    client = server.flask.test_client()
+    assert login(client, uid=CARD, secret=SECRET).get_json()["user"] == "Admin"
+    assert login(client, uid=CARD, secret="guess").status_code == 401
+    assert login(client, uid="deadbeef", secret=SECRET).status_code == 401
+
+
+def test_secret_login_is_off_without_a_server_secret(server, monkeypatch):
+    monkeypatch.setattr(cfg, "SERVER_SECRET", None)
+    client = server.flask.test_client()
+    assert login(client, uid=CARD, secret="").status_code == 401
+
+
+def test_failed_logins_are_rate_limited_per_address(server):
+    client = server.flask.test_client()
+    for _ in range(cfg.SERVER_LOGIN_MAX_FAILURES):
+        assert login(client, uid=CARD, secret="guess").status_code == 401
+    response = login(client, uid=CARD, secret=SECRET)
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= cfg.SERVER_LOGIN_LOCKOUT_SECONDS
+    # Another address is not locked out
+    assert login(client, "10.0.0.2", uid=CARD, secret=SECRET).status_code == 200
+
+
+def test_lockout_ends_after_the_window(server, monkeypatch):
+    client = server.flask.test_client()
+    for _ in range(cfg.SERVER_LOGIN_MAX_FAILURES):
+        login(client, uid=CARD, secret="guess")
+    monkeypatch.setattr(cfg, "SERVER_LOGIN_LOCKOUT_SECONDS", 0)
+    assert login(client, uid=CARD, secret=SECRET).status_code == 200
+
+
+def test_query_token_only_for_events(server):
+    client = server.flask.test_client()
+    token = login(client, uid=CARD, secret=SECRET).get_json()["token"]
+    header = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/status", headers=header).status_code == 200
+    assert client.get(f"/api/status?token={token}").status_code == 401
+    assert client.post(f"/api/reset?token={token}").status_code == 401
+
+    response = client.get(f"/api/events?token={token}", buffered=False)
+    assert response.status_code == 200
+    assert next(response.response).startswith(b"event: status")
+    response.close()
@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import src.config as cfg
+from benchmark.trajectory import DEFAULT_COMMANDS, play
+from src.arduino import STREAM_BUFFER_SIZE, STREAM_PERIOD_MS, ArduinoController
+from src.trajectory import FINE_MS, PROFILES, TrajectoryPlanner
+
+DT = FINE_MS / 1000
+# Longer than the board's buffer holds, so frames have to be paced
+PACED_COMMANDS = [{"command": "SWEEP", "repetitions": 1}]
+
+
+def planner(profile):
+    return TrajectoryPlanner(cfg.MOTION_MAX_VELOCITY, cfg.MOTION_MAX_ACCELERATION, cfg.MOTION_MAX_JERK,
+                             profile, cfg.MOTOR_MIN_ANGLE, cfg.MOTOR_MAX_ANGLE, seed=0)
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+@pytest.mark.parametrize("distance", [1, 5, 30, 90, 180])
+@pytest.mark.parametrize("max_velocity", [300, 50])
+def test_velocity_profile_covers_the_distance_within_limits(profile, distance, max_velocity):
+    velocity = planner(profile).velocity_profile(distance, max_velocity)
+    assert velocity.sum() * DT == pytest.approx(distance, rel=1e-9)
+    assert velocity.min() >= 0
+    assert velocity.max() <= max_velocity * (1 + 1e-6)
+    # Starts and ends at rest
+    acceleration = np.diff(np.concatenate(([0.0], velocity, [0.0]))) / DT
+    assert np.abs(acceleration).max() <= cfg.MOTION_MAX_ACCELERATION * (1 + 1e-6)
+
+
+def test_velocity_profile_of_no_move_is_empty():
+    assert len(planner("scurve").velocity_profile(0, 300)) == 0
+
+
+def test_scurve_takes_longer_than_trapezoid():
+    trapezoid = planner("trapezoid").velocity_profile(90, 300)
+    scurve = planner("scurve").velocity_profile(90, 300)
+    assert len(scurve) > len(trapezoid)
+    # The smoothing ramps acceleration in instead of switching it on
+    assert np.diff(scurve)[0] < np.diff(trapezoid)[0] * 0.1
+
+
+def check_played(results, tolerance_ms):
+    for result in results:
+        assert result["sent"], result["command"]
+        assert "max_angle_error" in result, f"{result['command']}: setpoints missing"
+        assert result["max_angle_error"] == 0, result
+        assert result["max_late_ms"] < tolerance_ms, result
+        assert result["underruns"] == 0, result
+        assert result["reported_end"] == result["planned_end"], result
+
+
+def play_on_emulator(profile, commands, monkeypatch):
+    monkeypatch.setattr(cfg, "MOTION_PROFILE", profile)
+    arduino = ArduinoController(cfg.SERIAL_PORT, cfg.SERIAL_BAUDRATE)
+    assert arduino.connect()
+    try:
+        return play(arduino, TrajectoryPlanner.from_config(), commands, cfg.MOTOR_INITIAL_ANGLE)
+    finally:
+        arduino.disconnect()
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_every_command_plays_as_planned(mock_config, monkeypatch, profile):
+    # On the instant clock the board plays each setpoint on its slot
+    results = play_on_emulator(profile, DEFAULT_COMMANDS, monkeypatch)
+    assert [result["command"] for result in results] == [c["command"] for c in DEFAULT_COMMANDS]
+    check_played(results, STREAM_PERIOD_MS)
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_paced_playback_in_real_time(mock_config, monkeypatch, profile):
+    # Real time, like hardware: the host's frame pacing has to keep the buffer fed
+    monkeypatch.setattr(cfg, "MOCK_TIME_SCALE", 1.0)
+    results = play_on_emulator(profile, PACED_COMMANDS, monkeypatch)
+    assert all(result["setpoints"] > STREAM_BUFFER_SIZE for result in results)
+    check_played(results, STREAM_PERIOD_MS)
@@ -0,0 +1,96 @@
+import json
+import sys
+import pytest
+import src.config as cfg
+import src.llm as llm
+from benchmark import tune
+from benchmark.fake_ollama import FakeOllamaServer
+
+# Rates are tokens per second. "sloppy" is the fastest but always wrong.
+MODELS = {
+    "fast": {"token_rate": 2000.0, "accuracy": 1.0},
+    "slow": {"token_rate": 150.0, "accuracy": 1.0},
+    "sloppy": {"token_rate": 5000.0, "accuracy": 0.0},
+}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    with open(tune.DEFAULT_CORPUS) as f:
+        items = json.load(f)[:8]
+    path = tmp_path / "intents.json"
+    path.write_text(json.dumps(items))
+    return path
+
+
+@pytest.fixture
+def ollama(corpus, monkeypatch):
+    items = json.loads(corpus.read_text())
+    server = FakeOllamaServer({item["input"]: item["response"] for item in items}, load_time=0,
+                              prompt_rate=1e6, tail_tokens=0, models=MODELS).start()
+    monkeypatch.setattr(cfg, "METRICS_ENABLED", False)
+    monkeypatch.setattr(cfg, "OLLAMA_API_URL", server.api_url)
+    # The tuner rewrites these and closes the shared client
+    monkeypatch.setattr(cfg, "OLLAMA_BACKENDS", cfg.OLLAMA_BACKENDS)
+    monkeypatch.setattr(cfg, "OLLAMA_OPTIONS", cfg.OLLAMA_OPTIONS)
+    monkeypatch.setattr(llm, "_client", None)
+    yield server
+    server.stop()
+
+
+def run_tuner(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["tune.py", *args])
+    tune.main_cli()
+
+
+def test_sweep_recommends_the_fastest_accurate_candidate(ollama, corpus, tmp_path, monkeypatch, capsys):
+    out, config_out = tmp_path / "tuning-results.json", tmp_path / "tuned.py"
+    run_tuner(monkeypatch, "--corpus", str(corpus), "--models", "fast,slow,sloppy",
+              "--num-ctx", "default,64", "--num-predict", "default,4",
+              "--out", str(out), "--config-out", str(config_out))
+
+    report = json.loads(out.read_text())
+    results = report["results"]
+    assert len(results) == 3 * 2 * 2
+    assert {(r["model"], json.dumps(r["options"], sort_keys=True)) for r in results} == {
+        (model, json.dumps(options, sort_keys=True))
+        for model in MODELS
+        for options in ({}, {"num_ctx": 64}, {"num_predict": 4}, {"num_ctx": 64, "num_predict": 4})
+    }
+    by_candidate = {(r["model"], tuple(sorted(r["options"].items()))): r for r in results}
+    assert by_candidate[("fast", ())]["accuracy"] == 1.0
+    assert by_candidate[("slow", ())]["accuracy"] == 1.0
+    assert by_candidate[("sloppy", ())]["accuracy"] == 0.0
+    # A window too small for the prompt loses the instructions; 4 tokens cut the JSON off
+    assert by_candidate[("fast", (("num_ctx", 64),))]["accuracy"] == 0.0
+    assert by_candidate[("fast", (("num_predict", 4),))]["accuracy"] == 0.0
+    assert by_candidate[("fast", ())]["p95_ms"] < by_candidate[("slow", ())]["p95_ms"]
+    assert all(r["errors"] == 0 for r in results)
+
+    best = report["recommended"]
+    assert (best["model"], best["options"]) == ("fast", {})
+    assert report["config"] == 'OLLAMA_MODEL = "fast"\nOLLAMA_OPTIONS = {}\n'
+    assert config_out.read_text() == report["config"]
+    assert report["meta"]["corpus"] == "intents.json"
+    assert report["meta"]["fake"] is False
+    assert "Recommended (100% accurate" in capsys.readouterr().out
+
+
+def test_tolerance_trades_accuracy_for_speed():
+    results = [
+        {"model": "a", "options": {}, "accuracy": 1.0, "p95_ms": 300.0},
+        {"model": "b", "options": {}, "accuracy": 0.97, "p95_ms": 100.0},
+        {"model": "c", "options": {}, "accuracy": 0.5, "p95_ms": 10.0},
+    ]
+    assert tune.recommend(results, 0.02)["model"] == "a"
+    assert tune.recommend(results, 0.05)["model"] == "b"
+
+
+def test_candidates_cover_every_combination():
+    args = tune.argparse.Namespace(models="m1,m2", num_ctx="default,2048", num_predict="default",
+                                   num_thread="4", temperature="default,0.1")
+    assert list(tune.candidates(args)) == [
+        (model, dict(options, num_thread=4))
+        for model in ("m1", "m2")
+        for options in ({}, {"temperature": 0.1}, {"num_ctx": 2048}, {"num_ctx": 2048, "temperature": 0.1})
+    ]
@@ -0,0 +1,137 @@
+import math
+import queue
+import struct
+import threading
+import time
+import wave
+import pytest
+import src.config as cfg
+
+pytest.importorskip("speech_recognition")
+from src.voice import CAPTURE_SAMPLE_RATE, ContinuousListener, RecognizerBackend, VoiceSession, sr
+
+
+def write_wav(path, frequency, seconds=0.3):
+    """A 16-bit mono tone (silence for frequency 0) at the capture rate."""
+    frames = int(CAPTURE_SAMPLE_RATE * seconds)
+    samples = (int(8000 * math.sin(2 * math.pi * frequency * i / CAPTURE_SAMPLE_RATE)) for i in range(frames))
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(CAPTURE_SAMPLE_RATE)
+        f.writeframes(b"".join(struct.pack("<h", s) for s in samples))
+    return str(path)
+
+def load_audio(path):
+    with sr.AudioFile(path) as source:
+        return sr.Recognizer().record(source)
+
+
+class StubBackend(RecognizerBackend):
+    """
+    Recognizes the utterances it was given transcripts for, by their audio.
+    With a gate, each recognition waits for it, to hold recognition back.
+    """
+    name = "stub"
+
+    def __init__(self, transcripts, gate=None):
+        self.transcripts = {load_audio(path).get_raw_data(): text for path, text in transcripts.items()}
+        self.gate = gate
+        self.busy = threading.Event()
+
+    def recognize(self, recognizer, audio_data):
+        self.busy.set()
+        if self.gate:
+            self.gate.wait(5)
+        return self.transcripts.get(audio_data.get_raw_data())
+
+
+class ScriptedSession(VoiceSession):
+    """A session whose "microphone" yields the given WAV files, then silence."""
+    def __init__(self, backend, paths, wait_for_busy=False):
+        super().__init__(backend)
+        self.utterances = queue.Queue()
+        for path in paths:
+            self.utterances.put(load_audio(path))
+        self.captured = 0
+        self.wait_for_busy = wait_for_busy
+
+    def open(self):
+        pass
+
+    def capture(self, timeout=None):
+        # After the first utterance, wait until it is being recognized, so
+        # the rest queue up behind it
+        if self.captured == 1 and self.wait_for_busy:
+            self.backend.busy.wait(5)
+        try:
+            audio_data = self.utterances.get_nowait()
+        except queue.Empty:
+            time.sleep(0.01)
+            return None
+        self.captured += 1
+        return audio_data
+
+
+@pytest.fixture
+def clips(tmp_path):
+    return {name: write_wav(tmp_path / f"{name}.wav", frequency)
+            for name, frequency in (("nod", 440), ("shake", 550), ("sweep", 660), ("spin", 770), ("silence", 0))}
+
+def listen(session, expected):
+    """Runs a ContinuousListener until `expected` texts were heard (or a timeout)."""
+    heard = []
+    done = threading.Event()
+    def on_text(text, captured_at):
+        heard.append(text)
+        if len(heard) == expected:
+            done.set()
+    listener = ContinuousListener(session, on_text)
+    listener.start()
+    try:
+        done.wait(5)
+        time.sleep(0.1) # Nothing more should arrive
+    finally:
+        listener.stop()
+    return heard, listener
+
+
+def test_transcribes_a_wav_file(clips):
+    session = VoiceSession(StubBackend({clips["nod"]: "nod twice"}))
+    text, elapsed = session.transcribe_file(clips["nod"])
+    assert text == "nod twice" and elapsed >= 0
+    assert session.transcribe_file(clips["silence"])[0] is None
+    assert session.stats.unrecognized == 1 and len(session.stats.latencies) == 2
+
+def test_listener_recognizes_utterances_in_order(clips, monkeypatch):
+    monkeypatch.setattr(cfg, "VOICE_AUDIO_QUEUE_SIZE", 3)
+    names = ["nod", "shake", "sweep"]
+    backend = StubBackend({clips[name]: name for name in names})
+    heard, listener = listen(ScriptedSession(backend, [clips[name] for name in names]), 3)
+    assert heard == names and listener.dropped == 0
+
+def test_listener_drops_the_oldest_utterance_when_behind(clips, monkeypatch):
+    monkeypatch.setattr(cfg, "VOICE_AUDIO_QUEUE_SIZE", 2)
+    names = ["nod", "shake", "sweep", "spin"]
+    gate = threading.Event()
+    backend = StubBackend({clips[name]: name for name in names}, gate)
+    session = ScriptedSession(backend, [clips[name] for name in names], wait_for_busy=True)
+
+    # "nod" is being recognized; "shake" and "sweep" fill the queue and
+    # "spin" pushes out "shake"
+    threading.Timer(0.3, gate.set).start()
+    heard, listener = listen(session, 3)
+    assert heard == ["nod", "sweep", "spin"]
+    assert listener.dropped == 1
+
+def test_listener_skips_stale_utterances(clips, monkeypatch):
+    monkeypatch.setattr(cfg, "VOICE_MAX_UTTERANCE_AGE", 0.1)
+    gate = threading.Event()
+    backend = StubBackend({clips["nod"]: "nod", clips["shake"]: "shake"}, gate)
+    session = ScriptedSession(backend, [clips["nod"], clips["shake"]], wait_for_busy=True)
+
+    # "shake" waits longer than the age limit behind "nod"
+    threading.Timer(0.4, gate.set).start()
+    heard, listener = listen(session, 1)
+    assert heard == ["nod"]
+    assert listener.dropped == 1